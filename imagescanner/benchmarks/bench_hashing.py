@@ -0,0 +1,118 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Compare checksumming throughput of imagescanner.hashing against the
+4 KiB-at-a-time sha256() that tasks.py used previously.
+
+Run from the directory containing setup.py:
+
+    python3 benchmarks/bench_hashing.py --size 1024
+
+"""
+import argparse
+import hashlib
+import io
+import os
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from imagescanner.hashing import copy_and_hash, sha256_file  # noqa: E402
+
+
+def legacy_sha256(path):
+    """The checksum function formerly in tasks.py."""
+    h = hashlib.new('sha256')
+    with open(path, 'rb') as fd:
+        for chunk in iter((lambda: fd.read(4096)), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def legacy_download(src, path):
+    """Write 4 KiB chunks to disk, then checksum the file from disk."""
+    with open(path, 'wb') as fd:
+        for chunk in iter((lambda: src.read(4096)), b''):
+            fd.write(chunk)
+    return legacy_sha256(path)
+
+
+def inflight_download(src, path):
+    with open(path, 'wb') as fd:
+        return copy_and_hash(src, fd)
+
+
+def timed(label, size, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    print("{:<32} {:8.1f} MB/s  ({:.2f}s)".format(
+        label, size / elapsed / 1e6, elapsed))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=512,
+                        help="size of the test image in MiB")
+    args = parser.parse_args()
+    size = args.size * 1024 * 1024
+
+    with TemporaryDirectory() as workspace:
+        image = os.path.join(workspace, 'bench.img')
+        with open(image, 'wb') as fd:
+            for _ in range(args.size):
+                fd.write(os.urandom(1024 * 1024))
+
+        print("Checksumming a {} MiB file already on disk:".format(args.size))
+        expected = timed("legacy sha256()", size, legacy_sha256, image)
+        assert timed("sha256_file()", size, sha256_file, image) == expected
+
+        print("Downloading (from memory) and checksumming:")
+        with open(image, 'rb') as fd:
+            data = fd.read()
+        copy = os.path.join(workspace, 'copy.img')
+        assert timed("write, then legacy sha256()", size,
+                     legacy_download, io.BytesIO(data), copy) == expected
+        assert timed("copy_and_hash()", size,
+                     inflight_download, io.BytesIO(data), copy) == expected
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Compare delivering a burst of Slack notifications one post at a time, as
+slack_notify used to, with delivering them through notifications.Dispatcher.
+
+The webhook is a local stand-in that takes --latency seconds to answer, and
+answers one post in --throttle with 429 and a Retry-After of a second, as
+Slack does when posted to too fast. Posts answered 429 are lost to the old
+code; the dispatcher retries them.
+
+Run from the directory containing setup.py:
+
+    python3 benchmarks/bench_notify.py --notifications 200 --latency 0.05
+
+"""
+import argparse
+import itertools
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from imagescanner import notifications  # noqa: E402
+from imagescanner.sessions import get_session  # noqa: E402
+
+
+class Webhook(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            throttled = next(self.server.count) % self.server.throttle == 0
+            if not throttled:
+                self.server.delivered += 1
+        self.send_response(429 if throttled else 200)
+        if throttled:
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+
+class WebhookServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def legacy(url, payloads):
+    session = get_session(url)
+    for payload in payloads:
+        session.post(url, json=payload)
+
+
+def dispatched(url, payloads):
+    dispatcher = notifications.Dispatcher(
+        concurrency=16, retries=5, backoff=0.1, max_backoff=5, rates={})
+    futures = [
+        dispatcher.submit('127.0.0.1', lambda p=p: notifications.post(url, p),
+                          {})
+        for p in payloads]
+    assert all(future.result() for future in futures)
+
+
+def timed(label, server, count, fn, *args):
+    server.delivered = 0
+    server.count = itertools.count(1)
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    print("{:<24} {:7.1f} notifications/s  {:4} of {} delivered  "
+          "({:.2f}s)".format(label, count / elapsed, server.delivered,
+                             count, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--notifications', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="seconds the webhook takes to answer")
+    parser.add_argument('--throttle', type=int, default=50,
+                        help="answer one post in this many with 429")
+    args = parser.parse_args()
+
+    server = WebhookServer(('127.0.0.1', 0), Webhook)
+    server.latency = args.latency
+    server.throttle = args.throttle
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/services/token'.format(server.server_port)
+    payloads = [{'channel': '#scans', 'text': str(n)}
+                for n in range(args.notifications)]
+
+    print("Delivering {} notifications:".format(args.notifications))
+    timed("one post at a time", server, args.notifications,
+          legacy, url, payloads)
+    timed("Dispatcher", server, args.notifications,
+          dispatched, url, payloads)
+
+
+if __name__ == '__main__':
+    main()
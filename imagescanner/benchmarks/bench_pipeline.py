@@ -0,0 +1,466 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+#
+"""Measure request_scan end to end, against local stand-ins for the places it
+retrieves images from.
+
+Synthetic raw, ISO and gzipped images of each of --sizes MiB are generated in
+a scratch directory, and scanned, --images of a kind and size at a time, from
+each of three sources:
+
+    http    a local HTTP server, which honours Range requests, one
+            request_scan for each image;
+    bucket  the same server, answering an S3-style XML listing for the
+            directory of the images, one request_scan for all of them;
+    git     a local bare repository holding them, one request_scan for all.
+
+The scanner is a stand-in chosen by --scanner: 'read' reads the whole image, as
+clamscan would, and 'noop' exits at once, so the figures measure the rest of
+the pipeline; both report the image clean. --scanner-command gives a command of
+your own instead; the image path is appended to it. Notifications are dropped,
+and progress goes to an in-process fake Redis unless --redis gives the URL of a
+real one. Each case scans with a signature version of its own, so that none of
+them finds the results of another in the result cache.
+
+Each case runs in a process of its own, forked for it, so that its peak RSS
+is its own; that of the scanner and git processes, which begin as copies of
+it, is not counted.
+For each case the benchmark reports the seconds spent in each stage of
+request_scan and the MB/s of the bytes retrieved through it, the elapsed time
+of the case, the time from the start of a job to the result of each of its
+images, and the peak RSS. --json writes the same, with the commit checked out
+and the arguments, for comparison across commits.
+
+Run from the directory containing setup.py:
+
+    python3 benchmarks/bench_pipeline.py --sizes 16 128 --json results.json
+
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import shlex
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from tempfile import TemporaryDirectory
+from pathlib import Path
+from xml.sax.saxutils import escape
+import fakeredis
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from imagescanner import (  # noqa: E402
+    config, progress, redisconn, resultcache, sessions, tasks,
+    )
+
+MiB = 1024 * 1024
+KINDS = {'raw': '.img', 'iso': '.iso', 'gzip': '.img.gz'}
+SOURCES = ['http', 'bucket', 'git']
+
+# Stand-in scanners, each given the path of the image.
+SCANNERS = {
+    'noop': ['echo', 'Scan verdict: clean'],
+    'read': [sys.executable, '-c', '''if True:
+        import sys
+        with open(sys.argv[1], 'rb') as fd:
+            while fd.read(1024 * 1024):
+                pass
+        print("scanned", sys.argv[1])
+        print("Scan verdict: clean")
+    '''],
+    }
+
+
+def _blocks(seed, size):
+    """Generate size bytes of synthetic image in blocks of a MiB, each half
+    random, so that it compresses about as well as a disk image, and
+    beginning with seed, so that no two images have the same checksum.
+
+    """
+    random = os.urandom(MiB // 2)
+    for offset in range(0, size, MiB):
+        block = random + bytes(MiB // 2)
+        if offset == 0:
+            block = seed + block[len(seed):]
+        yield block[:size - offset]
+
+
+def make_image(path, kind, size):
+    """Write a synthetic image of kind, of size bytes before compression, at
+    path.
+
+    """
+    seed = str(path).encode()
+    if kind == 'iso':
+        # An ISO 9660 primary volume descriptor in the 17th 2 KiB sector,
+        # after the system area.
+        seed = seed.ljust(16 * 2048, b'\0') + b'\x01CD001\x01'
+    if kind == 'gzip':
+        with open(str(path), 'wb') as fd:
+            compress = subprocess.Popen(
+                ['gzip', '-c', '-1'], stdin=subprocess.PIPE, stdout=fd)
+            for block in _blocks(seed, size):
+                compress.stdin.write(block)
+            compress.stdin.close()
+            if compress.wait() != 0:
+                raise RuntimeError("gzip failed for {}".format(path))
+        return
+    with open(str(path), 'wb') as fd:
+        for block in _blocks(seed, size):
+            fd.write(block)
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serve the files beneath the server's root, honouring Range requests,
+    and for a path ending in /, an S3-style listing of the directory.
+
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _path(self):
+        return self.server.root / self.path.split('?')[0].lstrip('/')
+
+    def do_HEAD(self):
+        path = self._path()
+        if not path.is_file():
+            return self.send_error(404)
+        self.send_response(200)
+        self.send_header('Content-Length', str(path.stat().st_size))
+        self.send_header('ETag', '"{}"'.format(path.stat().st_mtime_ns))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+    def do_GET(self):
+        path = self._path()
+        if self.path.split('?')[0].endswith('/') and path.is_dir():
+            return self._list(path)
+        if not path.is_file():
+            return self.send_error(404)
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, end, size))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        with open(str(path), 'rb') as fd:
+            fd.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                block = fd.read(min(remaining, MiB))
+                self.wfile.write(block)
+                remaining -= len(block)
+
+    def _list(self, directory):
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns='
+            '"http://s3.amazonaws.com/doc/2006-03-01/">'
+            '<IsTruncated>false</IsTruncated>{}</ListBucketResult>'.format(
+                ''.join(
+                    '<Contents><Key>{}</Key><Size>{}</Size></Contents>'
+                    .format(escape(path.name), path.stat().st_size)
+                    for path in sorted(directory.iterdir())))).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ImageServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_repo(directory, repo):
+    """Commit the files in directory to a new bare repository at repo."""
+    git = ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost']
+    work = str(repo) + '.work'
+    subprocess.run(git + ['init', '-q', work], check=True)
+    for path in directory.iterdir():
+        os.link(str(path), os.path.join(work, path.name))
+    subprocess.run(git + ['-C', work, 'add', '.'], check=True)
+    subprocess.run(git + ['-C', work, 'commit', '-q', '-m', 'images'],
+                   check=True)
+    subprocess.run(git + ['clone', '-q', '--bare', work, str(repo)],
+                   check=True)
+    subprocess.run(['rm', '-rf', work], check=True)
+
+
+def configure(scratch, scanner, concurrency):
+    """Point the configuration at scratch, and at the stand-in scanner, and
+    drop notifications.
+
+    """
+    config.LOGS_PATH = scratch / 'logs'
+    config.LOGS_PATH.mkdir()
+    config.RESULT_CACHE_PATH = config.LOGS_PATH / 'cache'
+    config.RESULT_STORE_PATH = config.LOGS_PATH / 'results.sqlite3'
+    config.DOWNLOAD_PARTIALS_PATH = scratch / 'partials'
+    config.GIT_MIRRORS_PATH = scratch / 'mirrors'
+    config.FILE_INDEX_PATH = scratch / 'files.sqlite3'
+    config.MOUNTPOINT_ROOT = scratch / 'mnt'
+    config.LEASES_PATH = scratch / 'leases'
+    config.SCANNER_COMMAND = scanner
+    config.SCAN_CONCURRENCY = concurrency
+    config.NBD_DEVICES = ['/dev/nbd{}'.format(n) for n in range(concurrency)]
+    tasks.slack_notify.delay = lambda **kwargs: None
+    tasks.jenkins_notify.delay = lambda *args, **kwargs: None
+
+
+def requests_for(case, base_url, scratch):
+    """Return the (source, path) of each request_scan for case."""
+    source, kind, size = case
+    name = '{}-{}M'.format(kind, size)
+    if source == 'http':
+        return [('{}/{}/{}'.format(base_url, name, path.name), None)
+                for path in sorted((scratch / 'www' / name).iterdir())]
+    if source == 'bucket':
+        return [('{}/{}/'.format(base_url, name), None)]
+    return [('file://{}'.format(scratch / 'git' / (name + '.git')), None)]
+
+
+def run_case(case, requests, redis_url, results):
+    """Scan requests for case, in a process forked for it, and send a dict
+    of the figures for it down the connection results.
+
+    """
+    try:
+        redisconn._pid = os.getpid()
+        redisconn._client = (
+            redis.Redis.from_url(redis_url, decode_responses=True)
+            if redis_url else fakeredis.FakeRedis(decode_responses=True))
+        sessions._sessions = {}
+        sigversion = 'bench-{}-{}-{}'.format(os.getpid(), *case[1:])
+        resultcache.signature_version = lambda: sigversion
+
+        job_ids = []
+        start = time.monotonic()
+        for source, path in requests:
+            job = tasks.request_scan.apply(args=(source, path, ['#bench']))
+            job.get()
+            job_ids.append(job.id)
+        elapsed = time.monotonic() - start
+        results.send(figures(case, job_ids, elapsed))
+    except BaseException:
+        results.send({'case': case, 'error': traceback.format_exc()})
+
+
+def figures(case, job_ids, elapsed):
+    """Return the figures for case from the progress of its jobs."""
+    stages = {}
+    latencies = []
+    images = 0
+    retrieved = 0
+    for job_id in job_ids:
+        job = progress.get_job(job_id)
+        if job['state'] != 'done':
+            raise RuntimeError("Job {} {}".format(job_id, job['state']))
+        started = job['events'][0]['time']
+        for event in job['events']:
+            if event['stage'] == 'retrieved':
+                images += 1
+                retrieved += event['bytes']
+            elif event['stage'] == 'done' and 'image' in event:
+                latencies.append(event['time'] - started)
+            elif event['stage'] == 'processed':
+                for stage, seconds in event['seconds'].items():
+                    stages[stage] = stages.get(stage, 0.0) + seconds
+    source, kind, size = case
+    return {
+        'source': source,
+        'kind': kind,
+        'size_mib': size,
+        'images': images,
+        'bytes': retrieved,
+        'elapsed': elapsed,
+        'mb_per_s': retrieved / elapsed / 1e6,
+        'stages': {
+            stage: {'seconds': seconds,
+                    'mb_per_s': retrieved / seconds / 1e6 if seconds else None}
+            for stage, seconds in stages.items()},
+        'latency': {
+            'first': min(latencies),
+            'median': statistics.median(latencies),
+            'last': max(latencies),
+            },
+        # ru_maxrss is in KiB on Linux.
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+
+def commit():
+    """Return the commit checked out, or None if that cannot be told."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+            universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(result, file):
+    if 'error' in result:
+        print("{:<7} {:<5} {:>6}  failed:\n{}".format(
+            *result['case'], result['error']), file=file)
+        return
+    print("{source:<7} {kind:<5} {size_mib:>4}MiB  {images:>3} images  "
+          "{mb_per_s:7.1f} MB/s  {elapsed:6.2f}s  latency "
+          "{latency[median]:6.2f}s  peak RSS {rss:5.0f} MiB".format(
+              rss=result['peak_rss_kib'] / 1024, **result), file=file)
+    print("    " + "  ".join(
+        "{} {:.2f}s{}".format(
+            stage, figures['seconds'],
+            " ({:.1f} MB/s)".format(figures['mb_per_s'])
+            if figures['mb_per_s'] else "")
+        for stage, figures in result['stages'].items()), file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[16, 64],
+                        help="sizes of the images, in MiB before compression")
+    parser.add_argument('--kinds', nargs='+', choices=sorted(KINDS),
+                        default=['raw', 'iso', 'gzip'])
+    parser.add_argument('--sources', nargs='+', choices=SOURCES,
+                        default=SOURCES)
+    parser.add_argument('--images', type=int, default=2,
+                        help="images of each kind and size")
+    parser.add_argument('--scanner', choices=sorted(SCANNERS),
+                        default='read', help="stand-in scanner to run")
+    parser.add_argument('--scanner-command',
+                        help="scanner command to run instead, as a string")
+    parser.add_argument('--concurrency', type=int,
+                        default=config.SCAN_CONCURRENCY,
+                        help="scans at once, SCAN_CONCURRENCY")
+    parser.add_argument('--redis', help="URL of a Redis server to use")
+    parser.add_argument('--scratch',
+                        help="directory for the images and workspaces, "
+                        "by default a temporary one")
+    parser.add_argument('--json', help="file to write the results to, or -")
+    args = parser.parse_args()
+
+    with TemporaryDirectory(dir=args.scratch) as scratch:
+        scratch = Path(scratch)
+        print("Generating images in {}".format(scratch), file=sys.stderr)
+        for kind in args.kinds:
+            for size in args.sizes:
+                name = '{}-{}M'.format(kind, size)
+                directory = scratch / 'www' / name
+                directory.mkdir(parents=True)
+                for n in range(args.images):
+                    make_image(directory / 'image{}{}'.format(n, KINDS[kind]),
+                               kind, size * MiB)
+                if 'git' in args.sources:
+                    (scratch / 'git').mkdir(exist_ok=True)
+                    make_repo(directory, scratch / 'git' / (name + '.git'))
+
+        server = ImageServer(('127.0.0.1', 0), ImageHandler)
+        server.root = scratch / 'www'
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+
+        scanner = (shlex.split(args.scanner_command) if args.scanner_command
+                   else SCANNERS[args.scanner])
+        configure(scratch, scanner, args.concurrency)
+
+        context = multiprocessing.get_context('fork')
+        results = []
+        for source in args.sources:
+            for kind in args.kinds:
+                for size in args.sizes:
+                    case = (source, kind, size)
+                    reader, writer = context.Pipe(duplex=False)
+                    process = context.Process(target=run_case, args=(
+                        case, requests_for(case, base_url, scratch),
+                        args.redis, writer))
+                    process.start()
+                    # The process may die without a word, if killed for
+                    # running out of memory.
+                    while not reader.poll(1) and process.is_alive():
+                        pass
+                    result = reader.recv() if reader.poll() else {
+                        'case': case, 'error': "Exited with {}".format(
+                            process.exitcode)}
+                    process.join()
+                    report(result, sys.stderr if args.json == '-'
+                           else sys.stdout)
+                    results.append(result)
+        server.shutdown()
+
+    if args.json:
+        output = {
+            'commit': commit(),
+            'python': platform.python_version(),
+            'time': time.time(),
+            'arguments': vars(args),
+            'results': results,
+            }
+        if args.json == '-':
+            json.dump(output, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, 'w') as fd:
+                json.dump(output, fd, indent=2)
+    if any('error' in result for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Simulate a day of scan requests queued in the single scans queue, first in
+first out, and routed by size class and submitter as routing.py does, and
+report the latency, from submission to result, of each size class.
+
+Requests arrive at random, mostly small images with some medium and a few
+huge ones, from several submitters; one of them submits a batch of large
+images every few hours, as a release pipeline does. Images are scanned at a
+fixed rate. The worker pools are those routing.worker_pools configures for
+--weights; the single queue has as many processes in all.
+
+Run from the directory containing setup.py:
+
+    python3 benchmarks/bench_priority.py --weights 'small=2 medium=1 large=1'
+
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from imagescanner import config, routing  # noqa: E402
+
+MB = 1000 * 1000
+GB = 1000 * MB
+# The share of requests of each size, and the range of their sizes.
+MIX = [(0.7, 50 * MB, 2 * GB), (0.2, 2 * GB, 16 * GB), (0.1, 16 * GB, 60 * GB)]
+
+
+def workload(seed, hours, rate, batch_every, batch_size):
+    """Return (time, size, submitter) for each request, in order of time."""
+    rng = random.Random(seed)
+    requests = []
+    now = 0.0
+    while True:
+        now += rng.expovariate(rate / 3600)
+        if now > hours * 3600:
+            break
+        share = rng.random()
+        for weight, low, high in MIX:
+            share -= weight
+            if share <= 0:
+                break
+        requests.append((now, rng.uniform(low, high),
+                         'team{}'.format(rng.randrange(5))))
+    for start in range(0, hours * 3600, batch_every * 3600):
+        for n in range(batch_size):
+            requests.append((start + n, rng.uniform(16 * GB, 60 * GB),
+                             'release'))
+    return sorted(requests)
+
+
+class Queue(object):
+    """A queue of the broker: requests by priority, then first in first
+    out, with a count of each submitter's requests waiting in it.
+
+    """
+
+    def __init__(self):
+        self.levels = [deque() for _ in routing.PRIORITIES]
+        self.waiting = defaultdict(int)
+
+    def put(self, request, fair):
+        who = request[3]
+        priority = min(self.waiting[who], routing.PRIORITIES[-1]) \
+            if fair else 0
+        self.waiting[who] += 1
+        self.levels[priority].append(request)
+
+    def get(self):
+        for level in self.levels:
+            if level:
+                request = level.popleft()
+                self.waiting[request[3]] -= 1
+                return request
+        return None
+
+
+def simulate(requests, pools, classify, fair, rate):
+    """Run requests through pools, a list of (queues, concurrency), putting
+    each in the queue classify returns, and return the latency of each
+    request by size class.
+
+    """
+    queues = defaultdict(Queue)
+    workers = []
+    for names, concurrency in pools:
+        for _ in range(concurrency):
+            # Each worker takes from its queues in turn, as kombu does.
+            workers.append(deque(names))
+    idle = list(range(len(workers)))
+    events = [(when, 0, n, (when, size, routing.size_class(size), who))
+              for n, (when, size, who) in enumerate(requests)]
+    heapq.heapify(events)
+    latencies = defaultdict(list)
+    sequence = len(events)
+    while events:
+        now, kind, _, item = heapq.heappop(events)
+        if kind == 0:
+            queues[classify(item)].put(item, fair)
+        else:
+            worker, request = item
+            latencies[request[2]].append(now - request[0])
+            idle.append(worker)
+        for worker in list(idle):
+            names = workers[worker]
+            for _ in range(len(names)):
+                request = queues[names[0]].get()
+                names.rotate(-1)
+                if request is not None:
+                    idle.remove(worker)
+                    sequence += 1
+                    heapq.heappush(events, (
+                        now + request[1] / rate, 1, sequence,
+                        (worker, request)))
+                    break
+    return latencies
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(label, latencies):
+    print(label)
+    for name, _ in config.SIZE_CLASSES:
+        values = latencies.get(name)
+        if values:
+            print("  {:<8} {:5} requests  p50 {:7.1f}  p90 {:7.1f}  "
+                  "p99 {:7.1f}  max {:7.1f} minutes".format(
+                      name, len(values),
+                      *(percentile(values, f) / 60
+                        for f in (0.5, 0.9, 0.99, 1.0))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--weights', default=config.QUEUE_WEIGHTS,
+                        help="weights of the worker pools, as in "
+                        "IMAGESCANNER_QUEUE_WEIGHTS")
+    parser.add_argument('--hours', type=int, default=24,
+                        help="hours of requests to simulate")
+    parser.add_argument('--rate', type=float, default=30,
+                        help="requests per hour, besides the batches")
+    parser.add_argument('--batch-every', type=int, default=6,
+                        help="hours between batches of large images")
+    parser.add_argument('--batch-size', type=int, default=10,
+                        help="large images in each batch")
+    parser.add_argument('--scan-rate', type=float, default=100,
+                        help="MB scanned per second by each process")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    requests = workload(args.seed, args.hours, args.rate, args.batch_every,
+                        args.batch_size)
+    pools = [(queues, concurrency) for _, queues, concurrency
+             in routing.worker_pools(routing.parse_weights(args.weights))]
+    rate = args.scan_rate * MB
+    print("{} requests over {} hours, {} worker processes".format(
+        len(requests), args.hours, sum(c for _, c in pools)))
+
+    report("One scans queue, first in first out:", simulate(
+        requests, [(['scans'], sum(c for _, c in pools))],
+        lambda request: 'scans', False, rate))
+    report("Queued by size class and submitter:", simulate(
+        requests, pools,
+        lambda request: routing.queue_name(request[2]), True, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Compare the cost of dispatching with regexdispatch as the number of
+handlers grows: trying each handler's regex in turn, as regexdispatch used to,
+matching the combined pattern, and answering from the memo.
+
+Each handler matches URLs of one host. The arguments are distinct URLs of the
+last host registered, the worst case for trying the regexes in turn, as when
+_ri_bucket dispatches each object of a bucket; and, for the memo, one URL
+dispatched again and again.
+
+Run from the directory containing setup.py:
+
+    python3 benchmarks/bench_regexdispatch.py --calls 20000
+
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from imagescanner.regexdispatch import regexdispatch  # noqa: E402
+
+
+def make_dispatcher(count):
+    @regexdispatch
+    def dispatcher(arg, **kwargs):
+        return None
+
+    for n in range(count):
+        dispatcher.register(
+            r'https?://(?P<hostname>host{}\.example\.com)/'
+            r'(?P<filename>[^/]*\.(?:img|iso|qcow2?))$'.format(n),
+            lambda arg, n=n, **kwargs: n)
+    return dispatcher
+
+
+def sequential(dispatcher, arg):
+    """Dispatch as regexdispatch formerly did."""
+    for handler in dispatcher.registry:
+        mo = handler.regex.match(arg)
+        if mo is not None:
+            return handler(arg, **mo.groupdict())
+    return dispatcher.prototype(arg)
+
+
+def timed(fn, args):
+    start = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--handlers', type=int, nargs='+',
+                        default=[1, 4, 16, 64, 256])
+    args = parser.parse_args()
+
+    print("{:>8}  {:>12}  {:>12}  {:>12}   (microseconds per call)".format(
+        "handlers", "in turn", "combined", "memoized"))
+    for count in args.handlers:
+        urls = ['https://host{}.example.com/{}.img'.format(count - 1, n)
+                for n in range(args.calls)]
+        dispatcher = make_dispatcher(count)
+        assert dispatcher(urls[0]) == sequential(dispatcher, urls[0])
+        in_turn = timed(lambda arg: sequential(dispatcher, arg), urls)
+        # Distinct arguments, so the memo does not help.
+        combined = timed(dispatcher, urls)
+        memoized = timed(dispatcher, urls[:1] * args.calls)
+        print("{:8}  {:12.2f}  {:12.2f}  {:12.2f}".format(
+            count, in_turn, combined, memoized))
+
+
+if __name__ == '__main__':
+    main()
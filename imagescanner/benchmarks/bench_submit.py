@@ -0,0 +1,129 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Compare the rate at which scans are queued by posting them one at a time to
+the form, as the release pipeline did, and in batches to the JSON API at
+/imagescanner/api/scans.
+
+The broker is Celery's in-memory transport, and progress goes to an in-process
+fake Redis unless --redis gives the URL of a real one, so the figures measure
+the frontend and the client libraries rather than the network.
+
+Run from the directory containing setup.py:
+
+    python3 benchmarks/bench_submit.py --scans 1000 --batch 250
+
+"""
+import argparse
+import os
+import sys
+import time
+import fakeredis
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from imagescanner import frontend, redisconn, tasks  # noqa: E402
+
+
+def scans(count):
+    return [{
+        'source': 'https://images.example.com/release/{}.qcow2'.format(n),
+        'recipients': ['#scans'],
+        } for n in range(count)]
+
+
+def post_form(client, items, batch):
+    for item in items:
+        resp = client.post('/imagescanner', data={
+            'repo': item['source'], 'path': '',
+            'notify': ','.join(item['recipients'])})
+        assert resp.status_code == 302
+
+
+def post_batches(client, items, batch):
+    for start in range(0, len(items), batch):
+        resp = client.post('/imagescanner/api/scans',
+                           json=items[start:start + batch])
+        assert resp.status_code == 202, resp.get_data(as_text=True)
+
+
+def drain():
+    with tasks.celery_app.connection_for_read() as conn:
+        queue = conn.SimpleQueue('scans')
+        count = queue.qsize()
+        queue.clear()
+        queue.close()
+    return count
+
+
+def timed(label, count, fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    assert drain() == count
+    print("{:<32} {:8.0f} scans/s  ({:.2f}s)".format(
+        label, count / elapsed, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scans', type=int, default=1000,
+                        help="number of scans to queue")
+    parser.add_argument('--batch', type=int, default=250,
+                        help="scans posted in each batch")
+    parser.add_argument('--redis', help="URL of a Redis server to use")
+    args = parser.parse_args()
+
+    tasks.celery_app.conf.broker_url = 'memory://'
+    redisconn._pid = os.getpid()
+    redisconn._client = (
+        redis.Redis.from_url(args.redis, decode_responses=True)
+        if args.redis else fakeredis.FakeRedis(decode_responses=True))
+    client = frontend.app.test_client()
+    items = scans(args.scans)
+    drain()
+
+    print("Queueing {} scans:".format(args.scans))
+    timed("one form post each", args.scans, post_form, client, items,
+          args.batch)
+    timed("batches of {}".format(args.batch), args.scans, post_batches,
+          client, items, args.batch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""List the objects in an S3 (or radosgw) bucket, a page at a time.
+
+A bucket listing returns at most 1000 keys per response, flagging the rest
+with IsTruncated; the next page starts after the marker named in NextMarker,
+or after the last key of the page if there is none. Each page is read in full,
+parsed with iterparse as it streams in, and its keys are then generated, so a
+caller may start retrieving the first objects before the listing is complete
+without holding a connection open meanwhile.
+
+Should the connection drop partway through a page, the listing resumes after
+the last key read, up to config.DOWNLOAD_RETRIES times in a row. Error
+responses other than 429 and 5xx are not retried.
+
+"""
+import time
+from xml.etree import ElementTree
+import requests
+import urllib3
+from . import config
+from .sessions import get_session
+
+S3_NS = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+
+class ListingError(Exception):
+    """A bucket listing could not be completed."""
+
+
+def _parse_page(raw, page):
+    """Generate (key, size) for each object in one listing page, read from
+    the binary stream raw, recording in the dict page whether it was
+    truncated and the marker to continue from.
+
+    """
+    page['truncated'] = False
+    page['marker'] = None
+    for event, elem in ElementTree.iterparse(raw):
+        if elem.tag == S3_NS + 'Contents':
+            key = elem.findtext(S3_NS + 'Key')
+            size = elem.findtext(S3_NS + 'Size')
+            yield key, int(size) if size else None
+            # Keep only the current entry in memory.
+            elem.clear()
+        elif elem.tag == S3_NS + 'IsTruncated':
+            page['truncated'] = elem.text == 'true'
+        elif elem.tag == S3_NS + 'NextMarker':
+            page['marker'] = elem.text
+
+
+def list_objects(url):
+    """Generate (key, size) for each object in the bucket at url, in the
+    order listed.
+
+    """
+    session = get_session(url)
+    marker = None
+    attempts = 0
+    while True:
+        params = {'format': 'xml'}
+        if marker:
+            params['marker'] = marker
+        page = {}
+        entries = []
+        try:
+            r = session.get(url, params=params, stream=True,
+                            timeout=config.DOWNLOAD_TIMEOUT)
+            try:
+                r.raise_for_status()
+                r.raw.decode_content = True
+                # Read the whole page before generating any of it, rather
+                # than hold the connection open while the caller retrieves
+                # each object.
+                for entry in _parse_page(r.raw, page):
+                    entries.append(entry)
+            finally:
+                r.close()
+        except (requests.RequestException, urllib3.exceptions.HTTPError,
+                ElementTree.ParseError) as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', 0)
+            if status and status != 429 and status < 500:
+                raise ListingError("Cannot list {}: {}".format(url, e))
+            attempts += 1
+            if attempts > config.DOWNLOAD_RETRIES:
+                raise ListingError(
+                    "Giving up listing {} after {}: {}".format(
+                        url, marker, e))
+            # Generate what was read of the page, and resume after it.
+            for key, size in entries:
+                yield key, size
+            if entries:
+                marker = entries[-1][0]
+            time.sleep(min(2 ** attempts, 60))
+            continue
+
+        attempts = 0
+        for key, size in entries:
+            yield key, size
+        if not page['truncated']:
+            return
+        marker = page['marker'] or (entries[-1][0] if entries else None)
+        if not marker:
+            raise ListingError(
+                "Truncated listing of {} gave no marker".format(url))
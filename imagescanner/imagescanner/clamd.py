@@ -0,0 +1,251 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""A client for a long-running clamd, spoken to over its Unix socket.
+
+clamscan loads the whole signature database every time it runs, which takes
+tens of seconds and over a gigabyte of memory before it scans a single file.
+clamd keeps the database loaded between scans. MULTISCAN has clamd scan a
+directory tree with all of its threads; files clamd is not permitted to open
+itself are then streamed to it with INSTREAM by this, privileged, process.
+
+scan_directory() produces the same exit codes as clamscan, and output lines in
+the same format, so the SecurityValidation logs read the same whichever
+backend is used; only clean files are not listed individually.
+
+"""
+import os
+import socket
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from . import config
+
+# INSTREAM chunk size; it must not exceed clamd's StreamMaxLength.
+CHUNK_SIZE = 1024 * 1024
+# clamd's reply to a stream longer than its StreamMaxLength.
+SIZE_LIMIT_REPLY = 'INSTREAM size limit exceeded. ERROR'
+
+
+class ClamdError(Exception):
+    """clamd could not be reached, or replied unexpectedly."""
+
+
+class Clamd(object):
+
+    def __init__(self, socket_path, timeout=None):
+        self.socket_path = socket_path
+        self.timeout = config.CLAMD_TIMEOUT if timeout is None else timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(str(self.socket_path))
+        except OSError as e:
+            sock.close()
+            raise ClamdError(
+                "Cannot connect to clamd at {}: {}".format(
+                    self.socket_path, e))
+        return sock
+
+    @staticmethod
+    def _replies(sock):
+        """Read null-terminated replies until clamd closes the connection."""
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return [reply.decode('utf-8', 'replace')
+                for reply in b''.join(chunks).split(b'\0') if reply]
+
+    def command(self, command):
+        """Send one command, and return the list of replies to it."""
+        with self._connect() as sock:
+            try:
+                sock.sendall(b'z' + command.encode('utf-8') + b'\0')
+                return self._replies(sock)
+            except OSError as e:
+                raise ClamdError("clamd failed during {}: {}".format(
+                    command.split()[0], e))
+
+    def ping(self):
+        return self.command('PING') == ['PONG']
+
+    def version(self):
+        """Return clamd's version string, like
+        ClamAV 0.100.2/25037/Mon Oct 15 08:57:49 2018
+
+        """
+        replies = self.command('VERSION')
+        if not replies:
+            raise ClamdError("Empty reply to VERSION")
+        return replies[0]
+
+    def multiscan(self, path):
+        """Scan path recursively, and return a list of (path, result) pairs,
+        where result is 'OK', '<signature> FOUND' or '<message> ERROR'.
+
+        """
+        return [split_reply(reply, str(path))
+                for reply in self.command('MULTISCAN ' + str(path))]
+
+    def scan(self, path):
+        """Scan the single file at path, and return the result."""
+        replies = self.command('SCAN ' + str(path))
+        if len(replies) != 1:
+            raise ClamdError("Unexpected reply to SCAN: %r" % replies)
+        return split_reply(replies[0], str(path))[1]
+
+    def instream(self, fileobj):
+        """Stream the contents of fileobj to clamd, and return the result."""
+        with self._connect() as sock:
+            try:
+                sock.sendall(b'zINSTREAM\0')
+                while True:
+                    chunk = fileobj.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sock.sendall(struct.pack('!L', len(chunk)) + chunk)
+                sock.sendall(struct.pack('!L', 0))
+                replies = self._replies(sock)
+            except OSError as e:
+                raise ClamdError("clamd failed during INSTREAM: {}".format(e))
+        if len(replies) != 1:
+            raise ClamdError("Unexpected reply to INSTREAM: %r" % replies)
+        return split_reply(replies[0], 'stream')[1]
+
+
+def split_reply(reply, path=''):
+    """Split a reply like '/path/to/file: Eicar-Signature FOUND' to a request
+    to scan path, or a directory containing the file, into the file's path
+    and the result.
+
+    The result ends in ' FOUND', ' ERROR' or is 'OK', but an error message
+    may itself contain ': ', as in 'lstat() failed: Permission denied. ERROR',
+    so the file's path ends at the first ': ' after the path requested.
+
+    """
+    start = len(path) if reply.startswith(path) else 0
+    end = reply.find(': ', start)
+    if end < 0:
+        return '', reply
+    return reply[:end], reply[end + len(': '):]
+
+
+def _stream_file(client, filename):
+    """Stream a file clamd could not open itself, and return the result.
+
+    Like clamscan, which skips files larger than its MaxFileSize, files too
+    large for clamd's StreamMaxLength are skipped rather than reported as
+    errors.
+
+    """
+    try:
+        if os.path.getsize(filename) > config.CLAMD_STREAM_MAX_LENGTH:
+            return 'OK'
+        with open(filename, 'rb') as fd:
+            result = client.instream(fd)
+    except OSError as e:
+        return "{} ERROR".format(e.strerror)
+    return 'OK' if result == SIZE_LIMIT_REPLY else result
+
+
+def _stream_errors(client, results):
+    """Return results, with each file clamd could not open replaced by the
+    result of streaming it, over up to config.CLAMD_STREAM_CONNECTIONS
+    connections at once.
+
+    """
+    with ThreadPoolExecutor(config.CLAMD_STREAM_CONNECTIONS) as executor:
+        streamed = {
+            filename: executor.submit(_stream_file, client, filename)
+            for filename, result in results
+            if result.endswith(' ERROR') and os.path.isfile(filename)}
+        return [
+            (filename, streamed[filename].result()
+             if filename in streamed else result)
+            for filename, result in results]
+
+
+def _report(client, results):
+    """Return clamscan's exit code and clamscan-style output for results."""
+    infected = errors = 0
+    output = []
+    for filename, result in results:
+        if result.endswith(' FOUND'):
+            infected += 1
+        elif result.endswith(' ERROR'):
+            errors += 1
+        if result != 'OK':
+            output.append("{}: {}\n".format(filename, result))
+
+    output.append("\n----------- SCAN SUMMARY -----------\n")
+    output.append("Engine version: {}\n".format(client.version()))
+    output.append("Infected files: {}\n".format(infected))
+    output.append("Errors: {}\n".format(errors))
+    returncode = 1 if infected else 2 if errors else 0
+    return returncode, ''.join(output)
+
+
+def scan_directory(path, client=None):
+    """Scan the files beneath path with clamd, and return clamscan's exit
+    code and clamscan-style output.
+
+    Files clamd could not open are streamed to it over up to
+    config.CLAMD_STREAM_CONNECTIONS connections at once.
+
+    """
+    client = client or Clamd(config.CLAMD_SOCKET)
+    return _report(client, _stream_errors(client, client.multiscan(path)))
+
+
+def scan_files(filenames, client=None):
+    """Scan each of filenames with clamd, up to config.CLAMD_STREAM_CONNECTIONS
+    at once, and return clamscan's exit code, clamscan-style output, and the
+    files found clean.
+
+    """
+    client = client or Clamd(config.CLAMD_SOCKET)
+    with ThreadPoolExecutor(config.CLAMD_STREAM_CONNECTIONS) as executor:
+        results = list(zip(filenames, executor.map(client.scan, filenames)))
+    results = _stream_errors(client, results)
+    returncode, output = _report(client, results)
+    return returncode, output, [
+        filename for filename, result in results if result == 'OK']
@@ -0,0 +1,225 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Coalescing of duplicate scan requests, so that an image is retrieved and
+scanned once however many requests ask for it at the same time.
+
+The first job to claim a piece of work, identified by a key, owns it; each
+later job that claims it while it is owned attaches a description of itself
+to the owner instead, and leaves the work to the owner. When the owner
+releases the work it receives the attachments, and delivers its result to
+each of them. request_scan claims its source and path before retrieving
+anything, with source_key(), and each image's checksum before scanning it,
+with checksum_key().
+
+A claim is kept in Redis, under imagescanner:coalesce:<key>, with the list of
+attachments under imagescanner:coalesce:<key>:attached. Claims and releases
+are WATCH/MULTI transactions, so no attachment is added once the owner has
+taken them. A claim lapses after config.COALESCE_TTL seconds unless renewed,
+which a Claims does every config.COALESCE_RENEW seconds while it owns any, so
+that the work of an owner that dies without releasing it is soon claimed
+afresh rather than left to the dead owner.
+
+If Redis cannot be reached, every job owns the work it claims, and scans as
+though there were no other.
+
+"""
+import hashlib
+import json
+import sys
+import threading
+from urllib.parse import urlsplit, urlunsplit
+import redis
+from . import config
+from .redisconn import get_redis
+
+CLAIM_KEY = 'imagescanner:coalesce:{}'
+ATTACHED_KEY = 'imagescanner:coalesce:{}:attached'
+
+
+def source_key(source, path):
+    """Return the key of the work of scanning path from source, the same for
+    any spelling of the same source URL and path.
+
+    """
+    scheme, netloc, url_path, query, _ = urlsplit(source.strip())
+    source = urlunsplit((scheme.lower(), netloc.lower(), url_path, query, ''))
+    path = (path or '').strip().strip('/')
+    return 'source:' + hashlib.sha256(
+        '{}\0{}'.format(source, path).encode()).hexdigest()
+
+
+def checksum_key(checksum):
+    """Return the key of the work of scanning the image with checksum."""
+    return 'checksum:' + checksum
+
+
+def claim(key, job_id, attachment, client=None):
+    """Claim the work identified by key for the job job_id. Return None if the
+    job now owns it, or else the id of the job that does, having attached
+    attachment, a dict describing the job, to that job's claim.
+
+    """
+    claim_key = CLAIM_KEY.format(key)
+    attached_key = ATTACHED_KEY.format(key)
+    try:
+        with (client or get_redis()).pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(claim_key)
+                    owner = pipe.get(claim_key)
+                    pipe.multi()
+                    if owner is None:
+                        pipe.set(claim_key, job_id, ex=config.COALESCE_TTL)
+                        pipe.delete(attached_key)
+                    elif owner != job_id:
+                        pipe.rpush(attached_key, json.dumps(attachment))
+                        pipe.expire(attached_key, config.COALESCE_TTL)
+                    pipe.execute()
+                    return None if owner in (None, job_id) else owner
+                except redis.WatchError:
+                    continue
+    except redis.RedisError as e:
+        print("Cannot coalesce {}: {}".format(key, e), file=sys.stderr)
+        return None
+
+
+def release(key, job_id, client=None):
+    """Release the job job_id's claim on the work identified by key, and return
+    the attachments of the jobs that attached to it, oldest first. Return none
+    if the job does not own the work.
+
+    """
+    claim_key = CLAIM_KEY.format(key)
+    attached_key = ATTACHED_KEY.format(key)
+    try:
+        with (client or get_redis()).pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(claim_key, attached_key)
+                    if pipe.get(claim_key) != job_id:
+                        return []
+                    attached = pipe.lrange(attached_key, 0, -1)
+                    pipe.multi()
+                    pipe.delete(claim_key, attached_key)
+                    pipe.execute()
+                    return [json.loads(value) for value in attached]
+                except redis.WatchError:
+                    continue
+    except redis.RedisError as e:
+        print("Cannot release {}: {}".format(key, e), file=sys.stderr)
+        return []
+
+
+def renew(keys, job_id, client=None):
+    """Extend the job job_id's claims on the work identified by each of keys
+    by config.COALESCE_TTL seconds from now, where the job still owns it.
+
+    """
+    client = client or get_redis()
+    try:
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(CLAIM_KEY.format(key))
+        owners = pipe.execute()
+        pipe = client.pipeline(transaction=False)
+        for key, owner in zip(keys, owners):
+            if owner == job_id:
+                pipe.expire(CLAIM_KEY.format(key), config.COALESCE_TTL)
+                pipe.expire(ATTACHED_KEY.format(key), config.COALESCE_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        print("Cannot renew claims of job {}: {}".format(job_id, e),
+              file=sys.stderr)
+
+
+class Claims(object):
+    """The claims of one job, which attaches attachment, a dict describing
+    it, to the claims of others. A thread renews the claims the job owns
+    until it has released them all.
+
+    """
+
+    def __init__(self, job_id, attachment):
+        self.job_id = job_id
+        self.attachment = attachment
+        self.owned = set()
+        self.lock = threading.Lock()
+        self.stopped = None
+
+    def claim(self, key, **details):
+        """Claim the work identified by key as claim() does, attaching the
+        job's attachment with any further details.
+
+        """
+        owner = claim(key, self.job_id, dict(self.attachment, **details))
+        if owner is None:
+            with self.lock:
+                self.owned.add(key)
+                if self.stopped is None:
+                    self.stopped = threading.Event()
+                    threading.Thread(target=self._renew, args=(self.stopped,),
+                                     daemon=True).start()
+        return owner
+
+    def _renew(self, stopped):
+        while not stopped.wait(config.COALESCE_RENEW):
+            with self.lock:
+                keys = list(self.owned)
+            renew(keys, self.job_id)
+
+    def release(self, key):
+        """Release the work identified by key, if the job owns it, as release()
+        does.
+
+        """
+        with self.lock:
+            if key not in self.owned:
+                return []
+            self.owned.discard(key)
+            if not self.owned:
+                self.stopped.set()
+                self.stopped = None
+        return release(key, self.job_id)
+
+    def release_all(self):
+        """Release all the work the job owns, and return a dict of the
+        attachments to each by key.
+
+        """
+        return {key: self.release(key) for key in list(self.owned)}
@@ -49,13 +49,176 @@ from pathlib import Path
 # http://docs.python-requests.org/en/master/user/authentication/
 AUTHS = {}
 LOGS_PATH = Path(os.getenv('IMAGESCANNER_LOGS_PATH', '.'))
-STATUSFILE = LOGS_PATH/'status.txt'
+# The Redis server used as celery's broker and result backend, and to share
+# state between the frontend and the workers. REDIS_TIMEOUT is in seconds.
+REDIS_URL = os.getenv('IMAGESCANNER_REDIS_URL', 'redis://vvp-redis')
+REDIS_TIMEOUT = 10
+# The progress of the last PROGRESS_HISTORY jobs, and of every job still
+# queued, is kept in Redis, up to PROGRESS_EVENTS events each and for at most
+# PROGRESS_TTL seconds; the frontend shows the last PROGRESS_SHOWN jobs.
+PROGRESS_HISTORY = 100
+PROGRESS_EVENTS = 1000
+PROGRESS_TTL = 7 * 24 * 60 * 60
+PROGRESS_SHOWN = 5
+# A finished scan log may be cached by clients for LOG_CACHE_MAX_AGE seconds.
+# A client following a scan's log waits for up to LOG_TAIL_MAX_WAIT seconds
+# for more of it, checking every LOG_TAIL_POLL_INTERVAL seconds, and receives
+# up to LOG_TAIL_MAX_BYTES at a time.
+LOG_CACHE_MAX_AGE = 60 * 60
+LOG_TAIL_MAX_WAIT = 25
+LOG_TAIL_POLL_INTERVAL = 0.5
+LOG_TAIL_MAX_BYTES = 1024 * 1024
+# Every worker records what it is doing in Redis every
+# WORKER_HEARTBEAT_INTERVAL seconds. The frontend flags a worker not heard from
+# for WORKER_STALE_AFTER seconds as stale, and forgets one not heard from for
+# WORKER_FORGET_AFTER seconds.
+WORKER_HEARTBEAT_INTERVAL = int(os.getenv(
+    'IMAGESCANNER_WORKER_HEARTBEAT_INTERVAL', '5'))
+WORKER_STALE_AFTER = 3 * WORKER_HEARTBEAT_INTERVAL
+WORKER_FORGET_AFTER = 24 * 60 * 60
+# The time spent in each stage of a scan, and such, is aggregated in Redis, and
+# served by the frontend for Prometheus; see metrics.py. METRICS_BUCKETS are
+# the upper bounds, in seconds, of the buckets of the histograms of stage
+# times. Each process reports its gauges every METRICS_INTERVAL seconds; those
+# of a process not heard from for METRICS_STALE_AFTER seconds are left out.
+METRICS_BUCKETS = [
+    0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400]
+METRICS_INTERVAL = 15
+METRICS_STALE_AFTER = 3 * METRICS_INTERVAL
 # A dict passed as kwargs to jenkins.Jenkins constructor.
 JENKINS = {
     'url': 'http://jenkins:8080',
     'username': '',
     'password': '',
     }
+# Notifications are delivered by up to NOTIFY_CONCURRENCY threads in each
+# notifications worker process, each request timing out after NOTIFY_TIMEOUT
+# seconds. A failed delivery is retried up to NOTIFY_RETRIES times, after
+# NOTIFY_BACKOFF seconds, doubling each time up to NOTIFY_MAX_BACKOFF, or after
+# as long as a 429 response's Retry-After asks, up to the same. Notifications
+# that cannot be delivered are kept in Redis, the last DEAD_LETTERS of them.
+# NOTIFY_RATES limits the requests per second to each named host.
+NOTIFY_CONCURRENCY = 8
+NOTIFY_TIMEOUT = 30
+NOTIFY_RETRIES = 5
+NOTIFY_BACKOFF = 1
+NOTIFY_MAX_BACKOFF = 60
+NOTIFY_RATES = {'hooks.slack.com': 1}
+DEAD_LETTERS = 1000
+# Scan results are cached by image checksum and ClamAV signature version, so
+# that resubmitted images are not scanned again. RESULT_CACHE_TTL is in
+# seconds; set it to 0 to disable the cache. RESULT_CACHE_EVICTION is 'lru' or
+# 'fifo', and applies once there are more than RESULT_CACHE_MAX_ENTRIES.
+RESULT_CACHE_PATH = LOGS_PATH/'cache'
+RESULT_CACHE_TTL = 7 * 24 * 60 * 60
+RESULT_CACHE_MAX_ENTRIES = 10000
+RESULT_CACHE_EVICTION = 'lru'
+# The result of every scan is recorded in an SQLite database, queried by the
+# frontend's /imagescanner/api/results, RESULTS_PAGE at a time unless the
+# client asks for up to RESULTS_PAGE_MAX.
+RESULT_STORE_PATH = LOGS_PATH/'results.sqlite3'
+RESULTS_PAGE = 50
+RESULTS_PAGE_MAX = 500
+# A job scanning a source, or an image, has other jobs asking to scan the same
+# one meanwhile attach to it rather than scan it again; see coalesce.py. The
+# job renews its claim every COALESCE_RENEW seconds, so that one that dies
+# holds on to its claim for no more than COALESCE_TTL seconds.
+COALESCE_TTL = 60
+COALESCE_RENEW = 20
+# Requests are queued by the total size of their images, in the first of
+# SIZE_CLASSES whose limit in bytes that is within; None is no limit. Those of
+# unknown size are queued in SIZE_CLASS_UNKNOWN, as are those not sized within
+# SIZE_ESTIMATE_TIMEOUT seconds of submission. SIZE_ESTIMATORS requests are
+# sized at once. Each worker runs a pool of processes for each class, as many
+# as its weight in QUEUE_WEIGHTS; see routing.py.
+SIZE_CLASSES = [
+    ('small', 2 * 1024 * 1024 * 1024),
+    ('medium', 16 * 1024 * 1024 * 1024),
+    ('large', None),
+    ]
+SIZE_CLASS_UNKNOWN = 'medium'
+SIZE_ESTIMATORS = 8
+SIZE_ESTIMATE_TIMEOUT = 5
+QUEUE_WEIGHTS = os.getenv(
+    'IMAGESCANNER_QUEUE_WEIGHTS', 'small=1 medium=1 large=1')
+# The frontend's /imagescanner/api/scans queues up to SCAN_BATCH_MAX scans at
+# once.
+SCAN_BATCH_MAX = 1000
+# The checksums of files scanned clean are indexed by signature version, so
+# that files shared by successive images are scanned only once. Beyond
+# FILE_INDEX_MAX_ENTRIES, the least recently seen are forgotten; set it to 0 to
+# disable the index. The index is an SQLite database, so FILE_INDEX_PATH should
+# be on a local filesystem. FILE_INDEX_HASHERS files are checksummed at once.
+FILE_INDEX_PATH = Path(os.getenv(
+    'IMAGESCANNER_FILE_INDEX_PATH', '/var/cache/imagescanner/files.sqlite3'))
+FILE_INDEX_MAX_ENTRIES = 1000000
+FILE_INDEX_HASHERS = 4
+# How many connections to each host every process keeps open for reuse.
+HTTP_POOL_SIZE = 8
+# Images of at least twice DOWNLOAD_SEGMENT_SIZE bytes, from servers that
+# support Range requests, are downloaded in segments of that size over up to
+# DOWNLOAD_CONNECTIONS connections at once. A segment whose connection drops
+# is resumed up to DOWNLOAD_RETRIES times. DOWNLOAD_TIMEOUT is in seconds.
+DOWNLOAD_CONNECTIONS = 4
+DOWNLOAD_SEGMENT_SIZE = 256 * 1024 ** 2
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT = 60
+# Partial segmented downloads are kept in DOWNLOAD_PARTIALS_PATH, so that a
+# later job can resume them, until DOWNLOAD_PARTIALS_TTL seconds after they
+# were last written to. Completed images are moved from there into the job's
+# workspace, so this should be on the same filesystem as the workspaces.
+DOWNLOAD_PARTIALS_PATH = Path(os.getenv(
+    'IMAGESCANNER_DOWNLOADS_PATH', '/var/tmp/imagescanner/downloads'))
+DOWNLOAD_PARTIALS_TTL = 24 * 60 * 60
+# The scanner command; the path to an image is appended to it.
+SCANNER_COMMAND = ['/usr/local/bin/imagescanner-image']
+# How many images of one request to scan at once. Each concurrent scan, in
+# any worker process on the host, leases one of NBD_DEVICES and a mountpoint
+# beneath MOUNTPOINT_ROOT; LEASES_PATH holds the lock files for those leases.
+SCAN_CONCURRENCY = int(os.getenv('IMAGESCANNER_SCAN_CONCURRENCY', '1'))
+NBD_DEVICES = ['/dev/nbd%d' % n for n in range(16)]
+# 'clamd' scans with the long-running clamd listening on CLAMD_SOCKET, which
+# keeps its signature database loaded between scans; 'clamscan' runs clamscan,
+# which loads it afresh for every partition. clamscan is also used whenever
+# clamd cannot be reached.
+SCAN_BACKEND = os.getenv('IMAGESCANNER_SCAN_BACKEND', 'clamscan')
+CLAMD_SOCKET = '/run/clamav/clamd.sock'
+# Seconds to wait for each reply from clamd. MULTISCAN only replies once a
+# whole partition is scanned, so this must allow for the largest partition.
+CLAMD_TIMEOUT = 3600
+# Files clamd may not open itself are streamed to it over this many
+# connections at once. Files longer than clamd's StreamMaxLength are skipped,
+# as clamscan skips files longer than its MaxFileSize.
+CLAMD_STREAM_CONNECTIONS = 4
+CLAMD_STREAM_MAX_LENGTH = 25 * 1024 ** 2
+# How many partitions of one image imagescanner-image scans at once. Each
+# concurrent clamscan loads its own copy of the signature database, over a
+# gigabyte of memory, on top of SCAN_CONCURRENCY; so unless clamd does the
+# scanning, partitions are scanned one at a time by default.
+PARTITION_CONCURRENCY = int(os.getenv(
+    'IMAGESCANNER_PARTITION_CONCURRENCY',
+    '4' if SCAN_BACKEND == 'clamd' else '1'))
+# Scan only the files a qcow2 overlay changes, when its base image has already
+# been scanned clean; see imagescanner.overlay.
+DIFFERENTIAL_SCAN = os.getenv('IMAGESCANNER_DIFFERENTIAL_SCAN', '1') == '1'
+# Profile every scan job, rather than only those asked to be, keeping up to
+# PROFILE_FRAMES frames of the traceback of each memory allocation, and listing
+# the PROFILE_TOP functions and lines that took the most time and memory in the
+# report; see profiling.py.
+PROFILE = os.getenv('IMAGESCANNER_PROFILE', '0') == '1'
+PROFILE_FRAMES = 10
+PROFILE_TOP = 40
+MOUNTPOINT_ROOT = Path(
+    os.getenv('IMAGESCANNER_MOUNTPOINT', '/mnt/imagescanner'))
+LEASES_PATH = Path(os.getenv('IMAGESCANNER_LEASES_PATH', '/run/imagescanner'))
+# Git repositories are mirrored here, once each, and updated for each request.
+GIT_MIRRORS_PATH = Path(os.getenv(
+    'IMAGESCANNER_GIT_MIRRORS_PATH', '/var/cache/imagescanner/git'))
+# How many images to retrieve ahead of the scanner, and how many bytes of
+# retrieved images not yet scanned may occupy the workspace before retrieval
+# pauses. A depth of 0 retrieves each image only when the scanner is ready.
+PREFETCH_DEPTH = int(os.getenv('IMAGESCANNER_PREFETCH_DEPTH', '1'))
+PREFETCH_DISK_BUDGET = 100 * 1024 ** 3
 
 try:
     from imagescannerconfig import * # noqa
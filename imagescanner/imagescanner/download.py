@@ -0,0 +1,335 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Download large images over several HTTP connections at once, resuming
+after dropped connections.
+
+The image is split into segments of config.DOWNLOAD_SEGMENT_SIZE bytes, which
+are fetched with HTTP Range requests over up to config.DOWNLOAD_CONNECTIONS
+connections, and written in place into a partial file preallocated to the full
+size. Partial files are kept in config.DOWNLOAD_PARTIALS_PATH, outside of any
+job's workspace, named for the URL and validator of the image, with their
+progress recorded beside them. So a dropped connection only costs the rest of
+its segment, and a later job downloading the same version of the same image
+resumes where an earlier one stopped.
+
+While the segments arrive, the contiguous prefix of the image received so far
+is hashed, and decompressed if gzipped, while it is still in page cache; only
+when resuming is the part downloaded earlier read back from disk.
+
+Servers that do not advertise Range support, or that ignore Range requests,
+are not handled here: download() raises RangeNotSupported, and the caller
+should fall back to a plain streaming GET.
+
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+import requests
+from . import config
+from .hashing import BUFFER_SIZE, GunzipHasher
+from .scanpool import FileLock
+from .sessions import get_session
+
+# Record progress in the state file at least this often, in bytes.
+SAVE_INTERVAL = 64 * 1024 * 1024
+# How often, in seconds, to hash what has arrived while downloading.
+HASH_INTERVAL = 0.5
+
+
+class DownloadError(Exception):
+    """A download failed, or produced a file of the wrong size."""
+
+
+class RangeNotSupported(DownloadError):
+    """The server does not honour HTTP Range requests."""
+
+
+def probe(url):
+    """Return the size of the resource at url, or None if unknown, whether the
+    server accepts Range requests for it, and a validator (its ETag or
+    Last-Modified date) identifying this version of it.
+
+    """
+    r = get_session(url).head(
+        url, allow_redirects=True, headers={'Accept-Encoding': 'identity'},
+        timeout=config.DOWNLOAD_TIMEOUT)
+    r.raise_for_status()
+    size = r.headers.get('Content-Length')
+    return (
+        int(size) if size is not None else None,
+        r.headers.get('Accept-Ranges') == 'bytes',
+        r.headers.get('ETag') or r.headers.get('Last-Modified'),
+        )
+
+
+class _State(object):
+    """The progress of a download, as a list of [start, end, position]
+    segments, where end is exclusive and position is the next byte to fetch.
+
+    """
+
+    def __init__(self, path, url, size, validator, segment_size):
+        self.path = path
+        self.lock = threading.Lock()
+        self.info = {'url': url, 'size': size, 'validator': validator}
+        try:
+            with open(path) as fd:
+                saved = json.load(fd)
+        except (OSError, ValueError):
+            saved = {}
+        if saved.get('info') == self.info:
+            self.segments = saved['segments']
+            self.resumed = True
+        else:
+            self.segments = [
+                [start, min(start + segment_size, size), start]
+                for start in range(0, size, segment_size)]
+            self.resumed = False
+
+    def save(self):
+        with self.lock:
+            with open(self.path + '.tmp', 'w') as fd:
+                json.dump({'info': self.info, 'segments': self.segments}, fd)
+            os.replace(self.path + '.tmp', self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def prefix(self):
+        """Return how many bytes from the start have all been fetched."""
+        for start, end, position in self.segments:
+            if position < end:
+                return position
+        return self.info['size']
+
+
+def _fetch_segment(url, fd, state, segment):
+    start, end, position = segment
+    attempts = 0
+    saved = position
+    while position < end:
+        try:
+            r = get_session(url).get(
+                url, stream=True,
+                headers={'Range': 'bytes={}-{}'.format(position, end - 1),
+                         'Accept-Encoding': 'identity'},
+                timeout=config.DOWNLOAD_TIMEOUT)
+            if r.status_code == 200:
+                r.close()
+                raise RangeNotSupported("Server ignored Range request")
+            r.raise_for_status()
+            content_range = r.headers.get('Content-Range', '')
+            if not content_range.startswith('bytes {}-'.format(position)):
+                r.close()
+                raise RangeNotSupported(
+                    "Unexpected Content-Range: {}".format(content_range))
+            for chunk in r.iter_content(chunk_size=1024 * 1024):
+                chunk = chunk[:end - position]
+                os.pwrite(fd, chunk, position)
+                position += len(chunk)
+                segment[2] = position
+                if position - saved >= SAVE_INTERVAL:
+                    state.save()
+                    saved = position
+            r.close()
+        except RangeNotSupported:
+            raise
+        except requests.RequestException as e:
+            error = e
+        else:
+            if position >= end:
+                break
+            error = "connection closed at byte {}".format(position)
+        state.save()
+        attempts += 1
+        if attempts > config.DOWNLOAD_RETRIES:
+            raise DownloadError(
+                "Giving up on bytes {}-{} of {}: {}".format(
+                    position, end - 1, url, error))
+        time.sleep(min(2 ** attempts, 60))
+    state.save()
+
+
+class _PrefixHasher(object):
+    """Hash, or decompress and hash, the data in file descriptor fd from the
+    start up to an offset that only grows.
+
+    """
+
+    def __init__(self, fd, dst=None):
+        self.fd = fd
+        self.offset = 0
+        self.hasher = GunzipHasher(dst) if dst else hashlib.sha256()
+
+    def update_to(self, offset):
+        while self.offset < offset:
+            data = os.pread(
+                self.fd, min(BUFFER_SIZE, offset - self.offset), self.offset)
+            self.hasher.update(data)
+            self.offset += len(data)
+
+    def finish(self):
+        """Return the checksum of the data, and that of the decompressed data
+        or None.
+
+        """
+        if isinstance(self.hasher, GunzipHasher):
+            return self.hasher.finish()
+        return self.hasher.hexdigest(), None
+
+
+def partial_path(url, validator):
+    """Return where the partial download of version validator of the resource
+    at url is kept.
+
+    """
+    key = hashlib.sha256('{}\n{}'.format(url, validator).encode()).hexdigest()
+    return os.path.join(str(config.DOWNLOAD_PARTIALS_PATH), key)
+
+
+def _prune_partials():
+    """Remove partial downloads abandoned more than
+    config.DOWNLOAD_PARTIALS_TTL seconds ago.
+
+    """
+    cutoff = time.time() - config.DOWNLOAD_PARTIALS_TTL
+    for entry in os.scandir(str(config.DOWNLOAD_PARTIALS_PATH)):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def download(url, dest, size, validator=None, gunzip=False):
+    """Download the size bytes at url into the file dest, in segments, and
+    return their SHA256 checksum and None.
+
+    If gunzip is set, the resource is gzipped, and is decompressed into dest
+    instead; the checksums of the compressed and of the decompressed data are
+    returned.
+
+    validator, from probe(), ensures a saved download is only resumed if the
+    resource has not changed since.
+
+    """
+    os.makedirs(str(config.DOWNLOAD_PARTIALS_PATH), exist_ok=True)
+    _prune_partials()
+    partial = partial_path(url, validator)
+    # Only one job at a time may write to a partial download.
+    lock = FileLock(partial + '.lock')
+    lock.acquire()
+    os.utime(partial + '.lock')
+    try:
+        checksums = _download(url, partial, size, validator, dest, gunzip)
+    finally:
+        lock.release()
+    if gunzip:
+        os.remove(partial)
+    else:
+        shutil.move(partial, dest)
+    return checksums
+
+
+def _download(url, partial, size, validator, dest, gunzip):
+    state = _State(partial + '.download', url, size, validator,
+                   config.DOWNLOAD_SEGMENT_SIZE)
+    flags = os.O_RDWR | os.O_CREAT
+    if not state.resumed:
+        flags |= os.O_TRUNC
+    fd = os.open(partial, flags, 0o644)
+    output = open(dest, 'wb') if gunzip else None
+    try:
+        if not state.resumed:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+        hasher = _PrefixHasher(fd, output)
+        remaining = [s for s in state.segments if s[2] < s[1]]
+        with ThreadPoolExecutor(config.DOWNLOAD_CONNECTIONS) as executor:
+            futures = [
+                executor.submit(_fetch_segment, url, fd, state, segment)
+                for segment in remaining]
+            try:
+                pending = futures
+                while pending:
+                    done, pending = wait(
+                        pending, HASH_INTERVAL, return_when=FIRST_EXCEPTION)
+                    for future in done:
+                        future.result()
+                    hasher.update_to(state.prefix())
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        actual = os.fstat(fd).st_size
+        if actual != size or state.prefix() < size:
+            raise DownloadError(
+                "Downloaded {} bytes of {}, expected {}".format(
+                    actual, url, size))
+        hasher.update_to(size)
+        checksums = hasher.finish()
+    finally:
+        os.close(fd)
+        if output:
+            output.close()
+
+    state.remove()
+    return checksums
+
+
+def check_length(response):
+    """Raise DownloadError if fewer bytes were read from a streamed response
+    than its Content-Length promised.
+
+    """
+    expected = response.headers.get('Content-Length')
+    if expected is not None and response.raw.tell() != int(expected):
+        raise DownloadError(
+            "Received {} bytes of {}, expected {}".format(
+                response.raw.tell(), response.url, expected))
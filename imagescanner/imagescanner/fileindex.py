@@ -0,0 +1,141 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""An index of the contents of files already scanned clean, so that files
+shared by successive images are not scanned again.
+
+Successive versions of an image mostly hold the same files. Each file scanned
+clean is recorded by its SHA256 checksum and the ClamAV signature database
+version it was scanned under; on later scans under the same database, files
+with a recorded checksum are skipped. Only the files left are read by the
+scanner, at the cost of reading every file once to checksum it, which is far
+cheaper than scanning it.
+
+The index is an SQLite database at config.FILE_INDEX_PATH, shared by every
+worker process on the host. Beyond config.FILE_INDEX_MAX_ENTRIES entries, the
+least recently used are evicted.
+
+"""
+import sqlite3
+import time
+from . import config
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    checksum TEXT NOT NULL,
+    sigversion TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (checksum, sigversion)
+    );
+CREATE INDEX IF NOT EXISTS files_used ON files (used);
+'''
+# Look checksums up this many at a time, within SQLite's parameter limit.
+BATCH_SIZE = 500
+
+
+class FileIndex(object):
+    """The checksums of files scanned clean, by signature version."""
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.path), timeout=60)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(SCHEMA)
+        return db
+
+    def known(self, checksums, sigversion):
+        """Return the subset of checksums recorded as clean under sigversion,
+        marking them as used.
+
+        """
+        checksums = list(checksums)
+        found = set()
+        db = self._connect()
+        try:
+            with db:
+                for n in range(0, len(checksums), BATCH_SIZE):
+                    batch = checksums[n:n + BATCH_SIZE]
+                    found.update(row[0] for row in db.execute(
+                        'SELECT checksum FROM files WHERE sigversion = ?'
+                        ' AND checksum IN ({})'.format(
+                            ','.join('?' * len(batch))),
+                        [sigversion] + batch))
+                db.executemany(
+                    'UPDATE files SET used = ? WHERE checksum = ?'
+                    ' AND sigversion = ?',
+                    [(time.time(), checksum, sigversion)
+                     for checksum in found])
+        finally:
+            db.close()
+        return found
+
+    def add(self, sizes, sigversion):
+        """Record the files whose checksums are the keys of dict sizes as
+        clean under sigversion, and evict the least recently used entries
+        beyond max_entries.
+
+        """
+        db = self._connect()
+        try:
+            with db:
+                now = time.time()
+                db.executemany(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                    [(checksum, sigversion, size, now)
+                     for checksum, size in sizes.items()])
+                db.execute(
+                    'DELETE FROM files WHERE rowid IN (SELECT rowid FROM files'
+                    ' ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                    [self.max_entries])
+        finally:
+            db.close()
+
+
+def get_index():
+    """Return a FileIndex configured from the config module, or None if the
+    index is disabled.
+
+    """
+    if not config.FILE_INDEX_MAX_ENTRIES:
+        return None
+    return FileIndex(config.FILE_INDEX_PATH, config.FILE_INDEX_MAX_ENTRIES)
@@ -38,59 +38,346 @@
 #
 
 import os
+import time
+import uuid
 from flask import (
-    Flask, request, redirect, send_from_directory, url_for, render_template,
+    Flask, Response, abort, jsonify, request, redirect, send_from_directory,
+    url_for, render_template,
     )
 import re
-from . import config
-from .tasks import celery_app, request_scan
+import redis
+from . import (
+    config, metrics, profiling, progress, resultstore, routing, scanpool,
+    tasks, workers,
+    )
 
 app = Flask(__name__)
 # app.config['TRAP_HTTP_EXCEPTIONS'] = True
 # app.config['TRAP_BAD_REQUEST_ERRORS'] = True
-celery_inspect = celery_app.control.inspect()
 
 
 @app.route('/imagescanner')
 def show_form():
-    # TODO: consider storing worker status/state directly in redis
     try:
-        with config.STATUSFILE.open() as fp:
-            status = fp.read()
-    except FileNotFoundError:
-        status = '(No status information available)'
+        jobs = progress.recent_jobs(config.PROGRESS_SHOWN)
+        worker_states = workers.snapshot()
+        queued = {
+            name: workers.queue_length(routing.queue_name(name))
+            for name, _ in config.SIZE_CLASSES}
+        queued['unclassified'] = workers.queue_length('scans')
+    except redis.RedisError:
+        jobs, worker_states, queued = [], None, None
 
     return render_template(
         'form.html',
         channel=os.getenv('DEFAULT_SLACK_CHANNEL', ''),
-        status=status,
+        jobs=jobs,
+        workers=worker_states,
+        queued=queued,
         active=(
             job
-            for worker, jobs in (celery_inspect.active() or {}).items()
-            for job in jobs),
+            for worker in worker_states or ()
+            for job in worker['active']),
         reserved=(
             job
-            for worker, jobs in (celery_inspect.reserved() or {}).items()
-            for job in jobs),
+            for worker in worker_states or ()
+            for job in worker['reserved']),
         )
 
 
 @app.route('/imagescanner', methods=['POST'])
 def process_form():
     # TODO: better sanitize form input
-    request_scan.delay(
-        request.form['repo'],
-        request.form['path'],
-        re.split(r'[\s,]+', request.form['notify']),
-        )
+    tasks.submit_scans([dict(
+        source=request.form['repo'],
+        path=request.form['path'],
+        recipients=re.split(r'[\s,]+', request.form['notify']),
+        )])
     return redirect(url_for('show_form'))
 
 
-@app.route('/imagescanner/result/<string(length=64):hashval>')
-def show_result_log(hashval):
+# The keys of a scan in a batch posted to /imagescanner/api/scans, and
+# whether each is required.
+SCAN_KEYS = {
+    'source': True,
+    'path': False,
+    'recipients': False,
+    'jenkins_job_name': False,
+    'checklist_uuid': False,
+    'profile': False,
+    }
+
+
+def _scan_arguments(item):
+    """Return the request_scan arguments for an item of a batch, with its
+    source and path normalized, or raise ValueError if it is invalid.
+
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Not an object")
+    unknown = set(item) - set(SCAN_KEYS)
+    if unknown:
+        raise ValueError("Unknown keys: {}".format(', '.join(sorted(unknown))))
+    for key, required in SCAN_KEYS.items():
+        if item.get(key) is None:
+            if required:
+                raise ValueError("Missing {}".format(key))
+        elif key == 'recipients':
+            if not (isinstance(item[key], list) and
+                    all(isinstance(r, str) for r in item[key])):
+                raise ValueError("recipients must be a list of strings")
+        elif key == 'profile':
+            if not isinstance(item[key], bool):
+                raise ValueError("profile must be true or false")
+        elif not isinstance(item[key], str):
+            raise ValueError("{} must be a string".format(key))
+
+    source = item['source'].strip()
+    if not tasks.scannable(source):
+        raise ValueError("Unknown source type {}".format(source))
+    if item.get('checklist_uuid') is not None:
+        try:
+            uuid.UUID(item['checklist_uuid'])
+        except ValueError:
+            raise ValueError("checklist_uuid is not a UUID")
+    scan = dict(
+        source=source,
+        path=(item.get('path') or '').strip().strip('/') or None,
+        recipients=[r.strip() for r in item.get('recipients') or ()
+                    if r.strip()],
+        jenkins_job_name=item.get('jenkins_job_name'),
+        checklist_uuid=item.get('checklist_uuid'),
+        )
+    if item.get('profile'):
+        scan['profile'] = True
+    return scan
+
+
+@app.route('/imagescanner/api/scans', methods=['POST'])
+def submit_scans():
+    """Queue a scan for each item of the posted JSON list, an object with a
+    source and optionally a path, recipients, jenkins_job_name,
+    checklist_uuid and profile, as for request_scan.
+
+    Nothing is queued unless every item is valid. Items that repeat the
+    source, path and Jenkins job of an earlier one are not queued again, but
+    have their recipients notified by the earlier one's job. The response
+    gives the job id of each item, in order, with the URL of its status.
+
+    """
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items:
+        abort(400, "Expected a JSON list of scans")
+    if len(items) > config.SCAN_BATCH_MAX:
+        abort(400, "At most {} scans at once".format(config.SCAN_BATCH_MAX))
+
+    errors = []
+    scans = []
+    first = {}
+    jobs = []
+    for n, item in enumerate(items):
+        try:
+            scan = _scan_arguments(item)
+        except ValueError as e:
+            errors.append({'index': n, 'error': str(e)})
+            continue
+        key = (scan['source'], scan['path'], scan['jenkins_job_name'],
+               scan['checklist_uuid'])
+        jobs.append((first.get(key, len(scans)), key in first))
+        if key in first:
+            recipients = scans[first[key]]['recipients']
+            recipients.extend(
+                r for r in scan['recipients'] if r not in recipients)
+            if scan.get('profile'):
+                scans[first[key]]['profile'] = True
+        else:
+            first[key] = len(scans)
+            scans.append(scan)
+    if errors:
+        return jsonify(errors=errors), 400
+
+    job_ids = tasks.submit_scans(scans)
+    return jsonify(jobs=[
+        {
+            'job_id': job_ids[n],
+            'duplicate': duplicate,
+            'status': url_for('show_scan', job_id=job_ids[n], _external=True),
+            }
+        for n, duplicate in jobs]), 202
+
+
+@app.route('/imagescanner/api/scans/<job_id>')
+def show_scan(job_id):
+    """Return the progress of a job queued by submit_scans, and the results
+    recorded for it so far, or for the job it was attached to.
+
+    """
+    job = progress.get_job(job_id)
+    results, _ = resultstore.get_store().query(
+        config.RESULTS_PAGE_MAX,
+        job_id=(job or {}).get('coalesced_into', job_id))
+    if job is None and not results:
+        abort(404)
+    return jsonify(job=job, results=results)
+
+
+def _log_path(hashval):
     if '/' in hashval:
         raise ValueError("Invalid character in hashval")
-    return send_from_directory(
+    return config.LOGS_PATH / ("SecurityValidation-%s.txt" % hashval)
+
+
+def _scan_running(logfile):
+    """Return whether a scan is still writing to logfile."""
+    return scanpool.FileLock(logfile.with_suffix('.lock')).held()
+
+
+@app.route('/imagescanner/result/<string(length=64):hashval>')
+def show_result_log(hashval):
+    """Return a scan log, honouring conditional and Range requests. A
+    finished log may be cached for config.LOG_CACHE_MAX_AGE seconds.
+
+    """
+    logfile = _log_path(hashval)
+    response = send_from_directory(
         config.LOGS_PATH,
-        "SecurityValidation-%s.txt" % hashval,
+        logfile.name,
+        conditional=True,
         )
+    if _scan_running(logfile):
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = config.LOG_CACHE_MAX_AGE
+    return response
+
+
+@app.route('/imagescanner/result/<string(length=64):hashval>/tail')
+def tail_result_log(hashval):
+    """Return what a scan log holds past the byte offset given by the client,
+    up to config.LOG_TAIL_MAX_BYTES at a time.
+
+    If there is nothing new yet, wait for it for up to the number of seconds
+    given by the client, but no more than config.LOG_TAIL_MAX_WAIT, so that
+    an idle client only holds a frontend worker for that long before polling
+    again. The X-Log-Offset header gives the offset to ask for next, and
+    X-Log-Complete whether the scan has finished and the whole log has been
+    returned. Should the log have been restarted by a new scan, X-Log-Reset is
+    set and the log is returned from the start.
+
+    """
+    logfile = _log_path(hashval)
+    offset = max(0, request.args.get('offset', 0, type=int))
+    wait = min(max(0.0, request.args.get('wait', 0, type=float)),
+               config.LOG_TAIL_MAX_WAIT)
+    deadline = time.monotonic() + wait
+    while True:
+        running = _scan_running(logfile)
+        try:
+            size = logfile.stat().st_size
+        except FileNotFoundError:
+            size = None
+        if size is not None and size != offset:
+            break
+        if not running and size is None:
+            abort(404)
+        if not running or time.monotonic() >= deadline:
+            break
+        time.sleep(config.LOG_TAIL_POLL_INTERVAL)
+
+    reset = size is not None and size < offset
+    if reset:
+        offset = 0
+    data = b''
+    if size:
+        with logfile.open('rb') as fd:
+            fd.seek(offset)
+            data = fd.read(config.LOG_TAIL_MAX_BYTES)
+    offset += len(data)
+    response = Response(data, mimetype='text/plain')
+    response.headers['X-Log-Offset'] = str(offset)
+    response.headers['X-Log-Complete'] = str(
+        not running and offset >= (size or 0)).lower()
+    if reset:
+        response.headers['X-Log-Reset'] = 'true'
+    response.cache_control.no_store = True
+    return response
+
+
+@app.route('/imagescanner/profile/<job_id>')
+def show_profile(job_id):
+    """Return the report of a profiled job; see profiling.py."""
+    return send_from_directory(
+        config.LOGS_PATH, profiling.REPORT.format(job_id),
+        mimetype='text/plain')
+
+
+@app.route('/imagescanner/profile/<job_id>/<any(pstats, tracemalloc):kind>')
+def download_profile(job_id, kind):
+    """Return the cProfile statistics or the tracemalloc snapshot of a
+    profiled job, to load with pstats or tracemalloc.
+
+    """
+    name = (profiling.STATS if kind == 'pstats'
+            else profiling.SNAPSHOT).format(job_id)
+    return send_from_directory(
+        config.LOGS_PATH, name, as_attachment=True,
+        mimetype='application/octet-stream')
+
+
+@app.route('/imagescanner/api/results')
+def query_results():
+    """Return recorded scan results as JSON, newest first, filtered by any of
+    the query parameters in resultstore.FILTERS (since and until in seconds
+    since the epoch), up to limit at a time. The next page, if any, is at the
+    URL in next.
+
+    """
+    filters = {
+        name: request.args[name]
+        for name in resultstore.FILTERS if name in request.args}
+    unknown = set(request.args) - set(filters) - {'limit', 'before'}
+    if unknown:
+        abort(400, "Unknown parameters: {}".format(', '.join(sorted(unknown))))
+    try:
+        for name in ('since', 'until'):
+            if name in filters:
+                filters[name] = float(filters[name])
+        limit = int(request.args.get('limit', config.RESULTS_PAGE))
+        before = request.args.get('before')
+        if before is not None:
+            before = int(before)
+    except ValueError as e:
+        abort(400, str(e))
+    if not 0 < limit <= config.RESULTS_PAGE_MAX:
+        abort(400, "limit must be from 1 to {}".format(
+            config.RESULTS_PAGE_MAX))
+
+    results, next_before = resultstore.get_store().query(
+        limit, before, **filters)
+    next_url = None
+    if next_before is not None:
+        next_url = url_for(
+            'query_results', _external=True,
+            **dict(request.args.items(), before=next_before))
+    return jsonify(results=results, next=next_url)
+
+
+@app.route('/imagescanner/metrics')
+def show_metrics():
+    """Return the metrics recorded by every worker, with the depth of each
+    queue, in the Prometheus text format; see metrics.py.
+
+    """
+    # Notifications are sent from Celery's default queue.
+    queues = [routing.queue_name(name) for name, _ in config.SIZE_CLASSES]
+    queues += ['scans', tasks.celery_app.conf.task_default_queue]
+    try:
+        text = metrics.render([
+            (metrics.QUEUE_DEPTH, {'queue': queue},
+             workers.queue_length(queue))
+            for queue in queues])
+    except redis.RedisError as e:
+        abort(503, "Cannot read metrics: {}".format(e))
+    return Response(
+        text, content_type='text/plain; version=0.0.4; charset=utf-8')
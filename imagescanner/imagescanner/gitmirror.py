@@ -0,0 +1,141 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Persistent local mirrors of the git repositories images are scanned from.
+
+Each repository is mirrored once, into a bare partial clone beneath
+config.GIT_MIRRORS_PATH named for its URL, holding its commits and trees but
+no file contents. Later requests for the same repository only fetch what
+changed since. checkout() then writes just the files a request needs into the
+workspace, fetching only their contents, instead of cloning the whole
+repository for every request.
+
+A mirror is locked while it is fetched into and checked out from, so requests
+for one repository wait for each other, on all worker processes of the host.
+
+Servers that do not support partial clones send every file in the first
+fetch; the mirror still saves later requests from fetching them again.
+
+"""
+import hashlib
+import os
+import shutil
+from subprocess import PIPE, run
+from tempfile import TemporaryDirectory
+from . import config
+from .scanpool import FileLock
+
+GIT = '/usr/bin/git'
+GIT_ENV = {"GIT_SSH_COMMAND": " ".join([
+    "ssh",
+    "-i /root/.ssh/id_ed25519",
+    "-o StrictHostKeyChecking=no"])}
+
+
+def _git(*args, **kwargs):
+    kwargs.setdefault('env', GIT_ENV)
+    return run((GIT,) + args, check=True, **kwargs)
+
+
+def mirror_path(url):
+    """Return where the mirror of the repository at url is kept."""
+    key = hashlib.sha256(url.encode()).hexdigest()
+    return os.path.join(str(config.GIT_MIRRORS_PATH), key + '.git')
+
+
+def _update(url, mirror):
+    if not os.path.exists(os.path.join(mirror, 'HEAD')):
+        # Clear away what a clone interrupted before its rename left.
+        shutil.rmtree(mirror + '.tmp', ignore_errors=True)
+        _git('clone', '--quiet', '--bare', '--filter=blob:none',
+             url, mirror + '.tmp')
+        os.rename(mirror + '.tmp', mirror)
+    else:
+        # A bare clone has no fetch refspec of its own, and the partial clone
+        # filter is remembered in the mirror's config.
+        _git('-C', mirror, 'fetch', '--quiet', '--prune', '--force',
+             'origin', '+refs/heads/*:refs/heads/*')
+
+
+def _tree(mirror):
+    """Return the path of every file in HEAD of the repository."""
+    listing = _git('-C', mirror, 'ls-tree', '-r', '-z', '--full-tree',
+                   'HEAD', stdout=PIPE).stdout.decode()
+    paths = []
+    for entry in listing.split('\0'):
+        if entry:
+            info, path = entry.split('\t', 1)
+            if info.split()[1] == 'blob':
+                paths.append(path)
+    return paths
+
+
+def checkout(url, dest, select):
+    """Update the mirror of the repository at url, and write into directory
+    dest each file in its HEAD for which select(path) is true, where path is
+    relative to the top of the repository. Return the paths written.
+
+    Return None, and write nothing, if the repository has submodules, which a
+    mirror does not follow; the caller should clone it recursively instead.
+
+    """
+    os.makedirs(str(config.GIT_MIRRORS_PATH), exist_ok=True)
+    mirror = mirror_path(url)
+    lock = FileLock(mirror + '.lock')
+    lock.acquire()
+    try:
+        _update(url, mirror)
+        tree = _tree(mirror)
+        if '.gitmodules' in tree:
+            return None
+        paths = [path for path in tree if select(path)]
+        os.makedirs(dest, exist_ok=True)
+        if paths:
+            # Check out into dest with an index of its own, leaving the
+            # mirror untouched but for the file contents fetched for it. The
+            # paths are literal, not patterns that may match others.
+            with TemporaryDirectory() as tmp:
+                env = dict(GIT_ENV, GIT_INDEX_FILE=os.path.join(tmp, 'index'),
+                           GIT_LITERAL_PATHSPECS='1')
+                _git('--git-dir', mirror, '--work-tree', dest,
+                     'checkout', 'HEAD', '--pathspec-from-file=-',
+                     '--pathspec-file-nul',
+                     input='\0'.join(paths).encode(), env=env)
+        return paths
+    finally:
+        lock.release()
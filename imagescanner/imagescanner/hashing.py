@@ -0,0 +1,159 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Checksumming of disk images, using large reusable buffers.
+
+Images are commonly many gigabytes, so hashing them a few kilobytes at a time
+spends more time in the Python interpreter than in the hash function. These
+helpers read a megabyte at a time into a single preallocated buffer, and can
+hash a stream while it is being copied to disk, saving a second pass over the
+file. Gzipped images can likewise be decompressed while they are copied,
+hashing both the compressed and the decompressed data in the same pass.
+
+"""
+import hashlib
+import os
+import zlib
+
+BUFFER_SIZE = 1024 * 1024
+# zlib window bits value selecting the gzip container format.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def copy_and_hash(src, dst, bufsize=BUFFER_SIZE):
+    """Copy binary stream src to binary stream dst, and return the SHA256
+    checksum of the data copied.
+
+    src must support readinto(), as files and urllib3 responses do.
+
+    """
+    h = hashlib.sha256()
+    buf = bytearray(bufsize)
+    view = memoryview(buf)
+    while True:
+        size = src.readinto(buf)
+        if not size:
+            break
+        h.update(view[:size])
+        dst.write(view[:size])
+    return h.hexdigest()
+
+
+def sha256_file(path, bufsize=BUFFER_SIZE):
+    """Return the SHA256 checksum of the file at path."""
+    h = hashlib.sha256()
+    buf = bytearray(bufsize)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as fd:
+        while True:
+            size = fd.readinto(buf)
+            if not size:
+                break
+            h.update(view[:size])
+    return h.hexdigest()
+
+
+class GunzipHasher(object):
+    """Decompress gzipped data fed to update() into binary stream dst, hashing
+    both the compressed and the decompressed data. finish() returns the two
+    SHA256 checksums.
+
+    """
+
+    def __init__(self, dst, bufsize=BUFFER_SIZE):
+        self.dst = dst
+        self.bufsize = bufsize
+        self.compressed = hashlib.sha256()
+        self.decompressed = hashlib.sha256()
+        self.decompressor = zlib.decompressobj(GZIP_WBITS)
+        self.started = False
+
+    def update(self, data):
+        self.compressed.update(data)
+        while True:
+            # Limit the output of each step, since a megabyte of a sparse
+            # disk image can decompress to gigabytes.
+            output = self.decompressor.decompress(data, self.bufsize)
+            self.started = True
+            self.decompressed.update(output)
+            self.dst.write(output)
+            if self.decompressor.eof:
+                # A gzip file may consist of several concatenated members.
+                data = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(GZIP_WBITS)
+                self.started = False
+                if not data:
+                    break
+            else:
+                data = self.decompressor.unconsumed_tail
+                if not data and len(output) < self.bufsize:
+                    break
+
+    def finish(self):
+        if self.started:
+            raise ValueError("Truncated gzip stream")
+        return self.compressed.hexdigest(), self.decompressed.hexdigest()
+
+
+def copy_and_hash_gunzip(src, dst, bufsize=BUFFER_SIZE):
+    """Decompress gzipped binary stream src into binary stream dst, and return
+    the SHA256 checksums of the compressed and of the decompressed data.
+
+    """
+    gunzip = GunzipHasher(dst, bufsize)
+    buf = bytearray(bufsize)
+    view = memoryview(buf)
+    while True:
+        size = src.readinto(buf)
+        if not size:
+            break
+        gunzip.update(view[:size])
+    return gunzip.finish()
+
+
+def gunzip_file(path, bufsize=BUFFER_SIZE):
+    """Replace the gzipped file at path, which must end in .gz, with its
+    decompressed contents, and return the SHA256 checksums of the compressed
+    and of the decompressed file.
+
+    """
+    with open(path, 'rb', buffering=0) as src:
+        with open(path[:-len('.gz')], 'wb') as dst:
+            checksums = copy_and_hash_gunzip(src, dst, bufsize)
+    os.remove(path)
+    return checksums
@@ -0,0 +1,266 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+#
+"""Metrics of where the time of scanning goes, recorded by the workers and by
+imagescanner-image on every node, aggregated in Redis, and rendered by the
+frontend in the Prometheus text format at /imagescanner/metrics.
+
+Counters and histograms are kept in the Redis hash imagescanner:metrics, one
+field per sample, such as
+
+    imagescanner_stage_seconds_bucket{stage="scan",le="60"}
+
+and each observation increments the fields it counts toward, in one round
+trip, so the hash always holds the totals of every process. Histogram buckets
+are counted cumulatively, as Prometheus expects them.
+
+Gauges, such as how many images are being scanned, cannot be summed that way
+without a process that dies leaving its part behind; so each process reports
+its own, to the hash imagescanner:metrics:gauges, when they change and every
+config.METRICS_INTERVAL seconds, and the frontend adds up those reported
+within config.METRICS_STALE_AFTER seconds, forgetting the rest.
+
+Metrics are a convenience: if Redis cannot be reached, observations are
+dropped, and the scans carry on.
+
+"""
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+import redis
+from . import config
+from .redisconn import get_redis
+
+METRICS_KEY = 'imagescanner:metrics'
+GAUGES_KEY = 'imagescanner:metrics:gauges'
+
+STAGE_SECONDS = 'imagescanner_stage_seconds'
+STAGE_BYTES = 'imagescanner_stage_bytes_total'
+CACHE_LOOKUPS = 'imagescanner_cache_lookups_total'
+SCANS_IN_FLIGHT = 'imagescanner_scans_in_flight'
+QUEUE_DEPTH = 'imagescanner_queue_depth'
+
+# The type and help text of each metric, in the order they are rendered.
+METRICS = OrderedDict([
+    (STAGE_SECONDS, ('histogram', "Seconds spent in each stage of a scan.")),
+    (STAGE_BYTES, ('counter', "Bytes of images processed by each stage.")),
+    (CACHE_LOOKUPS, ('counter', "Lookups in each cache, by result.")),
+    (SCANS_IN_FLIGHT, ('gauge', "Images being scanned.")),
+    (QUEUE_DEPTH, ('gauge', "Scan requests waiting in each queue.")),
+    ])
+
+_SAMPLE_RE = re.compile(r'(?P<name>\w+?)(?P<suffix>_bucket|_sum|_count)?'
+                        r'(?:\{(?P<labels>.*)\})?$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+def _sample(name, labels):
+    """Return the name of the sample of metric name with labels, a dict, as
+    it appears in the Prometheus text format.
+
+    """
+    if not labels:
+        return name
+    return '{}{{{}}}'.format(name, ','.join(
+        '{}="{}"'.format(key, _escape(value))
+        for key, value in sorted(labels.items())))
+
+
+def _le(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _execute(pipe):
+    try:
+        pipe.execute()
+    except redis.RedisError as e:
+        print("Cannot record metrics: {}".format(e), file=sys.stderr)
+
+
+def observe(stages, nbytes=None, client=None):
+    """Record the seconds spent in each of stages, a dict by stage name, and
+    if given, the bytes each processed.
+
+    """
+    client = client or get_redis()
+    pipe = client.pipeline(transaction=False)
+    for stage, seconds in stages.items():
+        labels = {'stage': stage}
+        # Every bucket, so that each appears from the first observation.
+        for bound in config.METRICS_BUCKETS + [float('inf')]:
+            pipe.hincrby(METRICS_KEY, _sample(
+                STAGE_SECONDS + '_bucket', dict(labels, le=_le(bound))),
+                int(seconds <= bound))
+        pipe.hincrbyfloat(
+            METRICS_KEY, _sample(STAGE_SECONDS + '_sum', labels), seconds)
+        pipe.hincrby(
+            METRICS_KEY, _sample(STAGE_SECONDS + '_count', labels), 1)
+        if nbytes is not None:
+            pipe.hincrby(METRICS_KEY, _sample(STAGE_BYTES, labels), nbytes)
+    _execute(pipe)
+
+
+def count(name, amount=1, client=None, **labels):
+    """Add amount to the counter name with labels."""
+    pipe = (client or get_redis()).pipeline(transaction=False)
+    pipe.hincrby(METRICS_KEY, _sample(name, labels), amount)
+    _execute(pipe)
+
+
+class _Gauges(object):
+    """This process's gauges, reported every config.METRICS_INTERVAL seconds
+    by a thread of its own once one has been set.
+
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.ident = '{}:{}'.format(socket.gethostname(), self.pid)
+        self.values = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add(self, sample, amount):
+        with self.lock:
+            self.values[sample] = self.values.get(sample, 0) + amount
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name='metrics', daemon=True)
+                self.thread.start()
+        self.report()
+
+    def report(self):
+        with self.lock:
+            values = dict(self.values)
+        now = time.time()
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hset(GAUGES_KEY, mapping={
+            sample + '|' + self.ident: json.dumps([value, now])
+            for sample, value in values.items()})
+        _execute(pipe)
+
+    def _run(self):
+        # Until another takes its place.
+        while _gauges is self:
+            time.sleep(config.METRICS_INTERVAL)
+            self.report()
+
+
+_gauges = None
+_gauges_lock = threading.Lock()
+
+
+def gauge_add(name, amount, **labels):
+    """Add amount, which may be negative, to this process's part of the gauge
+    name with labels.
+
+    """
+    global _gauges
+    with _gauges_lock:
+        # A forked process starts its own gauges, and its own thread.
+        if _gauges is None or _gauges.pid != os.getpid():
+            _gauges = _Gauges()
+        gauges = _gauges
+    gauges.add(_sample(name, labels), amount)
+
+
+def _gauge_totals(client):
+    """Return the sum of every process's part of each gauge sample, leaving
+    out, and forgetting, those not reported recently.
+
+    """
+    now = time.time()
+    totals = {}
+    stale = []
+    for field, value in client.hgetall(GAUGES_KEY).items():
+        sample, _, ident = field.rpartition('|')
+        value, when = json.loads(value)
+        if now - when > config.METRICS_STALE_AFTER:
+            stale.append(field)
+            continue
+        totals[sample] = totals.get(sample, 0) + value
+    if stale:
+        client.hdel(GAUGES_KEY, *stale)
+    return totals
+
+
+def render(gauges=(), client=None):
+    """Return every metric in the Prometheus text format, with gauges, a
+    list of the name, labels and value of further gauge samples, such as
+    those the frontend reads from the broker.
+
+    """
+    client = client or get_redis()
+    samples = dict(client.hgetall(METRICS_KEY))
+    samples.update(_gauge_totals(client))
+    samples.update(
+        (_sample(name, labels), value) for name, labels, value in gauges)
+
+    families = OrderedDict((name, []) for name in METRICS)
+    for sample, value in samples.items():
+        mo = _SAMPLE_RE.match(sample)
+        if mo is None or mo.group('name') not in families:
+            continue
+        labels = OrderedDict(_LABEL_RE.findall(mo.group('labels') or ''))
+        le = labels.pop('le', None)
+        families[mo.group('name')].append((
+            sorted(labels.items()),
+            ['_bucket', '_sum', '_count'].index(mo.group('suffix'))
+            if mo.group('suffix') else 0,
+            float(le) if le is not None else 0.0,
+            sample, value))
+
+    lines = []
+    for name, family in families.items():
+        kind, help_text = METRICS[name]
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for _, _, _, sample, value in sorted(family):
+            lines.append('{} {}'.format(sample, value))
+    return '\n'.join(lines) + '\n'
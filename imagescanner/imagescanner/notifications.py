@@ -0,0 +1,263 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Delivery of Slack and Jenkins notifications, shared by the tasks that send
+them.
+
+A Dispatcher delivers notifications concurrently, on a pool of threads, while
+pacing the requests to each host to at most its rate in config.NOTIFY_RATES.
+A delivery that fails in a way that may not last, such as a dropped
+connection, a server error or a 429 response, is retried with exponential
+backoff, or after the response's Retry-After, which also holds back every
+other delivery to the host meanwhile. A notification that still cannot be
+delivered is kept as a dead letter in the Redis list imagescanner:deadletters
+for someone to look into.
+
+Jenkins clients are kept for the life of the process, with the CSRF crumb
+each fetches on its first request, rather than built for each notification.
+
+"""
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import redis
+import requests
+from . import config
+from .redisconn import get_redis
+from .sessions import get_session
+
+DEAD_LETTERS_KEY = 'imagescanner:deadletters'
+
+
+class Retry(Exception):
+    """A delivery failed, but may succeed if retried; if delay is not None,
+    after that many seconds.
+
+    """
+
+    def __init__(self, message, delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+class Endpoint(object):
+    """Paces the requests to one host to at most rate per second, if rate is
+    not None.
+
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next = 0.0
+
+    def wait(self):
+        """Wait until a request may be made, and count it as made."""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next)
+            self.next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds):
+        """Make no requests for the next seconds."""
+        with self.lock:
+            self.next = max(self.next, time.monotonic() + seconds)
+
+
+class Dispatcher(object):
+    """Delivers notifications on up to concurrency threads at once."""
+
+    def __init__(self, concurrency, retries, backoff, max_backoff, rates):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rates = rates
+        self.endpoints = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(concurrency)
+
+    def endpoint(self, host):
+        with self.lock:
+            if host not in self.endpoints:
+                self.endpoints[host] = Endpoint(self.rates.get(host))
+            return self.endpoints[host]
+
+    def submit(self, host, send, notification):
+        """Deliver a notification to host by calling send, which raises Retry
+        if it may succeed later, or any other exception if it never will.
+        Return a Future that is true once it is delivered, or false if it was
+        recorded as a dead letter, with the dict notification describing it.
+
+        """
+        return self.executor.submit(self._deliver, host, send, notification)
+
+    def _deliver(self, host, send, notification):
+        endpoint = self.endpoint(host)
+        backoff = self.backoff
+        for attempt in range(self.retries + 1):
+            endpoint.wait()
+            try:
+                send()
+                return True
+            except Retry as e:
+                error = e
+                if e.delay is not None:
+                    endpoint.pause(min(e.delay, self.max_backoff))
+                    continue
+            except Exception as e:
+                error = e
+                break
+            if attempt < self.retries:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        dead_letter(notification, error)
+        return False
+
+
+_lock = threading.Lock()
+_dispatcher = None
+_jenkins = None
+_pid = None
+
+
+def _forget_parent():
+    """Forget the dispatcher and client of a parent process, whose threads
+    and connections a forked child does not share.
+
+    """
+    global _dispatcher, _jenkins, _pid
+    if _pid != os.getpid():
+        _dispatcher = _jenkins = None
+        _pid = os.getpid()
+
+
+def get_dispatcher():
+    """Return this process's Dispatcher, configured from the config module."""
+    global _dispatcher
+    with _lock:
+        _forget_parent()
+        if _dispatcher is None:
+            _dispatcher = Dispatcher(
+                config.NOTIFY_CONCURRENCY, config.NOTIFY_RETRIES,
+                config.NOTIFY_BACKOFF, config.NOTIFY_MAX_BACKOFF,
+                config.NOTIFY_RATES)
+        return _dispatcher
+
+
+def dead_letter(notification, error, client=None):
+    """Record a notification that could not be delivered, and why."""
+    letter = dict(notification, time=time.time(), error="{}: {}".format(
+        type(error).__name__, error))
+    print("Cannot deliver notification: {}".format(json.dumps(letter)),
+          file=sys.stderr)
+    try:
+        pipe = (client or get_redis()).pipeline(transaction=False)
+        pipe.lpush(DEAD_LETTERS_KEY, json.dumps(letter))
+        pipe.ltrim(DEAD_LETTERS_KEY, 0, config.DEAD_LETTERS - 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        print("Cannot record dead letter: {}".format(e), file=sys.stderr)
+
+
+def dead_letters(count, client=None):
+    """Return up to count of the latest dead letters, newest first."""
+    return [json.loads(letter) for letter in (client or get_redis()).lrange(
+        DEAD_LETTERS_KEY, 0, count - 1)]
+
+
+def _retry_after(response):
+    try:
+        return max(0.0, float(response.headers['Retry-After']))
+    except (KeyError, ValueError):
+        return None
+
+
+def post(url, payload):
+    """Post payload as JSON to url, raising Retry on failures that may not
+    last.
+
+    """
+    try:
+        r = get_session(url).post(url, json=payload,
+                                  timeout=config.NOTIFY_TIMEOUT)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise Retry(str(e))
+    if r.status_code == 429 or r.status_code >= 500:
+        raise Retry("{} {}".format(r.status_code, r.reason),
+                    _retry_after(r))
+    r.raise_for_status()
+
+
+def host(url):
+    return urlsplit(url).hostname
+
+
+def get_jenkins():
+    """Return this process's Jenkins client, configured by config.JENKINS."""
+    # The frontend does not need the jenkins library, so import it only here.
+    from jenkins import Jenkins
+    global _jenkins
+    with _lock:
+        _forget_parent()
+        if _jenkins is None:
+            _jenkins = Jenkins(**dict(
+                {'timeout': config.NOTIFY_TIMEOUT}, **config.JENKINS))
+        return _jenkins
+
+
+def build_job(name, parameters):
+    """Build the Jenkins job name with parameters, raising Retry on failures
+    that may not last.
+
+    """
+    import jenkins
+    server = get_jenkins()
+    try:
+        server.build_job(name, parameters)
+    except jenkins.NotFoundException:
+        raise
+    except (jenkins.JenkinsException, requests.RequestException) as e:
+        # Fetch a new crumb for the next attempt, should this one be stale.
+        server.crumb = None
+        raise Retry(str(e))
@@ -0,0 +1,232 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Differential scanning of qcow2 overlays whose base image is known clean.
+
+A qcow2 overlay stores only the clusters written since it was created from its
+backing file; every other cluster is read from the base image. If the base has
+already been scanned clean under the current signature database, only files
+whose data lies, at least partly, in clusters allocated in the overlay itself
+can hold anything new, and only those need be scanned.
+
+qemu-img map tells which ranges of the virtual disk the overlay allocates, and
+the FIEMAP ioctl where on its partition each file's data lies. Files whose
+extents cannot be determined, or that are stored inline or encoded, are
+scanned anyway.
+
+An overlay cannot be read at all without its backing file, so request_scan
+keeps each qcow2 image it has finished with until the end of the job, in case
+an overlay retrieved later is based on it, with its checksum beside it so that
+the base need not be checksummed again for each overlay.
+
+"""
+import array
+import bisect
+import fcntl
+import json
+import os
+import struct
+from subprocess import run, PIPE
+from . import resultcache
+from .hashing import sha256_file
+
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQLLLL')
+FIEMAP_EXTENT = struct.Struct('=QQQQQLLLL')
+FIEMAP_EXTENT_LAST = 0x1
+# Extents whose location on the device does not say where their data lies.
+FIEMAP_EXTENT_OPAQUE = (
+    0x2      # FIEMAP_EXTENT_UNKNOWN
+    | 0x8    # FIEMAP_EXTENT_ENCODED
+    | 0x80   # FIEMAP_EXTENT_DATA_ENCRYPTED
+    | 0x200  # FIEMAP_EXTENT_DATA_INLINE
+    | 0x400  # FIEMAP_EXTENT_DATA_TAIL
+    )
+# How many extents to ask FIEMAP for at a time.
+EXTENT_BATCH = 64
+QCOW2_MAGIC = b'QFI\xfb'
+# Appended to the path of a kept image to name the file holding its checksum.
+CHECKSUM_SUFFIX = '.sha256'
+
+
+def _qemu_img(*args):
+    result = run(('qemu-img',) + args, stdout=PIPE, universal_newlines=True,
+                 check=True)
+    return json.loads(result.stdout)
+
+
+def backing_file(image):
+    """Return the path of the backing file of the qcow2 image, or None."""
+    info = _qemu_img('info', '--output=json', image)
+    return info.get('full-backing-filename') or info.get('backing-filename')
+
+
+def is_qcow2(path):
+    """Return whether the file at path is a qcow image."""
+    try:
+        with open(path, 'rb') as fd:
+            return fd.read(len(QCOW2_MAGIC)) == QCOW2_MAGIC
+    except OSError:
+        return False
+
+
+def keep_as_base(path, checksum):
+    """Record checksum, under which the scan result of the image at path is
+    cached, for overlays on the image to look up.
+
+    """
+    with open(path + CHECKSUM_SUFFIX, 'w') as fd:
+        fd.write(checksum + '\n')
+
+
+def base_checksum(base):
+    """Return the checksum of the image at base, as recorded by keep_as_base
+    if it was since the image last changed, or else computed.
+
+    """
+    try:
+        if (os.path.getmtime(base + CHECKSUM_SUFFIX)
+                >= os.path.getmtime(base)):
+            with open(base + CHECKSUM_SUFFIX) as fd:
+                return fd.read().strip()
+    except OSError:
+        pass
+    return sha256_file(base)
+
+
+def base_result(image):
+    """Return (base path, base checksum, signature version) if image is an
+    overlay whose backing file has been scanned clean under the current
+    signature database, or None.
+
+    """
+    base = backing_file(image)
+    if not base:
+        return None
+    base = os.path.join(os.path.dirname(image), base)
+    sigversion = resultcache.signature_version()
+    if not os.path.isfile(base) or sigversion is None:
+        return None
+    checksum = base_checksum(base)
+    cached = resultcache.get_cache().get(checksum, sigversion)
+    if cached is None or cached['returncode'] != 0:
+        return None
+    return base, checksum, sigversion
+
+
+def allocated_ranges(image):
+    """Return the sorted, merged (start, end) byte ranges of the virtual disk
+    that the overlay image allocates itself, rather than reading from its
+    backing file. Clusters the overlay zeroes count as allocated.
+
+    """
+    ranges = []
+    for extent in _qemu_img('map', '--output=json', image):
+        if extent['depth'] != 0 or not (extent['data'] or extent['zero']):
+            continue
+        start, end = extent['start'], extent['start'] + extent['length']
+        if ranges and ranges[-1][1] >= start:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return [tuple(r) for r in ranges]
+
+
+def extents(path):
+    """Generate the (physical offset, length) of each extent of the file at
+    path, on its device. Raise OSError if FIEMAP is not supported, and
+    ValueError for an extent that has no meaningful location.
+
+    """
+    start = 0
+    with open(path, 'rb') as fd:
+        while True:
+            buf = array.array('B', bytes(
+                FIEMAP_HEADER.size + EXTENT_BATCH * FIEMAP_EXTENT.size))
+            FIEMAP_HEADER.pack_into(
+                buf, 0, start, 2 ** 64 - 1 - start, 0, 0, EXTENT_BATCH, 0)
+            fcntl.ioctl(fd, FS_IOC_FIEMAP, buf)
+            mapped = FIEMAP_HEADER.unpack_from(buf)[3]
+            if not mapped:
+                return
+            for n in range(mapped):
+                (logical, physical, length, _, _, flags,
+                 _, _, _) = FIEMAP_EXTENT.unpack_from(
+                     buf, FIEMAP_HEADER.size + n * FIEMAP_EXTENT.size)
+                if flags & FIEMAP_EXTENT_OPAQUE:
+                    raise ValueError(
+                        "Extent at {} of {} has flags {:#x}".format(
+                            logical, path, flags))
+                yield physical, length
+                if flags & FIEMAP_EXTENT_LAST:
+                    return
+            start = logical + length
+
+
+def _overlaps(ranges, start, end):
+    n = bisect.bisect_right(ranges, (start, float('inf')))
+    return (n > 0 and ranges[n - 1][1] > start) or (
+        n < len(ranges) and ranges[n][0] < end)
+
+
+def changed_files(root, ranges, offset):
+    """Return the regular files beneath root that may have data in ranges,
+    where root is the mountpoint of a partition starting offset bytes into
+    the virtual disk.
+
+    """
+    changed = []
+    for dirpath, dirs, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            if not os.path.isfile(path) or os.path.islink(path):
+                continue
+            try:
+                located = list(extents(path))
+            except (OSError, ValueError):
+                changed.append(path)
+                continue
+            if not located and os.path.getsize(path):
+                # Data in the file's metadata, or all holes; metadata is not
+                # tracked, so scan it anyway.
+                changed.append(path)
+            elif any(_overlaps(ranges, offset + physical,
+                               offset + physical + length)
+                     for physical, length in located):
+                changed.append(path)
+    return changed
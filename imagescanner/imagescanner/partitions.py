@@ -0,0 +1,367 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Mount and scan the partitions of a disk image concurrently.
+
+imagescanner-image connects a qcow image to an NBD device, or uses a raw image
+file directly, and then runs:
+
+    python3 -m imagescanner.partitions DEVICE MOUNTPOINT
+
+which maps DEVICE's partitions with kpartx, mounts each read-only on its own
+directory beneath MOUNTPOINT, scans them up to config.PARTITION_CONCURRENCY at
+a time, and removes the mappings again. The output of each partition's scan is
+written to stdout in partition order, as if the partitions had been scanned
+one after another.
+
+The exit status is that of the last partition, in partition order, whose scan
+reported a failure, or 0 if none did; this matches the former shell loop. If
+every scan reached a verdict, the log ends with it, which the result cache
+relies on to tell infected images from failures; see resultcache.
+
+    python3 -m imagescanner.partitions --overlay IMAGE DEVICE MOUNTPOINT
+
+does the same for the qcow2 image IMAGE connected to DEVICE, except that if
+IMAGE is an overlay whose base image has been scanned clean, only the files
+with data in the overlay are scanned; see overlay.
+
+    python3 -m imagescanner.partitions --directory DIRECTORY
+
+scans a single directory, such as a mounted ISO image, with the configured
+scanning backend.
+
+"""
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from subprocess import run, CalledProcessError, PIPE, STDOUT
+from tempfile import NamedTemporaryFile
+from . import clamd, config, fileindex, metrics, overlay, resultcache
+from .hashing import sha256_file
+
+
+def list_partitions(device):
+    """Create device-mapper mappings for the partitions of device, and return
+    their names.
+
+    """
+    result = run(['kpartx', '-ravs', device], stdout=PIPE,
+                 universal_newlines=True, check=True)
+    # Lines look like: add map nbd0p1 (253:0): 0 204800 linear 43:0 2048
+    names = [line.split()[2] for line in result.stdout.splitlines()
+             if len(line.split()) > 2]
+    return [name for name in names if os.path.exists('/dev/mapper/' + name)]
+
+
+def remove_partitions(device, partitions):
+    """Remove the mappings created by list_partitions. Inside a container,
+    kpartx -d alone does not always remove them.
+
+    """
+    if partitions:
+        run(['dmsetup', 'remove'] + partitions)
+    run(['kpartx', '-vd', device])
+
+
+def mount(partition, mountpoint):
+    start = time.monotonic()
+    result = run(['mount', '-o', 'ro', '/dev/mapper/' + partition, mountpoint],
+                 stdout=PIPE, stderr=STDOUT, universal_newlines=True)
+    metrics.observe({'mount': time.monotonic() - start})
+    return result
+
+
+def umount(mountpoint):
+    return run(['umount', mountpoint], stdout=PIPE, stderr=STDOUT,
+               universal_newlines=True)
+
+
+def scan_directory(path, only=None):
+    """Scan the files beneath path, or only those in the collection only, and
+    return the scanner's exit code and output, recording the time it took
+    as the metrics' 'clamav' stage.
+
+    config.SCAN_BACKEND selects between 'clamd' and 'clamscan'; clamscan is
+    used if clamd cannot be reached.
+
+    Unless the file index is disabled, files already scanned clean under the
+    current signature database are skipped, and files found clean are added
+    to the index; see fileindex. Should the index fail, every file is
+    scanned.
+
+    """
+    start = time.monotonic()
+    try:
+        return _scan_directory(path, only)
+    finally:
+        metrics.observe({'clamav': time.monotonic() - start})
+
+
+def _scan_directory(path, only):
+    index = fileindex.get_index()
+    sigversion = resultcache.signature_version() if index else None
+    if sigversion is None and only is not None:
+        status, output, clean = scan_files(sorted(only))
+        return status, output
+    if sigversion is None:
+        fallback = ''
+        if config.SCAN_BACKEND == 'clamd':
+            try:
+                return clamd.scan_directory(path)
+            except clamd.ClamdError as e:
+                fallback = "{}; falling back to clamscan.\n".format(e)
+        result = run(['clamscan', '-r', path], stdout=PIPE, stderr=STDOUT,
+                     universal_newlines=True)
+        return result.returncode, fallback + result.stdout
+
+    files = _checksum_files(path, only)
+    notes = ''
+    try:
+        known = index.known(
+            {checksum for checksum, size in files.values()}, sigversion)
+    except (sqlite3.Error, OSError) as e:
+        # The index only saves work: without it, scan every file.
+        known = set()
+        notes += "File index unavailable: {}; scanning every file.\n".format(e)
+    todo = sorted(
+        filename for filename, (checksum, size) in files.items()
+        if checksum not in known)
+    skipped = [size for checksum, size in files.values() if checksum in known]
+    metrics.count(metrics.CACHE_LOOKUPS, len(skipped), cache='file_index',
+                  result='hit')
+    metrics.count(metrics.CACHE_LOOKUPS, len(todo), cache='file_index',
+                  result='miss')
+    status, output, clean = scan_files(todo)
+    # The scanner may spell the paths it reports differently.
+    files = {os.path.normpath(filename): entry
+             for filename, entry in files.items()}
+    clean = [os.path.normpath(filename) for filename in clean]
+    try:
+        index.add(dict(files[filename] for filename in clean
+                       if filename in files), sigversion)
+    except (sqlite3.Error, OSError) as e:
+        notes += "Cannot record clean files in the file index: {}\n".format(
+            e)
+    return status, notes + output + (
+        "Skipped files: {} ({} bytes) already scanned clean under signature"
+        " version {}\n".format(len(skipped), sum(skipped), sigversion))
+
+
+def _checksum_files(path, only=None):
+    """Return a dict mapping the path of every regular file beneath path, or
+    of those in only, to its checksum and size, checksumming up to
+    config.FILE_INDEX_HASHERS files at once. Files that cannot be read are
+    left out, to be scanned anyway.
+
+    """
+    filenames = []
+    for root, dirs, names in os.walk(path):
+        for name in names:
+            filename = os.path.join(root, name)
+            if only is not None and filename not in only:
+                continue
+            if os.path.isfile(filename) and not os.path.islink(filename):
+                filenames.append(filename)
+
+    def checksum(filename):
+        try:
+            return sha256_file(filename), os.path.getsize(filename)
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(config.FILE_INDEX_HASHERS) as executor:
+        return {
+            filename: result
+            for filename, result in zip(
+                filenames, executor.map(checksum, filenames))
+            if result}
+
+
+def scan_files(filenames):
+    """Scan each of filenames, and return the scanner's exit code and output,
+    and the files found clean.
+
+    """
+    if not filenames:
+        return 0, "No files to scan.\n", []
+    fallback = ''
+    if config.SCAN_BACKEND == 'clamd':
+        try:
+            return clamd.scan_files(filenames)
+        except clamd.ClamdError as e:
+            fallback = "{}; falling back to clamscan.\n".format(e)
+    with NamedTemporaryFile('w') as filelist:
+        filelist.write(''.join(name + '\n' for name in filenames))
+        filelist.flush()
+        result = run(['clamscan', '--file-list=' + filelist.name],
+                     stdout=PIPE, stderr=STDOUT, universal_newlines=True)
+    # clamscan lists every file it scanned, clean ones as "<path>: OK".
+    clean = [line[:-len(': OK')] for line in result.stdout.splitlines()
+             if line.endswith(': OK')]
+    return result.returncode, fallback + result.stdout, clean
+
+
+def partition_offset(partition):
+    """Return the offset in bytes of a mapped partition on its device."""
+    result = run(['dmsetup', 'table', partition], stdout=PIPE,
+                 universal_newlines=True, check=True)
+    # The table looks like: 0 204800 linear 43:0 2048
+    return int(result.stdout.split()[4]) * 512
+
+
+def scan_partition(partition, mountpoint, ranges=None):
+    """Mount, scan and unmount one partition, and return its exit code and the
+    log of doing so.
+
+    If ranges is given, only the files with data in those byte ranges of the
+    device are scanned; see overlay.
+
+    """
+    mountpoint.mkdir(parents=True, exist_ok=True)
+    log = ["Mounting partition {}...\n".format(partition)]
+    result = mount(partition, str(mountpoint))
+    log.append(result.stdout)
+    if result.returncode != 0:
+        log.append("Error: could not mount {}\n".format(partition))
+        mountpoint.rmdir()
+        return result.returncode, ''.join(log)
+    try:
+        if ranges is None:
+            log.append(
+                "Scanning mounted partition {}...\n".format(partition))
+            status, output = scan_directory(str(mountpoint))
+        else:
+            changed = overlay.changed_files(
+                str(mountpoint), ranges, partition_offset(partition))
+            log.append(
+                "Scanning {} files of mounted partition {} with data in the"
+                " overlay...\n".format(len(changed), partition))
+            status, output = scan_directory(str(mountpoint), set(changed))
+        log.append(output)
+    finally:
+        log.append("Unmounting {}...\n".format(partition))
+        log.append(umount(str(mountpoint)).stdout)
+        mountpoint.rmdir()
+    return status, ''.join(log)
+
+
+def scan_partitions(partitions, mountpoint_root, concurrency, out,
+                    ranges=None):
+    """Scan each partition on its own mountpoint, writing the log of each to
+    out in partition order, then the verdict, and return the overall exit
+    status.
+
+    ranges is passed on to scan_partition.
+
+    """
+    status = 0
+    returncodes = []
+    with ThreadPoolExecutor(max(1, concurrency)) as executor:
+        futures = [
+            executor.submit(scan_partition, partition,
+                            mountpoint_root / partition, ranges)
+            for partition in partitions]
+        for future in futures:
+            returncode, log = future.result()
+            out.write(log)
+            out.flush()
+            returncodes.append(returncode)
+            if returncode != 0:
+                status = returncode
+    resultcache.write_verdict(out, returncodes)
+    return status
+
+
+def differential_ranges(image, out):
+    """Return the byte ranges of the virtual disk to which a differential
+    scan of image can be limited, or None if it must be scanned in full,
+    logging why to out.
+
+    """
+    if not config.DIFFERENTIAL_SCAN:
+        return None
+    try:
+        base = overlay.base_result(image)
+    except (OSError, ValueError, CalledProcessError) as e:
+        out.write("Cannot inspect backing chain of {}: {}\n".format(image, e))
+        return None
+    if base is None:
+        return None
+    try:
+        ranges = overlay.allocated_ranges(image)
+    except (OSError, ValueError, KeyError, CalledProcessError) as e:
+        out.write("Cannot map clusters of {}: {}\n".format(image, e))
+        return None
+    path, checksum, sigversion = base
+    out.write(
+        "Differential scan: relying on the clean result for base image {}"
+        " (SHA256 checksum {}, signature version {}); scanning only files"
+        " with data in the {} bytes the overlay allocates.\n".format(
+            path, checksum, sigversion,
+            sum(end - start for start, end in ranges)))
+    out.flush()
+    return ranges
+
+
+def main(argv):
+    if argv[0] == '--directory':
+        status, output = scan_directory(argv[1])
+        sys.stdout.write(output)
+        resultcache.write_verdict(sys.stdout, [status])
+        return status
+
+    ranges = None
+    if argv[0] == '--overlay':
+        ranges = differential_ranges(argv[1], sys.stdout)
+        argv = argv[2:]
+
+    device, mountpoint_root = argv
+    partitions = list_partitions(device)
+    try:
+        return scan_partitions(partitions, Path(mountpoint_root),
+                               config.PARTITION_CONCURRENCY, sys.stdout,
+                               ranges)
+    finally:
+        remove_partitions(device, partitions)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,222 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Retrieve images ahead of the scanner that consumes them.
+
+Downloading an image and scanning it use different resources, the network and
+the disk/CPU respectively, so retrieving the next image while the current one
+is scanned keeps both busy. Prefetcher runs a retrieval generator in a
+background thread, bounded by a lookahead depth and by a budget for the disk
+space occupied by images that have been retrieved but not yet released.
+
+"""
+import os
+import threading
+import time
+from collections import deque
+
+# Marks the end of the retrieved images.
+_DONE = object()
+
+
+class Prefetcher(object):
+    """Iterate over RetrievedImages from _images_, retrieving up to _depth_
+    of them ahead of the consumer.
+
+    disk_budget:
+        Retrieval of another image waits while the images held (retrieved and
+        not yet passed to release()) occupy this many bytes or more. One image
+        is always allowed, however large. With a depth of 0, images are
+        retrieved in the consumer's thread only when it asks for them, and
+        the budget does not apply.
+
+    times:
+        A StageTimes to which time spent retrieving is added, as 'retrieve'.
+        The seconds spent retrieving each image are also kept in the seconds
+        dict, by image path.
+
+    The consumer must pass each image to release() once it is finished with
+    it; this deletes the image, freeing its space for the next one. Use the
+    Prefetcher as a context manager, or call close(), to stop retrieval when
+    done with it.
+
+    Iterate over the Prefetcher, or call next() to also stop waiting for
+    the next image as soon as a scan is done.
+
+    """
+
+    def __init__(self, images, depth, disk_budget, times):
+        self.images = images
+        self.depth = depth
+        self.disk_budget = disk_budget
+        self.times = times
+        self.ready = deque()
+        self.held = {}
+        self.seconds = {}
+        self.closed = False
+        self.thread = None
+        self.iterator = None
+        self.condition = threading.Condition()
+
+    def _may_retrieve(self):
+        return self.closed or not self.held or (
+            len(self.ready) < self.depth
+            and sum(self.held.values()) < self.disk_budget)
+
+    def _retrieve(self):
+        images = iter(self.images)
+        while True:
+            with self.condition:
+                self.condition.wait_for(self._may_retrieve)
+                if self.closed:
+                    return
+            try:
+                image = self._next(images)
+                size = 0 if image is _DONE else os.path.getsize(image.path)
+            except Exception as e:
+                image, size = e, 0
+            with self.condition:
+                if image is not _DONE and not isinstance(image, Exception):
+                    self.held[image.path] = size
+                self.ready.append(image)
+                self.condition.notify_all()
+            if image is _DONE or isinstance(image, Exception):
+                return
+
+    def _next(self, images):
+        start = time.monotonic()
+        image = None
+        try:
+            image = next(images, _DONE)
+        finally:
+            self.times.add(
+                'retrieve', time.monotonic() - start,
+                getattr(image, 'path', None))
+        if image is not _DONE:
+            self.seconds[image.path] = time.monotonic() - start
+        return image
+
+    def __iter__(self):
+        try:
+            while True:
+                try:
+                    image = self.next()
+                except StopIteration:
+                    return
+                yield image
+        finally:
+            self.close()
+
+    def next(self, pending=()):
+        """Return the next image, or None as soon as any of the futures in
+        pending is done, so that the consumer may finish it, releasing its
+        image, without waiting for another image; the budget may not allow
+        one until it does. Raise StopIteration when there are no more images.
+
+        Pass wake() to the add_done_callback() of each future in pending.
+
+        """
+        if any(future.done() for future in pending):
+            return None
+        if self.depth < 1:
+            # No lookahead: retrieve in the consumer's thread.
+            if self.iterator is None:
+                self.iterator = iter(self.images)
+            image = self._next(self.iterator)
+            if image is _DONE:
+                raise StopIteration
+            return image
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._retrieve, daemon=True)
+            self.thread.start()
+        with self.condition:
+            self.condition.wait_for(lambda: self.ready or any(
+                future.done() for future in pending))
+            if not self.ready:
+                return None
+            image = self.ready.popleft()
+            if image is _DONE:
+                # Leave it for any later call.
+                self.ready.appendleft(image)
+            self.condition.notify_all()
+        if image is _DONE:
+            raise StopIteration
+        if isinstance(image, Exception):
+            raise image
+        return image
+
+    def wake(self, future=None):
+        """Wake a consumer waiting in next() for a future to be done."""
+        with self.condition:
+            self.condition.notify_all()
+
+    def release(self, image, keep=False):
+        """Delete a retrieved image that is no longer needed, or with keep,
+        leave it in place but no longer count it against the budget.
+
+        """
+        if not keep:
+            try:
+                os.remove(image.path)
+            except FileNotFoundError:
+                pass
+        with self.condition:
+            self.held.pop(image.path, None)
+            self.condition.notify_all()
+
+    def close(self):
+        """Stop retrieving further images.
+
+        Any retrieval in progress is allowed to finish first, so that the
+        caller may then safely remove the workspace it was writing to.
+
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        if hasattr(self.images, 'close'):
+            self.images.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
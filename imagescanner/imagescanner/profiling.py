@@ -0,0 +1,209 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+#
+"""Opt-in profiling of scan jobs, to tell whether a slow job spent its time in
+Python code, such as checksumming, in waiting for I/O, or in the scanner.
+
+request_scan profiles a job if it is passed profile=True, or every job if
+config.PROFILE is set, and writes to config.LOGS_PATH, beside the scan logs:
+
+    Profile-<job id>.txt
+        A report of the job: the span of each stage for each image, in
+        wall-clock seconds from the start of the job and by thread; the
+        functions that took the most time; and the lines that allocated the
+        most memory still held at the end, with the peak.
+
+    Profile-<job id>.pstats
+        The cProfile statistics of every thread of the job, for pstats or
+        snakeviz.
+
+    Profile-<job id>.tracemalloc
+        The tracemalloc snapshot, for tracemalloc.Snapshot.load.
+
+The scan log of each image the job scans names its report, and the frontend
+serves all three at /imagescanner/profile/<job id>.
+
+When a job is not profiled, none of this runs: the cost is a check of the
+flag, and StageTimes keeping no spans. When it is, cProfile slows Python code
+down several times over, and tracemalloc adds to every allocation; the
+scanner runs in a process of its own and is not slowed, but is not profiled
+either, its time showing only in the spans of the scan stage.
+
+"""
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from . import config
+
+REPORT = 'Profile-{}.txt'
+STATS = 'Profile-{}.pstats'
+SNAPSHOT = 'Profile-{}.tracemalloc'
+
+
+def report_name(job_id):
+    return REPORT.format(job_id)
+
+
+class _ThreadProfiles(object):
+    """A profile hook, for threading.setprofile, that starts a profile of its
+    own in each thread started while it is set.
+
+    cProfile only profiles the thread that enables it, before Python 3.12;
+    from 3.12 it profiles every thread, and only one profile may be enabled
+    at a time, so there is nothing for the hook to do. A thread that outlives
+    the job, such as the one reporting metrics, stays profiled, to little
+    cost, as a profile can only be disabled from its own thread.
+
+    """
+
+    def __init__(self):
+        self.profiles = []
+        self.lock = threading.Lock()
+
+    def __call__(self, frame, event, arg):
+        profile = cProfile.Profile()
+        try:
+            # Replaces this hook for the rest of the thread's life.
+            profile.enable()
+        except ValueError:
+            sys.setprofile(None)
+            return
+        with self.lock:
+            self.profiles.append(profile)
+
+
+class _Snapshot(object):
+    """The statistics of a profile still enabled in another thread, in the
+    form pstats.Stats takes.
+
+    """
+
+    def __init__(self, profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
+
+
+@contextmanager
+def profiled(job, times, enabled=True):
+    """Profile the block, if enabled, and write the profile of job, a
+    JobProgress, with the spans kept by times, a StageTimes, on exit.
+
+    """
+    if not enabled:
+        yield
+        return
+    started = time.time()
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start(config.PROFILE_FRAMES)
+    profile = cProfile.Profile()
+    threads = _ThreadProfiles()
+    try:
+        profile.enable()
+    except ValueError as e:
+        # Something else is profiling this process.
+        print("Cannot profile job {}: {}".format(job.job_id, e),
+              file=sys.stderr)
+        profile = None
+    threading.setprofile(threads)
+    try:
+        yield
+    finally:
+        threading.setprofile(None)
+        if profile is not None:
+            profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if not tracing:
+            tracemalloc.stop()
+        with threads.lock:
+            profiles = [_Snapshot(p) for p in threads.profiles]
+        # pstats will not take a thread that has yet to return from anything.
+        profiles = [p for p in profiles if p.stats]
+        stats = None
+        if profile is not None:
+            stats = pstats.Stats(profile, *profiles)
+        try:
+            _write(job.job_id, started, times, stats, snapshot, peak)
+        except OSError as e:
+            print("Cannot write profile of job {}: {}".format(job.job_id, e),
+                  file=sys.stderr)
+        else:
+            job.event('profiled', "Profile written to {}".format(
+                report_name(job.job_id)), profile=report_name(job.job_id))
+
+
+def _write(job_id, started, times, stats, snapshot, peak):
+    if stats is not None:
+        stats.dump_stats(str(config.LOGS_PATH / STATS.format(job_id)))
+    snapshot.dump(str(config.LOGS_PATH / SNAPSHOT.format(job_id)))
+
+    out = io.StringIO()
+    print("Profile of job {}, started {} UTC".format(
+        job_id, time.asctime(time.gmtime(started))), file=out)
+    print("Elapsed {:.3f}s".format(times.elapsed()), file=out)
+
+    print("\nStage spans, in seconds from the start of the job:", file=out)
+    print("{:>10} {:>10} {:>10}  {:<10} {:<24} {}".format(
+        'start', 'end', 'seconds', 'stage', 'thread', 'image'), file=out)
+    for stage, start, end, thread, image in sorted(
+            times.spans, key=lambda span: span[1]):
+        print("{:10.3f} {:10.3f} {:10.3f}  {:<10} {:<24} {}".format(
+            start, end, end - start, stage, thread, image or ''), file=out)
+
+    if stats is not None:
+        print("\nFunctions by cumulative time, in every thread:", file=out)
+        stats.stream = out
+        stats.sort_stats('cumulative').print_stats(config.PROFILE_TOP)
+
+    print("Memory allocated by Python: peak {:.1f} MiB; still held at the"
+          " end, by line:".format(peak / 1024 ** 2), file=out)
+    for statistic in snapshot.statistics('lineno')[:config.PROFILE_TOP]:
+        print(statistic, file=out)
+
+    with open(str(config.LOGS_PATH / REPORT.format(job_id)), 'w') as fd:
+        fd.write(out.getvalue())
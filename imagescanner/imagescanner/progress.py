@@ -0,0 +1,244 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Structured progress of scan jobs, kept in Redis so that the frontend can
+follow jobs run by any worker on any node.
+
+Each job has a hash of its details, imagescanner:job:<id>, and a list of its
+events, imagescanner:job:<id>:events, each a JSON object with the time, the
+stage, a message, and fields such as the image, its size in bytes or the
+seconds spent in each stage. The sorted set imagescanner:jobs orders jobs by
+start time, or by the time they were queued until they start. Only the last
+config.PROGRESS_EVENTS events of a job, and the last config.PROGRESS_HISTORY
+jobs, are kept, and for no longer than config.PROGRESS_TTL seconds. Jobs still
+queued are also in the sorted set imagescanner:queued, and are kept however
+many there are, so that a large batch can be followed until it has run.
+
+Progress is a convenience: if Redis cannot be reached, a job stops recording
+its events, but the scan itself carries on.
+
+"""
+import json
+import sys
+import time
+from contextlib import contextmanager
+import redis
+from . import config
+from .redisconn import get_redis
+
+JOBS_KEY = 'imagescanner:jobs'
+JOB_KEY = 'imagescanner:job:{}'
+EVENTS_KEY = 'imagescanner:job:{}:events'
+QUEUED_KEY = 'imagescanner:queued'
+
+
+class JobProgress(object):
+    """Records the progress of one job."""
+
+    def __init__(self, job_id, client=None):
+        self.job_id = job_id
+        self.client = client or get_redis()
+        self.key = JOB_KEY.format(job_id)
+        self.events_key = EVENTS_KEY.format(job_id)
+        self.broken = False
+        self.attached = False
+        self.queued = None
+
+    def _execute(self, pipe):
+        if self.broken:
+            return None
+        try:
+            return pipe.execute()
+        except redis.RedisError as e:
+            print("Cannot record progress of job {}: {}".format(
+                self.job_id, e), file=sys.stderr)
+            self.broken = True
+
+    def start(self, **fields):
+        """Record the start of the job, with details such as its source,
+        noting when it was queued, if it was recorded as queued.
+
+        """
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hget(self.key, 'queued')
+        pipe.hset(self.key, mapping=dict(
+            {k: json.dumps(v) for k, v in fields.items()},
+            job_id=json.dumps(self.job_id),
+            state=json.dumps('running'),
+            started=json.dumps(now), updated=json.dumps(now)))
+        pipe.expire(self.key, config.PROGRESS_TTL)
+        pipe.zadd(JOBS_KEY, {self.job_id: now})
+        pipe.zrem(QUEUED_KEY, self.job_id)
+        replies = self._execute(pipe)
+        if replies and replies[0] is not None:
+            self.queued = json.loads(replies[0])
+        self._forget_old_jobs()
+        self.event('start', "Processing request", **fields)
+
+    def event(self, stage, message, **fields):
+        """Record that the job reached stage, described by message."""
+        event = dict(fields, time=time.time(), stage=stage, message=message)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(self.events_key, json.dumps(event))
+        pipe.ltrim(self.events_key, -config.PROGRESS_EVENTS, -1)
+        pipe.expire(self.events_key, config.PROGRESS_TTL)
+        pipe.hset(self.key, 'updated', json.dumps(event['time']))
+        self._execute(pipe)
+
+    def finish(self, state, **fields):
+        """Record that the job ended in state, 'done' or 'failed'."""
+        self.event(state, "Job {}".format(state), **fields)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(self.key, mapping=dict(
+            {k: json.dumps(v) for k, v in fields.items()},
+            state=json.dumps(state)))
+        self._execute(pipe)
+
+    def attach(self, owner):
+        """Record that the job was attached to the job owner, which records
+        its end.
+
+        """
+        self.event('coalesced', "Attached to job {}".format(owner),
+                   job_id=owner)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(self.key, 'coalesced_into', json.dumps(owner))
+        self._execute(pipe)
+        self.attached = True
+
+    def _forget_old_jobs(self):
+        if self.broken:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            # Forget jobs queued so long ago that their records expired.
+            pipe.zremrangebyscore(
+                QUEUED_KEY, '-inf', time.time() - config.PROGRESS_TTL)
+            pipe.zrange(JOBS_KEY, 0, -config.PROGRESS_HISTORY - 1)
+            pipe.zrange(QUEUED_KEY, 0, -1)
+            _, old, waiting = pipe.execute()
+            waiting = set(waiting)
+            old = [job_id for job_id in old if job_id not in waiting]
+            if old:
+                pipe = self.client.pipeline(transaction=False)
+                for job_id in old:
+                    pipe.delete(JOB_KEY.format(job_id),
+                                EVENTS_KEY.format(job_id))
+                pipe.zrem(JOBS_KEY, *old)
+                pipe.execute()
+        except redis.RedisError as e:
+            print("Cannot forget old jobs: {}".format(e), file=sys.stderr)
+
+
+@contextmanager
+def tracking(job_id, **fields):
+    """Return a JobProgress for a job starting now, with details fields, and
+    record whether the job succeeds or fails when the block exits, unless it
+    was attached to another job.
+
+    """
+    progress = JobProgress(job_id)
+    progress.start(**fields)
+    try:
+        yield progress
+    except Exception as e:
+        progress.finish('failed', error="{}: {}".format(
+            type(e).__name__, e))
+        raise
+    if not progress.attached:
+        progress.finish('done')
+
+
+def queued(jobs, client=None):
+    """Record that jobs, a dict of the details of each by its id, are queued,
+    in a single round trip to Redis. Their workers record their start.
+
+    """
+    client = client or get_redis()
+    now = time.time()
+    pipe = client.pipeline(transaction=False)
+    for job_id, fields in jobs.items():
+        key = JOB_KEY.format(job_id)
+        events_key = EVENTS_KEY.format(job_id)
+        pipe.hset(key, mapping=dict(
+            {k: json.dumps(v) for k, v in fields.items()},
+            job_id=json.dumps(job_id),
+            state=json.dumps('queued'),
+            queued=json.dumps(now), updated=json.dumps(now)))
+        pipe.expire(key, config.PROGRESS_TTL)
+        pipe.rpush(events_key, json.dumps(dict(
+            fields, time=now, stage='queued', message="Queued")))
+        pipe.expire(events_key, config.PROGRESS_TTL)
+        pipe.zadd(JOBS_KEY, {job_id: now})
+        pipe.zadd(QUEUED_KEY, {job_id: now})
+    pipe.execute()
+
+
+def get_job(job_id, client=None):
+    """Return the details and events of a job as recent_jobs does, or None if
+    there is no record of it.
+
+    """
+    jobs = _jobs([job_id], client or get_redis())
+    return jobs[0] if jobs else None
+
+
+def recent_jobs(count, client=None):
+    """Return up to count of the most recently started jobs, newest first,
+    each a dict of its details with its list of events under 'events'.
+
+    """
+    client = client or get_redis()
+    return _jobs(client.zrevrange(JOBS_KEY, 0, count - 1), client)
+
+
+def _jobs(job_ids, client):
+    pipe = client.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.hgetall(JOB_KEY.format(job_id))
+        pipe.lrange(EVENTS_KEY.format(job_id), 0, -1)
+    replies = pipe.execute()
+    jobs = []
+    for details, events in zip(replies[::2], replies[1::2]):
+        if not details:
+            continue
+        job = {k: json.loads(v) for k, v in details.items()}
+        job['events'] = [json.loads(event) for event in events]
+        jobs.append(job)
+    return jobs
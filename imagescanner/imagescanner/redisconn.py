@@ -0,0 +1,63 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""The Redis connection shared by the worker and the frontend, for state that
+must be seen from every node, such as scan progress.
+
+"""
+import os
+import threading
+import redis
+from . import config
+
+_lock = threading.Lock()
+_client = None
+_pid = None
+
+
+def get_redis():
+    """Return this process's client for config.REDIS_URL."""
+    global _client, _pid
+    with _lock:
+        if _client is None or _pid != os.getpid():
+            _client = redis.Redis.from_url(
+                config.REDIS_URL, decode_responses=True,
+                socket_timeout=config.REDIS_TIMEOUT,
+                socket_connect_timeout=config.REDIS_TIMEOUT)
+            _pid = os.getpid()
+        return _client
@@ -60,22 +60,187 @@ decorated with @regexdispatch.
     def _(bar, baz):
         print("bar contains numbers")
 
+Rather than trying each handler's regex in turn, the registry is compiled into
+patterns that are alternations of the handlers' regexes, in order of
+registration and stripped of their capturing groups, which cost the regex
+engine dearly when it backtracks between alternatives: one for all of them, to
+tell whether any matches, then one for the first half of them, to tell which
+half the first that matches is in, and so on, so that the first handler to
+match is found in about twice the time of a single match; its own regex then
+captures its named groups. A bounded memo keeps the handlers chosen for recent
+arguments. Regexes that cannot be combined, such as those with references to
+their groups, are tried in turn as before.
+
 """
 import re
+import threading
+import warnings
+from collections import OrderedDict
 from functools import update_wrapper
 
+# Inline flags that may be scoped to a group, by the re flags they stand for.
+_SCOPED_FLAGS = {re.IGNORECASE: 'i', re.MULTILINE: 'm', re.DOTALL: 's',
+                 re.VERBOSE: 'x'}
+# Leading global flags, such as (?x), which the combined pattern scopes to the
+# handler's group instead.
+_GLOBAL_FLAGS_RE = re.compile(r'\(\?[aiLmsux]+\)')
+# Escapes, to be skipped unless they are numbered references; character
+# classes, to be skipped; capturing groups, to be made non-capturing; and
+# references to groups, which would not survive it.
+_GROUPS_RE = re.compile(
+    r'\\(?:(?P<number>[1-9])|.)'
+    r'|\[\^?\]?(?:\\.|[^\]])*\]'
+    r'|(?P<group>\((?:\?P<\w+>)?)(?!\?)'
+    r'|(?P<reference>\(\?P=|\(\?\()', re.DOTALL)
+
+
+def _ungrouped(pattern):
+    """Return pattern with its capturing groups made non-capturing, or None if
+    it refers to any of them.
+
+    """
+    references = []
+
+    def ungroup(mo):
+        if mo.group('number') or mo.group('reference'):
+            references.append(mo)
+        elif mo.group('group'):
+            return '(?:'
+        return mo.group()
+
+    ungrouped = _GROUPS_RE.sub(ungroup, pattern)
+    return None if references else ungrouped
+
+
+def _scoped(regex):
+    """Return the pattern of compiled regex, with its flags scoped to a group
+    of its own, or None if they cannot be.
+
+    """
+    flags = regex.flags & ~re.UNICODE
+    letters = ''.join(
+        letter for flag, letter in _SCOPED_FLAGS.items() if flags & flag)
+    if flags & ~sum(_SCOPED_FLAGS):
+        return None
+    pattern = regex.pattern
+    while _GLOBAL_FLAGS_RE.match(pattern):
+        pattern = pattern[_GLOBAL_FLAGS_RE.match(pattern).end():]
+    # End a verbose pattern's last comment before the group closes.
+    newline = '\n' if flags & re.VERBOSE else ''
+    if letters:
+        return '(?{}:{}{})'.format(letters, pattern, newline)
+    return '(?:{})'.format(pattern)
+
+
+def _alternation(patterns):
+    """Compile the alternation of patterns, or return None if it cannot be."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            return re.compile('|'.join(patterns))
+    except (re.error, Warning):
+        return None
+
+
+class _Node(object):
+    """A run of handlers whose regexes combine: the alternation of them all,
+    and the nodes for the first and the second half of them, or, for a run
+    short enough, nothing more, to try their regexes in turn.
+
+    """
+
+    # How many handlers to try in turn rather than halve again.
+    in_turn = 8
+
+    def __init__(self, handlers, patterns):
+        self.handlers = handlers
+        self.pattern = self.first = self.second = None
+        if len(handlers) <= self.in_turn:
+            return
+        self.pattern = _alternation(patterns)
+        half = len(handlers) // 2
+        self.first = _Node(handlers[:half], patterns[:half])
+        self.second = _Node(handlers[half:], patterns[half:])
+
+    def match(self, arg, matches=False):
+        """Return the first handler whose regex matches arg, and the named
+        groups it captured, or None and None. If matches, arg is known to
+        match one of them.
+
+        """
+        if self.first is None:
+            for handler in self.handlers:
+                mo = handler.regex.match(arg)
+                if mo is not None:
+                    return handler, mo.groupdict()
+            return None, None
+        if self.pattern is not None and not matches:
+            if self.pattern.match(arg) is None:
+                return None, None
+            matches = True
+        handler, groups = self.first.match(arg)
+        if handler is not None:
+            return handler, groups
+        # If any matches and none of the first half do, one of the second
+        # half must.
+        return self.second.match(arg, matches)
+
+
+class _Table(object):
+    """The registry compiled into as few trees of alternations as it can be,
+    in order, each a _Node for a run of handlers whose regexes combine.
+
+    """
+
+    def __init__(self, registry):
+        self.nodes = []
+        handlers, patterns = [], []
+        for handler in registry:
+            scoped = _scoped(handler.regex)
+            ungrouped = scoped and _ungrouped(scoped)
+            if ungrouped is None:
+                if handlers:
+                    self.nodes.append(_Node(handlers, patterns))
+                self.nodes.append(_Node([handler], [None]))
+                handlers, patterns = [], []
+                continue
+            handlers.append(handler)
+            patterns.append(ungrouped)
+        if handlers:
+            self.nodes.append(_Node(handlers, patterns))
+
+    def match(self, arg):
+        """Return the first handler whose regex matches arg, and the named
+        groups it captured, or None and None.
+
+        """
+        for node in self.nodes:
+            handler, groups = node.match(arg)
+            if handler is not None:
+                return handler, groups
+        return None, None
+
 
 class regexdispatch(object):
 
+    # How many recent arguments to remember the handler for.
+    memo_size = 256
+
     def __init__(self, prototype):
         update_wrapper(self, prototype)
         self.prototype = prototype
         self.registry = []
+        self._table = None
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
 
     def register(self, regex, fn=None):
         def make_handler(fn):
             fn.regex = re.compile(regex)
-            self.registry.append(fn)
+            with self._lock:
+                self.registry.append(fn)
+                self._table = None
+                self._memo.clear()
             return fn
 
         if fn:
@@ -83,6 +248,33 @@ class regexdispatch(object):
         else:
             return make_handler
 
+    def _lookup(self, arg):
+        """Return the handler for arg and the named groups its regex captured,
+        or None and None.
+
+        """
+        with self._lock:
+            if arg in self._memo:
+                self._memo.move_to_end(arg)
+                return self._memo[arg]
+            if self._table is None:
+                self._table = _Table(self.registry)
+            table = self._table
+        decision = table.match(arg)
+        with self._lock:
+            if table is self._table:
+                self._memo[arg] = decision
+                if len(self._memo) > self.memo_size:
+                    self._memo.popitem(last=False)
+        return decision
+
+    def dispatch(self, arg):
+        """Return the function that would be called for arg: the first handler
+        whose regex matches it, or else the prototype.
+
+        """
+        return self._lookup(arg)[0] or self.prototype
+
     def __call__(self, arg, *args, **kwargs):
         """Dispatch to first handler function whose regex matches arg.
 
@@ -91,9 +283,8 @@ class regexdispatch(object):
         Extra provided arguments override named groups from handler's regex.
 
         """
-        for handler in self.registry:
-            mo = handler.regex.match(arg)
-            if mo is not None:
-                return handler(arg, *args, **dict(mo.groupdict(), **kwargs))
+        handler, groups = self._lookup(arg)
+        if handler is not None:
+            return handler(arg, *args, **dict(groups, **kwargs))
         else:
             return self.prototype(arg, *args, **kwargs)
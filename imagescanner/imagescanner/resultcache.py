@@ -0,0 +1,228 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""A cache of image scan results, keyed by image checksum and ClamAV signature
+database version.
+
+An image whose checksum has already been scanned under the current signature
+database need not be mounted and scanned again; the stored exit code can be
+reused. Entries are small JSON files in config.RESULT_CACHE_PATH, so that
+every worker sharing LOGS_PATH also shares the cache.
+
+"""
+import json
+import os
+import time
+from subprocess import run, PIPE
+from tempfile import NamedTemporaryFile
+from . import clamd, config
+
+# Only these scanner exit codes are verdicts worth remembering: 0 means the
+# image is clean, 1 means a virus was found. Anything else is an error that
+# should be retried on the next request.
+CACHEABLE_RETURNCODES = (0, 1)
+
+# imagescanner-image runs under set -e, so it also exits 1 when qemu-nbd,
+# kpartx or Python fail. imagescanner.partitions therefore writes this line,
+# with 'clean' or 'infected', once every scan it ran reached a verdict, and
+# an exit code is only cached if the log confirms it; see logged_verdict.
+VERDICT_LINE = "Scan verdict: {}\n"
+VERDICTS = {0: 'clean', 1: 'infected'}
+
+
+def signature_version():
+    """Return the version of the installed ClamAV signature database, or None
+    if it cannot be determined.
+
+    When scanning with clamd, this is the version of the database it has
+    loaded, which may lag the one on disk until clamd reloads it.
+
+    """
+    if config.SCAN_BACKEND == 'clamd':
+        try:
+            return _parse_version(clamd.Clamd(config.CLAMD_SOCKET).version())
+        except clamd.ClamdError:
+            pass
+    try:
+        result = run(['clamscan', '--version'], stdout=PIPE,
+                     universal_newlines=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    return _parse_version(result.stdout)
+
+
+def _parse_version(version):
+    # The version looks like: ClamAV 0.100.2/25037/Mon Oct 15 08:57:49 2018
+    fields = version.strip().split('/')
+    return fields[1] if len(fields) > 1 else None
+
+
+def write_verdict(out, returncodes):
+    """Write the verdict of scans that exited with returncodes to out, unless
+    any of them failed to reach one.
+
+    """
+    if all(returncode in CACHEABLE_RETURNCODES for returncode in returncodes):
+        out.write(VERDICT_LINE.format(VERDICTS[max(returncodes, default=0)]))
+
+
+def logged_verdict(logfile):
+    """Return the exit code for the last verdict written to the scan log
+    logfile, or None if there is none.
+
+    """
+    prefix = VERDICT_LINE.split('{}')[0]
+    returncode = None
+    try:
+        with open(str(logfile), errors='replace') as fd:
+            for line in fd:
+                if line.startswith(prefix):
+                    verdict = line[len(prefix):].strip()
+                    returncode = {v: k for k, v in VERDICTS.items()}.get(
+                        verdict)
+    except OSError:
+        return None
+    return returncode
+
+
+class ResultCache(object):
+    """A directory of cached scan results.
+
+    ttl:
+        Number of seconds an entry remains valid after the scan that produced
+        it. A ttl of 0 disables the cache.
+
+    max_entries:
+        Number of entries to keep; beyond this, entries are evicted.
+
+    eviction:
+        'lru' evicts the entries least recently used; 'fifo' evicts the
+        entries that were scanned longest ago.
+
+    """
+
+    def __init__(self, path, ttl, max_entries, eviction='lru'):
+        if eviction not in ('lru', 'fifo'):
+            raise ValueError("Unknown eviction policy %s" % eviction)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.eviction = eviction
+
+    def _entry_path(self, checksum, sigversion):
+        return self.path / '{}-{}.json'.format(checksum, sigversion)
+
+    def get(self, checksum, sigversion):
+        """Return the cached entry for checksum, as a dict, or None."""
+        if not self.ttl or sigversion is None:
+            return None
+        entry_path = self._entry_path(checksum, sigversion)
+        try:
+            with entry_path.open() as fd:
+                entry = json.load(fd)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry['scanned'] > self.ttl:
+            return None
+        if self.eviction == 'lru':
+            # The modification time records when the entry was last used.
+            try:
+                os.utime(str(entry_path))
+            except OSError:
+                pass
+        return entry
+
+    def put(self, checksum, sigversion, returncode):
+        """Record the result of a scan, if it is a cacheable verdict."""
+        if (not self.ttl or sigversion is None
+                or returncode not in CACHEABLE_RETURNCODES):
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        entry = {
+            'checksum': checksum,
+            'sigversion': sigversion,
+            'returncode': returncode,
+            'scanned': time.time(),
+            }
+        # Write to a temporary file and rename it into place, so concurrent
+        # readers never see a partial entry.
+        with NamedTemporaryFile('w', dir=str(self.path), suffix='.tmp',
+                                delete=False) as fd:
+            json.dump(entry, fd)
+        os.replace(fd.name, str(self._entry_path(checksum, sigversion)))
+        self.evict()
+
+    def evict(self):
+        """Remove expired entries, and the oldest entries beyond max_entries.
+
+        """
+        now = time.time()
+        entries = []
+        for entry_path in self.path.glob('*.json'):
+            try:
+                mtime = entry_path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            # An entry's mtime is never earlier than its scan time, so an entry
+            # untouched for longer than the ttl has certainly expired.
+            if now - mtime > self.ttl:
+                self._remove(entry_path)
+            else:
+                entries.append((mtime, entry_path))
+        entries.sort()
+        for mtime, entry_path in entries[:-self.max_entries or None]:
+            self._remove(entry_path)
+
+    @staticmethod
+    def _remove(entry_path):
+        try:
+            entry_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def get_cache():
+    """Return a ResultCache configured from the config module."""
+    return ResultCache(
+        config.RESULT_CACHE_PATH,
+        ttl=config.RESULT_CACHE_TTL,
+        max_entries=config.RESULT_CACHE_MAX_ENTRIES,
+        eviction=config.RESULT_CACHE_EVICTION,
+        )
@@ -0,0 +1,181 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""An indexed store of scan results, for answering questions such as which
+images failed this week, or what was concluded for a checksum, without
+reading the logs.
+
+Each image a job scans, or finds a cached result for, adds a row to an SQLite
+database at config.RESULT_STORE_PATH, beside the logs so that the frontend
+can read it. query() filters and pages through them, newest first.
+
+"""
+import json
+import re
+import sqlite3
+import sys
+import time
+from . import config
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    finished REAL NOT NULL,
+    job_id TEXT,
+    source TEXT NOT NULL,
+    path TEXT,
+    filename TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    image_checksum TEXT,
+    sigversion TEXT,
+    returncode INTEGER NOT NULL,
+    verdict TEXT NOT NULL,
+    cached INTEGER NOT NULL,
+    infected TEXT NOT NULL,
+    bytes INTEGER,
+    seconds TEXT NOT NULL
+    );
+CREATE INDEX IF NOT EXISTS results_checksum ON results (checksum, id);
+CREATE INDEX IF NOT EXISTS results_source ON results (source, id);
+CREATE INDEX IF NOT EXISTS results_verdict ON results (verdict, id);
+CREATE INDEX IF NOT EXISTS results_finished ON results (finished);
+'''
+# Filters query() accepts, and the column each compares.
+FILTERS = {
+    'checksum': 'checksum = ?',
+    'source': 'source = ?',
+    'verdict': 'verdict = ?',
+    'sigversion': 'sigversion = ?',
+    'job_id': 'job_id = ?',
+    'since': 'finished >= ?',
+    'until': 'finished < ?',
+    }
+# A line of scanner output naming an infected file.
+FOUND_RE = re.compile(r'^(.*): (.*) FOUND$', re.MULTILINE)
+
+
+def verdict(returncode):
+    return {0: 'clean', 1: 'infected'}.get(returncode, 'error')
+
+
+def infected_files(logfile):
+    """Return [filename, signature] for each infection reported in logfile."""
+    try:
+        with open(str(logfile), errors='replace') as fd:
+            return [list(match) for match in FOUND_RE.findall(fd.read())]
+    except FileNotFoundError:
+        return []
+
+
+class ResultStore(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.path), timeout=60)
+        db.row_factory = sqlite3.Row
+        db.executescript(SCHEMA)
+        return db
+
+    def record(self, **result):
+        """Add a result. Its fields are the columns of the results table,
+        less id, finished, verdict and the JSON-encoded infected and seconds,
+        which may instead be given as a list and a dict.
+
+        """
+        result = dict(result)
+        result['finished'] = time.time()
+        result['verdict'] = verdict(result['returncode'])
+        result['cached'] = int(result.get('cached', False))
+        result['infected'] = json.dumps(result.get('infected', []))
+        result['seconds'] = json.dumps(result.get('seconds', {}))
+        db = self._connect()
+        try:
+            with db:
+                db.execute(
+                    'INSERT INTO results ({}) VALUES ({})'.format(
+                        ', '.join(result), ', '.join('?' * len(result))),
+                    list(result.values()))
+        finally:
+            db.close()
+
+    def query(self, limit, before=None, **filters):
+        """Return up to limit results matching filters, newest first, starting
+        before the result with id before, and the id to pass as before for the
+        next page, or None if there are no more.
+
+        """
+        clauses = [FILTERS[name] for name in filters]
+        params = list(filters.values())
+        if before is not None:
+            clauses.append('id < ?')
+            params.append(before)
+        sql = 'SELECT * FROM results{} ORDER BY id DESC LIMIT ?'.format(
+            ' WHERE ' + ' AND '.join(clauses) if clauses else '')
+        db = self._connect()
+        try:
+            rows = db.execute(sql, params + [limit + 1]).fetchall()
+        finally:
+            db.close()
+        results = []
+        for row in rows[:limit]:
+            result = dict(row)
+            result['cached'] = bool(result['cached'])
+            result['infected'] = json.loads(result['infected'])
+            result['seconds'] = json.loads(result['seconds'])
+            results.append(result)
+        return results, results[-1]['id'] if len(rows) > limit else None
+
+
+def get_store():
+    """Return a ResultStore configured from the config module."""
+    return ResultStore(config.RESULT_STORE_PATH)
+
+
+def record(**result):
+    """Add a result to the configured store, reporting rather than raising any
+    error, so that a scan is not failed for want of a record of it.
+
+    """
+    try:
+        get_store().record(**result)
+    except sqlite3.Error as e:
+        print("Cannot record result for {}: {}".format(
+            result.get('checksum'), e), file=sys.stderr)
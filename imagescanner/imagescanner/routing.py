@@ -0,0 +1,183 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Routing of scan requests to queues by the size of the images they scan, so
+that small images are not held up for hours behind huge ones, and by who
+submitted them, so that one submitter's batch does not hold up everyone
+else's.
+
+A request goes to the queue scans.<class> of the first of config.SIZE_CLASSES
+whose limit its estimated size is within, or of config.SIZE_CLASS_UNKNOWN if
+its size cannot be estimated; see tasks.estimate_size.
+
+Within a queue, each request has the priority of how many requests of the same
+submitter (checklist, Jenkins job or recipients) are already waiting there:
+0 for its first, 1 for its second, and so on up to 9. The broker hands out
+lower numbers first, so submitters take turns. The counts are kept in the
+Redis hash imagescanner:queued:<class>, and decremented as jobs start.
+
+Each worker runs a pool of processes for every size class, as many as the
+class's weight in config.QUEUE_WEIGHTS. A pool takes requests from its own
+queue and from those of every smaller class, so small requests always have
+processes of their own, and idle processes of bigger classes help with them.
+bin/imagescanner-worker starts the pools that running this module lists.
+
+"""
+import sys
+from urllib.parse import urlsplit
+import redis
+from . import config
+from .redisconn import get_redis
+
+QUEUE = 'scans.{}'
+QUEUED_KEY = 'imagescanner:queued:{}'
+# The priorities of the broker's transport, highest first.
+PRIORITIES = range(10)
+# What separates the name of a queue from its priority in the names of the
+# broker's lists; see priority_queues.
+PRIORITY_SEP = ':'
+
+
+def size_class(size):
+    """Return the name of the size class of a request for size bytes."""
+    if size is None:
+        return config.SIZE_CLASS_UNKNOWN
+    for name, limit in config.SIZE_CLASSES:
+        if limit is None or size <= limit:
+            return name
+    return config.SIZE_CLASSES[-1][0]
+
+
+def queue_name(name):
+    """Return the queue of the size class name."""
+    return QUEUE.format(name)
+
+
+def priority_queues(queue):
+    """Return the names of the broker's lists of the queue, one per priority.
+    """
+    return [queue] + [
+        queue + PRIORITY_SEP + str(priority) for priority in PRIORITIES[1:]]
+
+
+def submitter(scan):
+    """Return who submitted scan, a dict of request_scan arguments, for
+    sharing each queue fairly between submitters.
+
+    """
+    if scan.get('checklist_uuid'):
+        return 'checklist:' + scan['checklist_uuid']
+    if scan.get('jenkins_job_name'):
+        return 'jenkins:' + scan['jenkins_job_name']
+    if scan.get('recipients'):
+        return 'recipients:' + ','.join(sorted(scan['recipients']))
+    return 'host:' + (urlsplit(scan['source']).hostname or '')
+
+
+def queued(routes, client=None):
+    """Count requests as queued, given the size class and submitter of each,
+    and return the priority of each.
+
+    """
+    client = client or get_redis()
+    pipe = client.pipeline(transaction=False)
+    for name, who in routes:
+        pipe.hincrby(QUEUED_KEY.format(name), who, 1)
+        pipe.expire(QUEUED_KEY.format(name), config.PROGRESS_TTL)
+    counts = pipe.execute()[::2]
+    return [min(count - 1, PRIORITIES[-1]) for count in counts]
+
+
+def started(queue, who, client=None):
+    """Count a request taken from queue as no longer queued."""
+    for name, _ in config.SIZE_CLASSES:
+        if queue == queue_name(name):
+            break
+    else:
+        return
+    key = QUEUED_KEY.format(name)
+    try:
+        client = client or get_redis()
+        if client.hincrby(key, who, -1) <= 0:
+            client.hdel(key, who)
+    except redis.RedisError as e:
+        print("Cannot count started job: {}".format(e), file=sys.stderr)
+
+
+def parse_weights(text):
+    """Return a dict of the weight of each size class in text, a list of
+    name=weight separated by spaces or commas.
+
+    """
+    weights = {}
+    for item in text.replace(',', ' ').split():
+        name, weight = item.split('=')
+        weights[name] = int(weight)
+    unknown = set(weights) - {name for name, _ in config.SIZE_CLASSES}
+    if unknown:
+        raise ValueError("Unknown size classes: {}".format(
+            ', '.join(sorted(unknown))))
+    return weights
+
+
+def worker_pools(weights):
+    """Return the name, queues and concurrency of the worker pool for each
+    size class of non-zero weight in weights. The pool of the biggest class
+    also takes requests from the scans queue, where request_scan.delay puts
+    them.
+
+    """
+    pools = []
+    names = [name for name, _ in config.SIZE_CLASSES]
+    for n, name in enumerate(names):
+        if weights.get(name, 0) > 0:
+            queues = [queue_name(other) for other in reversed(names[:n + 1])]
+            if n == len(names) - 1:
+                queues.append('scans')
+            pools.append((name, queues, weights[name]))
+    return pools
+
+
+def main():
+    for name, queues, concurrency in worker_pools(
+            parse_weights(config.QUEUE_WEIGHTS)):
+        print('{}:{}:{}'.format(name, ','.join(queues), concurrency))
+
+
+if __name__ == '__main__':
+    main()
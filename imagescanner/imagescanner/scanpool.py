@@ -0,0 +1,216 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Run several image scans at once, each with its own NBD device and
+mountpoint.
+
+imagescanner-image connects qcow images to an NBD device and mounts
+partitions on a mountpoint, both of which must be exclusive to one scan at a
+time. SlotPool hands out (device, mountpoint) pairs, guarded by flock(2) on a
+lock file per device, so that leases are exclusive across all threads and all
+worker processes on the host. ScanExecutor runs the scanner command in a
+thread pool, passing each scan its leased slot in the environment.
+
+"""
+import fcntl
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from subprocess import run
+from . import config, metrics
+
+ScanSlot = namedtuple('ScanSlot', ['nbd_device', 'mountpoint'])
+
+# Seconds to wait before trying again when every slot is leased.
+LEASE_POLL_INTERVAL = 1
+
+
+class SlotPool(object):
+    """A pool of ScanSlots, one per NBD device.
+
+    nbd_devices:
+        A list of NBD device paths, like /dev/nbd0.
+
+    mountpoint_root:
+        A directory in which to create one mountpoint per device.
+
+    leases_path:
+        A directory for lock files; it must be local to the host.
+
+    """
+
+    def __init__(self, nbd_devices, mountpoint_root, leases_path):
+        self.nbd_devices = nbd_devices
+        self.mountpoint_root = mountpoint_root
+        self.leases_path = leases_path
+
+    def _try_lease(self, device):
+        name = os.path.basename(device)
+        fd = os.open(str(self.leases_path / (name + '.lock')),
+                     os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None, None
+        mountpoint = self.mountpoint_root / name
+        mountpoint.mkdir(parents=True, exist_ok=True)
+        return fd, ScanSlot(device, mountpoint)
+
+    @contextmanager
+    def lease(self):
+        """Wait for a free slot, and hold it for the duration of the block."""
+        self.leases_path.mkdir(parents=True, exist_ok=True)
+        while True:
+            for device in self.nbd_devices:
+                fd, slot = self._try_lease(device)
+                if slot is not None:
+                    try:
+                        yield slot
+                    finally:
+                        # Closing the file releases the lock.
+                        os.close(fd)
+                    return
+            time.sleep(LEASE_POLL_INTERVAL)
+
+
+class FileLock(object):
+    """An exclusive flock(2) on the file at path, shared by every thread and
+    process on the host, and by every host if path is on a filesystem that
+    supports flock across hosts.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self):
+        """Wait for, and take, the lock."""
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        self.fd = fd
+
+    def release(self):
+        os.close(self.fd)
+        self.fd = None
+
+    def held(self):
+        """Return whether the lock is held, by anyone else."""
+        try:
+            fd = os.open(str(self.path), os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+
+class ScanExecutor(object):
+    """Run up to _concurrency_ scans at once, each in a leased slot.
+
+    command:
+        The scanner command, as a list; the image path is appended to it.
+        It receives its slot in the environment variables
+        IMAGESCANNER_NBD_DEVICE and IMAGESCANNER_MOUNTPOINT.
+
+    times:
+        An optional StageTimes to which time spent scanning is added, as
+        'scan'. The seconds spent scanning each image are also kept in the
+        seconds dict, by image path.
+
+    """
+
+    def __init__(self, command, concurrency, pool, times=None):
+        self.command = command
+        self.concurrency = concurrency
+        self.pool = pool
+        self.times = times
+        self.seconds = {}
+        self.executor = ThreadPoolExecutor(concurrency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.executor.shutdown()
+
+    def _scan(self, image, logfile):
+        with self.pool.lease() as slot:
+            env = dict(
+                os.environ,
+                IMAGESCANNER_NBD_DEVICE=slot.nbd_device,
+                IMAGESCANNER_MOUNTPOINT=str(slot.mountpoint),
+                )
+            start = time.monotonic()
+            metrics.gauge_add(metrics.SCANS_IN_FLIGHT, 1)
+            try:
+                with open(logfile, 'a') as fd:
+                    returncode = run(self.command + [image], stdout=fd,
+                                     stderr=fd, env=env).returncode
+            finally:
+                metrics.gauge_add(metrics.SCANS_IN_FLIGHT, -1)
+            seconds = time.monotonic() - start
+            self.seconds[image] = seconds
+            if self.times is not None:
+                self.times.add('scan', seconds, image)
+            return returncode
+
+    def submit(self, image, logfile):
+        """Scan image, appending its output to logfile, and return a Future
+        for the scanner's exit code.
+
+        """
+        return self.executor.submit(self._scan, image, logfile)
+
+
+def get_executor(times=None):
+    """Return a ScanExecutor configured from the config module."""
+    return ScanExecutor(
+        config.SCANNER_COMMAND,
+        config.SCAN_CONCURRENCY,
+        SlotPool(config.NBD_DEVICES, config.MOUNTPOINT_ROOT,
+                 config.LEASES_PATH),
+        times=times,
+        )
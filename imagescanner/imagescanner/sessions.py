@@ -0,0 +1,120 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Pooled HTTP sessions, one per host in each process.
+
+A bare requests.get() opens, and throws away, a new connection for every
+request, paying a TCP and TLS handshake each time. get_session() instead
+returns a requests.Session per host that keeps up to config.HTTP_POOL_SIZE
+connections alive between requests, with that host's credentials from
+config.AUTHS already attached. Sessions are not shared with forked children,
+such as celery's worker processes, which create their own.
+
+stats counts the connections opened and the requests made, across all
+sessions in this process, so the effect of pooling can be seen.
+
+"""
+import os
+import threading
+from collections import Counter
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from . import config
+
+stats = Counter()
+_lock = threading.Lock()
+_sessions = {}
+_pid = None
+
+
+def _count(name):
+    with _lock:
+        stats[name] += 1
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count('connections')
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count('connections')
+        return super()._new_conn()
+
+
+class _CountingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+            }
+
+    def send(self, request, **kwargs):
+        _count('requests')
+        return super().send(request, **kwargs)
+
+
+def get_session(url):
+    """Return this process's session for the host named in url."""
+    global _pid
+    hostname = urlsplit(url).hostname
+    with _lock:
+        if _pid != os.getpid():
+            _sessions.clear()
+            _pid = os.getpid()
+        session = _sessions.get(hostname)
+        if session is None:
+            session = requests.Session()
+            adapter = _CountingAdapter(
+                pool_connections=1, pool_maxsize=config.HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.auth = config.AUTHS.get(hostname)
+            _sessions[hostname] = session
+    return session
+
+
+def snapshot():
+    """Return a copy of stats."""
+    with _lock:
+        return Counter(stats)
@@ -0,0 +1,97 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""Accounting of the wall-clock time a job spends in each of its stages."""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class StageTimes(object):
+    """Total seconds spent in each named stage of a job.
+
+    Stages may run concurrently in different threads (retrieving one image
+    while scanning another), so the totals may add up to more than the
+    elapsed time; the difference is time saved by overlapping them.
+
+    If spans is true, each period added is also kept in the list spans, as
+    the stage, its start and end in seconds since the StageTimes was
+    created, the name of the thread, and the image, if given; see
+    profiling.py.
+
+    """
+
+    def __init__(self, spans=False):
+        self.started = time.monotonic()
+        self.totals = OrderedDict()
+        self.spans = [] if spans else None
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds, image=None):
+        """Add seconds, ending now, to stage."""
+        with self.lock:
+            self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+            if self.spans is not None:
+                end = time.monotonic() - self.started
+                self.spans.append((
+                    stage, end - seconds, end,
+                    threading.current_thread().name, image))
+
+    @contextmanager
+    def timing(self, stage, image=None):
+        """Add the duration of the block to stage."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(stage, time.monotonic() - start, image)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def summary(self):
+        """Return a one-line description of the stage totals."""
+        with self.lock:
+            totals = list(self.totals.items())
+        elapsed = self.elapsed()
+        return "{}; elapsed {:.1f}s, overlapped {:.1f}s".format(
+            ", ".join("{} {:.1f}s".format(*item) for item in totals),
+            elapsed,
+            max(0.0, sum(seconds for _, seconds in totals) - elapsed),
+            )
@@ -39,43 +39,101 @@
 
 import os
 import re
-import hashlib
+import shutil
+import sqlite3
+import sys
+import time
+import uuid
 import datetime
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import (
+    FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait,
+    )
 from subprocess import run
-from xml.etree import ElementTree
 from celery import Celery
+import redis
 import requests
-from . import config
+from . import (
+    bucket, coalesce, config, download, gitmirror, metrics, notifications,
+    overlay, profiling, progress, resultcache, resultstore, routing,
+    scanpool,
+    )
+from .hashing import (
+    copy_and_hash, copy_and_hash_gunzip, gunzip_file, sha256_file,
+    )
 from .in_temp_dir import in_temp_dir
+from .prefetch import Prefetcher
 from .regexdispatch import regexdispatch
+from .sessions import get_session, snapshot as http_stats
+from .stagetimes import StageTimes
+# Importing workers connects the heartbeat to the worker's signals.
+from . import workers  # noqa: F401
 
 celery_app = Celery(
-    broker='redis://vvp-redis',
-    backend='redis://vvp-redis',
+    broker=config.REDIS_URL,
+    backend=config.REDIS_URL,
     )
+# Take messages in order of priority, one at a time, so that a worker does not
+# hold on to requests other workers could be scanning; see routing.py.
+celery_app.conf.broker_transport_options = {
+    'priority_steps': list(routing.PRIORITIES),
+    'sep': routing.PRIORITY_SEP,
+    'queue_order_strategy': 'priority',
+    }
+celery_app.conf.worker_prefetch_multiplier = 1
 
 # direct_re will match URLs pointing directly to an image to download, over
 # http and https connections, and will capture the hostname and filename in
 # named groups. This includes URLs to S3 and RadosGW endpoints.
 #
+# FIXME this regex won't properly detect URLs with query-strings.
+direct_re = r'''(?x)  # this is a "verbose" regex
+    https?://                   # match an http or https url
+    (?P<hostname>               # capture the hostname:
+        [^/:]*                  #   anything up to the first / or :
+    )
+    .*                          # any number of path components
+    /(?P<filename>              # capture the filename after the last /
+        [^/]*                   #   anything not a /
+        \.(?:img|iso|qcow2?)    #   with one of these three extensions
+        (?:\.gz)?               #   optionally also compressed
+    )$'''
+# bucket_re will match URLs ending in a slash, which we take to be S3 or
+# RadosGW buckets of images; git_re will match git URLs.
+bucket_re = r'''(?x)  # this is a "verbose" regex
+    https?://                   # match an http or https url
+    (?P<hostname>               # capture the hostname:
+        [^/:]*                  #   anything up to the first / or :
+    )
+    .*                          # any number of path components
+    /$                          # ending with a slash
+    '''
+git_re = r'.*\.git$'
 image_re = re.compile(r'.*\.(?:img|iso|qcow2?)(?:\.gz)?$')
 SLACK_TOKEN = os.getenv('SLACK_TOKEN')
+SLACK_WEBHOOK = "https://hooks.slack.com/services/{}"
 DOMAIN = os.getenv('DOMAIN')
 
-
-def sha256(path):
-    """Return the SHA256 checksum of the file at path"""
-    h = hashlib.new('sha256')
-    with open(path, 'rb') as fd:
-        for chunk in iter((lambda: fd.read(4096)), b''):
-            h.update(chunk)
-    return h.hexdigest()
+# What retrieve_images generates: the path to an image in the workspace, the
+# SHA256 checksum of the image file as it was retrieved, if that was computed
+# while retrieving it, and the SHA256 checksum of the decompressed image, if
+# the image was retrieved gzipped and decompressed while retrieving it, and the
+# path of the image file as it was retrieved, which differs from the first path
+# only for a gzipped image.
+#
+# The checksum and name of the file as retrieved, so the compressed file in the
+# case of a gzipped image, are the ones that identify the image in logs, in the
+# result cache and in Slack and Jenkins notifications.
+RetrievedImage = namedtuple(
+    'RetrievedImage', ['path', 'checksum', 'image_checksum', 'filename'])
 
 
 @celery_app.task(queue='scans', ignore_result=True)
 @in_temp_dir()
 def request_scan(source, path, recipients=None, jenkins_job_name=None,
-                 checklist_uuid=None):
+                 checklist_uuid=None, profile=False):
     """Retrieve and scan all partitions of (an) image(s), and notify of the
     results.
 
@@ -100,89 +158,443 @@ def request_scan(source, path, recipients=None, jenkins_job_name=None,
     checklist_uuid:
         The UUID of the checklist that should be passed to the jenkins job.
 
+    profile:
+        Whether to profile the job, as every job is if config.PROFILE is set;
+        see profiling.py.
+
+    Up to config.SCAN_CONCURRENCY images from source are scanned at once; the
+    result of each is delivered as soon as its scan completes. Meanwhile, up
+    to config.PREFETCH_DEPTH further images are retrieved ahead of the scans.
+
+    Gzipped images are decompressed as they are retrieved. The checksum that
+    identifies such an image in its log and notifications is, as it always
+    was, that of the compressed file, as is its name; see RetrievedImage.
+
     This function assumes the current working directory is a safe workarea for
     retrieving and manipulating images, but is decorated with in_temp_dir which
     changes to a new temporary directory upon invocation.
 
     """
 
-    # TODO printing to a status file is archaic and messy; let's use the python
-    # logging framework or storing status in redis instead.
-    with config.STATUSFILE.open('w') as statusfile:
-
-        print(
-            "Processing request {source} {path} in {workspace}".format(
-                source=source, path=path, workspace=os.getcwd()),
-            file=statusfile,
-            flush=True)
-
-        for image in retrieve_images(source, path):
-            print(
-                "- Image file: {}...".format(image),
-                file=statusfile, flush=True)
-            if not os.path.exists(image):
-                raise ValueError("Path not found: {}".format(image))
-
-            print("-- Checksumming...", file=statusfile, flush=True)
-            checksum = sha256(image)
-
-            print("-- Scanning...", file=statusfile, flush=True)
-            logfile = config.LOGS_PATH / 'SecurityValidation-{}.txt'.format(
-                checksum)
-
-            # for partition in image_partitions():
-            #     result = scan_partition(partition)
-            with open(logfile, 'w') as fd:
-                print(datetime.datetime.utcnow().ctime(), "UTC", file=fd)
-                print("Launching image scan for {} from {} {}".format(
-                    image, source, path), file=fd)
-                print("SHA256 checksum:", checksum, file=fd, flush=True)
-                result = run(
-                    ['/usr/local/bin/imagescanner-image', image],
-                    stdout=fd,
-                    stderr=fd,
-                    )
-
-            if recipients:
-                print(
-                    "-- Scheduling notification (exit code: {})..."
-                    .format(result.returncode), file=statusfile, flush=True)
-
-                slack_notify.delay(
-                    status="Success" if result.returncode == 0 else "Failure",
-                    source=source,
-                    filename=image,
-                    checksum=checksum,
-                    recipients=recipients,
-                    )
-
-            elif checklist_uuid and jenkins_job_name:
-                print(
-                    "-- Triggering Jenkins job {} for checklist {}"
-                    .format(jenkins_job_name, checklist_uuid), file=statusfile,
-                    flush=True)
-
-                jenkins_notify.delay(
-                    jenkins_job_name,
-                    status=result.returncode,
-                    checksum=checksum,
-                    checklist_uuid=checklist_uuid,
-                    )
-
+    job_id = request_scan.request.id or uuid.uuid4().hex
+    routing.started(
+        (request_scan.request.delivery_info or {}).get('routing_key'),
+        routing.submitter(dict(
+            source=source, recipients=recipients,
+            jenkins_job_name=jenkins_job_name,
+            checklist_uuid=checklist_uuid)))
+    claims = coalesce.Claims(job_id, dict(
+        job_id=job_id, source=source, recipients=recipients,
+        jenkins_job_name=jenkins_job_name, checklist_uuid=checklist_uuid))
+    with progress.tracking(job_id, source=source, path=path,
+                           workspace=os.getcwd()) as job:
+        if job.queued is not None:
+            metrics.observe(
+                {'queue_wait': max(0.0, time.time() - job.queued)})
+
+        # Leave the scan to any job already scanning the same source and path;
+        # that job will notify our recipients too.
+        source_key = coalesce.source_key(source, path)
+        owner = claims.claim(source_key, path=path)
+        if owner is not None:
+            job.attach(owner)
+            return
+
+        result_cache = resultcache.get_cache()
+        sigversion = resultcache.signature_version()
+        results = []
+
+        def notify(retrieved, checksum, returncode):
+            _notify_scan_result(
+                job, source, recipients, jenkins_job_name, checklist_uuid,
+                retrieved.filename, checksum, returncode)
+            results.append((retrieved.filename, checksum, returncode))
+            for attachment in claims.release(coalesce.checksum_key(checksum)):
+                _notify_attached(attachment, attachment['filename'], checksum,
+                                 returncode)
+        profile = profile or config.PROFILE
+        times = StageTimes(spans=profile)
+        http_before = http_stats()
+        images = Prefetcher(
+            retrieve_images(source, path),
+            depth=config.PREFETCH_DEPTH,
+            disk_budget=config.PREFETCH_DISK_BUDGET,
+            times=times,
+            )
+        scans = {}
+        checksum_seconds = {}
+
+        def record(retrieved, checksum, returncode, cached):
+            logfile = config.LOGS_PATH / (
+                'SecurityValidation-{}.txt'.format(checksum))
+            seconds = {'retrieve': images.seconds.get(retrieved.path)}
+            if retrieved.path in checksum_seconds:
+                seconds['checksum'] = checksum_seconds[retrieved.path]
+            if not cached:
+                seconds['scan'] = executor.seconds.get(retrieved.path)
+            size = os.path.getsize(retrieved.path)
+            metrics.observe({stage: value for stage, value in seconds.items()
+                             if value is not None}, size)
+            metrics.count(metrics.CACHE_LOOKUPS, cache='result',
+                          result='hit' if cached else 'miss')
+            resultstore.record(
+                job_id=job_id, source=source, path=path,
+                filename=retrieved.filename, checksum=checksum,
+                image_checksum=retrieved.image_checksum,
+                sigversion=sigversion, returncode=returncode, cached=cached,
+                infected=resultstore.infected_files(logfile),
+                bytes=size, seconds=seconds)
+
+        def release(retrieved, checksum):
+            if overlay.is_qcow2(retrieved.path):
+                # Keep it for any overlay on it retrieved later; the
+                # workspace is removed at the end of the job.
+                overlay.keep_as_base(retrieved.path, checksum)
+                images.release(retrieved, keep=True)
             else:
-                print(
-                    "-- Skipping notification (exit code was: {})."
-                    .format(result.returncode), file=statusfile, flush=True)
+                images.release(retrieved)
+
+        def finish_scans(futures):
+            for future in futures:
+                retrieved, checksum, log_lock = scans.pop(future)
+                try:
+                    returncode = future.result()
+                    logfile = config.LOGS_PATH / (
+                        'SecurityValidation-{}.txt'.format(checksum))
+                    # Cache only a verdict that the scan's log confirms.
+                    if resultcache.logged_verdict(logfile) == returncode:
+                        result_cache.put(checksum, sigversion, returncode)
+                finally:
+                    log_lock.release()
+                record(retrieved, checksum, returncode, cached=False)
+                release(retrieved, checksum)
+                notify(retrieved, checksum, returncode)
+
+        def cached_result(checksum, logfile):
+            cached = result_cache.get(checksum, sigversion)
+            if cached is not None and logfile.exists():
+                return cached['returncode']
+
+        # Should anything fail, release the log locks of the scans still in
+        # flight, once they have stopped, so other jobs can scan their images.
+        with profiling.profiled(job, times, profile), \
+                _delivering(claims, source_key, results), _releasing(scans), \
+                images, scanpool.get_executor(times) as executor:
+            while True:
+                # Finish each scan as soon as it is done, delivering its
+                # result and releasing its image, whose space in the disk
+                # budget the prefetcher may be waiting for.
+                finish_scans([future for future in scans if future.done()])
+                try:
+                    retrieved = images.next(scans)
+                except StopIteration:
+                    break
+                if retrieved is None:
+                    continue
+                image = retrieved.path
+                if not os.path.exists(image):
+                    raise ValueError("Path not found: {}".format(image))
+                job.event('retrieved', "Retrieved image", image=image,
+                          bytes=os.path.getsize(image))
+
+                checksum = retrieved.checksum
+                if checksum is None:
+                    job.event('checksum', "Checksumming", image=image)
+                    start = time.monotonic()
+                    checksum = sha256_file(image)
+                    checksum_seconds[image] = time.monotonic() - start
+                    times.add('checksum', checksum_seconds[image], image)
+
+                logfile = config.LOGS_PATH / (
+                    'SecurityValidation-{}.txt'.format(checksum))
+                log_lock = scanpool.FileLock(logfile.with_suffix('.lock'))
+
+                # An image may appear twice in one request; let its first
+                # scan finish, and the second will find the cached result.
+                finish_scans(wait([
+                    future for future, (_, other, _) in scans.items()
+                    if other == checksum]).done)
+                returncode = cached_result(checksum, logfile)
+                if returncode is None:
+                    # Leave the scan to any job already scanning the image.
+                    owner = claims.claim(coalesce.checksum_key(checksum),
+                                         filename=retrieved.filename,
+                                         checksum=checksum)
+                    if owner is not None:
+                        job.event('coalesced',
+                                  "Attached to job {} scanning the image"
+                                  .format(owner), image=image,
+                                  checksum=checksum, job_id=owner)
+                        release(retrieved, checksum)
+                        continue
+                    # Wait for any other job scanning the same image, then
+                    # look again.
+                    log_lock.acquire()
+                    returncode = cached_result(checksum, logfile)
+                    if returncode is not None:
+                        log_lock.release()
+
+                if returncode is not None:
+                    job.event(
+                        'cached', "Reusing cached scan result", image=image,
+                        checksum=checksum, sigversion=sigversion,
+                        returncode=returncode)
+                    record(retrieved, checksum, returncode, cached=True)
+                    release(retrieved, checksum)
+                    notify(retrieved, checksum, returncode)
+                    continue
+
+                job.event('scan', "Scanning", image=image, checksum=checksum,
+                          sigversion=sigversion)
+                with open(logfile, 'w') as fd:
+                    print(datetime.datetime.utcnow().ctime(), "UTC", file=fd)
+                    print("Launching image scan for {} from {} {}".format(
+                        image, source, path), file=fd)
+                    print("SHA256 checksum:", checksum, file=fd)
+                    if retrieved.image_checksum:
+                        print("SHA256 checksum of decompressed image:",
+                              retrieved.image_checksum, file=fd)
+                    print("Signature version:", sigversion, file=fd)
+                    if profile:
+                        print("Profile of the job:",
+                              profiling.report_name(job_id), file=fd)
+                future = executor.submit(image, logfile)
+                future.add_done_callback(images.wake)
+                scans[future] = (retrieved, checksum, log_lock)
+
+                # Take no further images while every slot is scanning; the
+                # prefetcher retrieves up to PREFETCH_DEPTH more meanwhile.
+                if len(scans) >= executor.concurrency:
+                    done, _ = wait(scans, return_when=FIRST_COMPLETED)
+                    finish_scans(done)
+
+            finish_scans(as_completed(list(scans)))
+
+        http = http_stats() - http_before
+        job.event(
+            'processed', "All images processed: {}".format(times.summary()),
+            seconds=dict(times.totals), elapsed=times.elapsed(),
+            http_requests=http['requests'],
+            http_connections=http['connections'])
+
+
+@contextmanager
+def _releasing(scans):
+    """Release the log lock of every scan left in scans on exit."""
+    try:
+        yield
+    finally:
+        for _, _, log_lock in scans.values():
+            log_lock.release()
+
+
+@contextmanager
+def _delivering(claims, source_key, results):
+    """On exit, release the claims, and notify each job attached to the claim
+    on source_key of results, a list of the filename, checksum and exit code
+    of each image scanned.
+
+    Should the job fail, the jobs attached to the claim on source_key are
+    queued again, to do the work themselves, and those attached to the scan
+    of an image are notified that it failed.
+
+    """
+    try:
+        yield
+    except Exception as e:
+        error = "Job {} failed: {}: {}".format(
+            claims.job_id, type(e).__name__, e)
+        requeue = []
+        for key, attachments in claims.release_all().items():
+            for attachment in attachments:
+                if key == source_key:
+                    requeue.append(attachment)
+                    continue
+                _notify_attached(attachment, attachment['filename'],
+                                 attachment['checksum'], None)
+                progress.JobProgress(attachment['job_id']).finish(
+                    'failed', error=error)
+        if requeue:
+            _requeue(requeue, error)
+        raise
+    for attachment in claims.release(source_key):
+        for filename, checksum, returncode in results:
+            _notify_attached(attachment, filename, checksum, returncode)
+        progress.JobProgress(attachment['job_id']).finish('done')
+
+
+def _requeue(attachments, error):
+    """Queue again the jobs described by attachments, which attached to a job
+    that failed with error.
+
+    """
+    try:
+        submit_scans([
+            {k: attachment.get(k) for k in (
+                'source', 'path', 'recipients', 'jenkins_job_name',
+                'checklist_uuid')}
+            for attachment in attachments],
+            [attachment['job_id'] for attachment in attachments])
+    except Exception as e:
+        print("Cannot queue attached jobs again: {}".format(e),
+              file=sys.stderr)
+        for attachment in attachments:
+            progress.JobProgress(attachment['job_id']).finish(
+                'failed', error=error)
+
+
+def _notify_attached(attachment, image, checksum, returncode):
+    """Deliver the result of scanning one image to a job that attached to
+    the scan.
+
+    """
+    _notify_scan_result(
+        progress.JobProgress(attachment['job_id']), attachment['source'],
+        attachment['recipients'], attachment['jenkins_job_name'],
+        attachment['checklist_uuid'], image, checksum, returncode)
+
+
+def _notify_scan_result(job, source, recipients, jenkins_job_name,
+                        checklist_uuid, image, checksum, returncode):
+    """Schedule delivery of the result of scanning one image."""
+    if recipients:
+        job.event('notify', "Scheduling Slack notification", image=image,
+                  returncode=returncode, recipients=recipients)
+
+        slack_notify.delay(
+            status="Success" if returncode == 0 else "Failure",
+            source=source,
+            filename=image,
+            checksum=checksum,
+            recipients=recipients,
+            )
+
+    elif checklist_uuid and jenkins_job_name:
+        job.event('notify', "Triggering Jenkins job", image=image,
+                  returncode=returncode, jenkins_job_name=jenkins_job_name,
+                  checklist_uuid=checklist_uuid)
+
+        jenkins_notify.delay(
+            jenkins_job_name,
+            status=returncode,
+            checksum=checksum,
+            checklist_uuid=checklist_uuid,
+            )
+
+    else:
+        job.event('notify', "Skipping notification", image=image,
+                  returncode=returncode)
+
+    job.event('done', "Done", image=image, returncode=returncode)
+
+
+def scannable(source):
+    """Return whether source is of a type that retrieve_images can retrieve."""
+    return any(handler.regex.match(source)
+               for handler in retrieve_images.registry)
+
+
+def submit_scans(scans, job_ids=None):
+    """Queue a request_scan for each of scans, a list of dicts of its keyword
+    arguments, and return the id of each job, by which its progress and
+    results can be found. The ids are new unless given in job_ids.
+
+    Each request is queued by its estimated size and its submitter; see
+    routing.py. Sizes not estimated within config.SIZE_ESTIMATE_TIMEOUT
+    seconds are taken to be unknown. The jobs are recorded as queued in one
+    round trip to Redis, and then published to the broker by one producer,
+    rather than by one acquired from the pool for each as request_scan.delay
+    would.
+
+    """
+    job_ids = job_ids or [uuid.uuid4().hex for _ in scans]
+    # Sizing takes HEAD requests and bucket listings, so give up on any not
+    # done in time rather than keep the submitter waiting; those requests
+    # are of unknown size.
+    executor = ThreadPoolExecutor(config.SIZE_ESTIMATORS)
+    futures = [
+        executor.submit(_estimate_size, scan['source'], scan.get('path'))
+        for scan in scans]
+    done, not_done = wait(futures, timeout=config.SIZE_ESTIMATE_TIMEOUT)
+    for future in not_done:
+        future.cancel()
+    executor.shutdown(wait=False)
+    sizes = [future.result() if future in done else None
+             for future in futures]
+    routes = [
+        (routing.size_class(size), routing.submitter(scan))
+        for size, scan in zip(sizes, scans)]
+    try:
+        priorities = routing.queued(routes)
+        progress.queued({
+            job_id: dict(source=scan['source'], path=scan.get('path'),
+                         bytes=size, size_class=route[0])
+            for job_id, scan, size, route in zip(
+                job_ids, scans, sizes, routes)})
+    except redis.RedisError as e:
+        print("Cannot record queued jobs: {}".format(e), file=sys.stderr)
+        priorities = [0] * len(scans)
+    with celery_app.producer_or_acquire() as producer:
+        for job_id, scan, route, priority in zip(
+                job_ids, scans, routes, priorities):
+            request_scan.apply_async(
+                kwargs=scan, task_id=job_id, producer=producer,
+                queue=routing.queue_name(route[0]), priority=priority)
+    return job_ids
+
+
+def _estimate_size(source, path):
+    try:
+        return estimate_size(source, path)
+    except (requests.RequestException, bucket.ListingError) as e:
+        print("Cannot estimate size of {}: {}".format(source, e),
+              file=sys.stderr)
+        return None
+
+
+@regexdispatch
+def estimate_size(source, path):
+    """Return roughly how many bytes of images request_scan would retrieve
+    from source, without retrieving them, or None if that is not known.
+
+    """
+    return None
+
+
+@estimate_size.register(git_re)
+def _es_git(source, path, **kwargs):
+    """A repository's images are only known in size once they have been
+    retrieved, so go by the last result recorded for each image from it.
+
+    """
+    try:
+        results, _ = resultstore.get_store().query(
+            config.RESULTS_PAGE_MAX, source=source)
+    except sqlite3.Error:
+        return None
+    sizes = {}
+    for result in results:
+        sizes.setdefault(result['filename'], result['bytes'])
+    if path:
+        return sizes.get(os.path.join('repo', path))
+    return sum(filter(None, sizes.values())) if sizes else None
 
-            print("-- Done.", file=statusfile, flush=True)
 
-        print("- All images processed.", file=statusfile, flush=True)
+@estimate_size.register(direct_re)
+def _es_direct(source, path=None, **kwargs):
+    return download.probe(source)[0]
+
+
+@estimate_size.register(bucket_re)
+def _es_bucket(source, path=None, **kwargs):
+    return sum(size for filename, size in bucket.list_objects(source)
+               if image_re.match(filename))
 
 
 @regexdispatch
 def retrieve_images(source, path):
-    """Generate the filenames of one or multiple disk images as they are
-    retrieved from _source_.
+    """Generate a RetrievedImage for each of one or multiple disk images as
+    they are retrieved from _source_.
 
     Source may be one of several types of source, so we dispatch to an
     appropriate function to deal with it:
@@ -202,70 +614,111 @@ def retrieve_images(source, path):
     raise ValueError("Unknown source type %s" % source)
 
 
-@retrieve_images.register(r'.*\.git$')
+@retrieve_images.register(git_re)
 def _ri_git(source, path, **kwargs):
-    run(['/usr/bin/git', 'clone',
+    if path:
+        def select(name):
+            return name == path
+    else:
+        def select(name):
+            return bool(image_re.match(os.path.basename(name)))
+
+    paths = gitmirror.checkout(source, 'repo', select)
+    if paths is None:
+        paths = _clone(source, select)
+
+    if path:
+        yield _local_image(os.path.join("repo", path))
+        return
+
+    for name in paths:
+        yield _local_image(os.path.join("repo", name))
+
+
+def _clone(source, select):
+    """Clone the repository at source, with its submodules, into repo/ in the
+    workspace, and return the path of each file in it for which select is
+    true.
+
+    """
+    shutil.rmtree('repo', ignore_errors=True)
+    run([gitmirror.GIT, 'clone',
          '--depth', '1',
          '--single-branch',
          '--recursive',
          source,
          'repo/'],
-        env={"GIT_SSH_COMMAND": " ".join([
-             "ssh",
-             "-i /root/.ssh/id_ed25519",
-             "-o StrictHostKeyChecking=no"])},
+        env=gitmirror.GIT_ENV,
         check=True,
         )
 
-    if path:
-        yield os.path.join("repo", path)
-        return
-
+    paths = []
     for root, dirs, files in os.walk('repo'):
         for name in files:
-            if image_re.match(name):
-                yield os.path.join(root, name)
+            name = os.path.relpath(os.path.join(root, name), 'repo')
+            if select(name):
+                paths.append(name)
+    return paths
 
 
-# FIXME this regex won't properly detect URLs with query-strings.
-@retrieve_images.register(r'''(?x)  # this is a "verbose" regex
-    https?://                   # match an http or https url
-    (?P<hostname>               # capture the hostname:
-        [^/:]*                  #   anything up to the first / or :
-    )
-    .*                          # any number of path components
-    /(?P<filename>              # capture the filename after the last /
-        [^/]*                   #   anything not a /
-        \.(?:img|iso|qcow2?)    #   with one of these three extensions
-        (?:\.gz)?               #   optionally also compressed
-    )$''')
-def _ri_direct(source, path=None, hostname=None, filename=None, **kwargs):
-    auth = config.AUTHS.get(hostname)
-    with open(filename, 'wb') as fd:
-        r = requests.get(source, stream=True, auth=auth)
-        for chunk in r.iter_content(chunk_size=4096):
-            fd.write(chunk)
-    yield filename
+def _local_image(path):
+    """Return a RetrievedImage for an image already in the workspace,
+    decompressing it first if it is gzipped.
 
+    """
+    if path.endswith('.gz'):
+        start = time.monotonic()
+        checksum, image_checksum = gunzip_file(path)
+        metrics.observe({'decompress': time.monotonic() - start},
+                        os.path.getsize(path[:-len('.gz')]))
+        return RetrievedImage(
+            path[:-len('.gz')], checksum, image_checksum, path)
+    return RetrievedImage(path, None, None, path)
 
-@retrieve_images.register(r'''(?x)  # this is a "verbose" regex
-    https?://                   # match an http or https url
-    (?P<hostname>               # capture the hostname:
-        [^/:]*                  #   anything up to the first / or :
-    )
-    .*                          # any number of path components
-    /$                          # ending with a slash
-    ''')
+
+@retrieve_images.register(direct_re)
+def _ri_direct(source, path=None, hostname=None, filename=None, **kwargs):
+    try:
+        size, ranged, validator = download.probe(source)
+    except requests.RequestException:
+        size, ranged, validator = None, False, None
+
+    if ranged and size and size >= 2 * config.DOWNLOAD_SEGMENT_SIZE:
+        gunzip = filename.endswith('.gz')
+        image = filename[:-len('.gz')] if gunzip else filename
+        try:
+            checksum, image_checksum = download.download(
+                source, image, size, validator, gunzip=gunzip)
+        except download.RangeNotSupported:
+            pass
+        else:
+            yield RetrievedImage(image, checksum, image_checksum, filename)
+            return
+
+    r = get_session(source).get(source, stream=True,
+                                timeout=config.DOWNLOAD_TIMEOUT)
+    r.raise_for_status()
+    r.raw.decode_content = True
+    if filename.endswith('.gz'):
+        # Decompress while downloading, rather than afterwards.
+        with open(filename[:-len('.gz')], 'wb') as fd:
+            checksum, image_checksum = copy_and_hash_gunzip(r.raw, fd)
+        download.check_length(r)
+        yield RetrievedImage(
+            filename[:-len('.gz')], checksum, image_checksum, filename)
+    else:
+        with open(filename, 'wb') as fd:
+            checksum = copy_and_hash(r.raw, fd)
+        download.check_length(r)
+        yield RetrievedImage(filename, checksum, None, filename)
+
+
+@retrieve_images.register(bucket_re)
 def _ri_bucket(source, path=None, hostname=None, filename=None, **kwargs):
     """We assume that an HTTP(s) URL ending in / is a radosgw bucket."""
-    auth = config.AUTHS.get(hostname)
     # We could request ?format=json but the output is malformed; all but one
     # filename is truncated.
-    response = requests.get(source, {'format': 'xml'}, auth=auth)
-    keys = ElementTree.fromstring(response.text).iter(
-        '{http://s3.amazonaws.com/doc/2006-03-01/}Key')
-    filenames = [x.text for x in keys]
-    for filename in filenames:
+    for filename, size in bucket.list_objects(source):
         if image_re.match(filename):
             yield from retrieve_images(source + filename)
 
@@ -303,22 +756,30 @@ def slack_notify(status, source, filename, checksum, recipients):
             }]
         }
 
-    for recipient in recipients:
-        requests.post(
-            "https://hooks.slack.com/services/%s" % SLACK_TOKEN,
-            json=dict(payload, channel=recipient),
-            )
+    url = SLACK_WEBHOOK.format(SLACK_TOKEN)
+    dispatcher = notifications.get_dispatcher()
+    start = time.monotonic()
+    wait([
+        dispatcher.submit(
+            notifications.host(url),
+            partial(notifications.post, url, dict(payload, channel=recipient)),
+            dict(kind='slack', channel=recipient, status=status,
+                 source=source, filename=filename, checksum=checksum))
+        for recipient in recipients])
+    metrics.observe({'notify': time.monotonic() - start})
 
 
 @celery_app.task(ignore_result=True)
 def jenkins_notify(name, status, checksum, checklist_uuid):
-    # The frontend does not need the jenkins library, so we perform the import
-    # it from within the worker task.
-    from jenkins import Jenkins
-    server = Jenkins(**config.JENKINS)
     logurl = "http://{}/imagescanner/result/{}".format(DOMAIN, checksum)
-    server.build_job(name, {
+    parameters = {
         "checklist_uuid": checklist_uuid,
         "status": status,
         "logurl": logurl,
-        })
+        }
+    start = time.monotonic()
+    notifications.get_dispatcher().submit(
+        notifications.host(config.JENKINS['url']),
+        partial(notifications.build_job, name, parameters),
+        dict(kind='jenkins', job=name, parameters=parameters)).result()
+    metrics.observe({'notify': time.monotonic() - start})
@@ -0,0 +1,166 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+import pytest
+from .. import bucket, config, sessions
+
+KEYS = ['image{:04d}.{}'.format(n, 'img' if n % 3 else 'txt')
+        for n in range(25)]
+
+
+class BucketHandler(BaseHTTPRequestHandler):
+    """List KEYS a server's page_size at a time, after the marker given,
+    giving NextMarker only if the server's next_marker is set. The first
+    response to start after each of the server's drop_after keys is cut off
+    after the server's cut fraction of it. The marker of each request is
+    recorded in the server's markers. If the server's status is set, every
+    response is an error with that status.
+
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        marker = parse_qs(urlsplit(self.path).query).get('marker', [''])[0]
+        self.server.markers.append(marker)
+        if self.server.status:
+            self.send_error(self.server.status)
+            return
+        keys = [key for key in KEYS if key > marker]
+        page = keys[:self.server.page_size]
+        truncated = len(keys) > len(page)
+        body = ''.join(
+            '<Contents><Key>{}</Key><Size>{}</Size></Contents>'.format(
+                key, len(key)) for key in page)
+        if truncated and self.server.next_marker:
+            body += '<NextMarker>{}</NextMarker>'.format(page[-1])
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="{}">'
+            '<Name>images</Name>'
+            '<IsTruncated>{}</IsTruncated>{}</ListBucketResult>'.format(
+                bucket.S3_NS[1:-1], str(truncated).lower(), body)).encode()
+        if marker in self.server.drop_after:
+            self.server.drop_after.remove(marker)
+            body = body[:int(len(body) * self.server.cut)]
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class BucketServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(sessions, '_sessions', {})
+    monkeypatch.setattr(bucket.time, 'sleep', lambda seconds: None)
+    httpd = BucketServer(('127.0.0.1', 0), BucketHandler)
+    httpd.page_size = 10
+    httpd.next_marker = True
+    httpd.drop_after = []
+    httpd.cut = 0.5
+    httpd.markers = []
+    httpd.status = None
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server):
+    return 'http://127.0.0.1:{}/images/'.format(server.server_port)
+
+
+@pytest.mark.parametrize('next_marker', [True, False])
+def test_listing_follows_pages(server, next_marker):
+    server.next_marker = next_marker
+    listing = list(bucket.list_objects(url(server)))
+    assert listing == [(key, len(key)) for key in KEYS]
+    assert server.markers == ['', KEYS[9], KEYS[19]]
+
+
+def test_keys_are_generated_as_they_arrive(server):
+    listing = bucket.list_objects(url(server))
+    assert next(listing) == (KEYS[0], len(KEYS[0]))
+    assert server.markers == ['']
+    listing.close()
+
+
+def test_listing_resumes_after_last_key(server):
+    server.drop_after = [KEYS[9]]
+    keys = [key for key, size in bucket.list_objects(url(server))]
+    assert keys == KEYS
+    assert server.markers[:2] == ['', KEYS[9]]
+    assert server.markers[2] > KEYS[9]
+
+
+def test_listing_gives_up(server, monkeypatch):
+    monkeypatch.setattr(config, 'DOWNLOAD_RETRIES', 1)
+    server.drop_after = ['', '']
+    server.cut = 0.1
+    with pytest.raises(bucket.ListingError):
+        list(bucket.list_objects(url(server)))
+
+
+def test_retries_are_counted_per_page(server, monkeypatch):
+    monkeypatch.setattr(config, 'DOWNLOAD_RETRIES', 1)
+    server.drop_after = ['', KEYS[9]]
+    server.cut = 0.1
+    keys = [key for key, size in bucket.list_objects(url(server))]
+    assert keys == KEYS
+    assert server.markers == ['', '', KEYS[9], KEYS[9], KEYS[19]]
+
+
+@pytest.mark.parametrize('status,requests', [(403, 1), (503, 3)])
+def test_client_errors_are_not_retried(server, monkeypatch, status,
+                                       requests):
+    monkeypatch.setattr(config, 'DOWNLOAD_RETRIES', 2)
+    server.status = status
+    with pytest.raises(bucket.ListingError):
+        list(bucket.list_objects(url(server)))
+    assert len(server.markers) == requests
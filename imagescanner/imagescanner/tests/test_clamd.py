@@ -0,0 +1,201 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import os
+import socket
+import socketserver
+import struct
+import threading
+import pytest
+from .. import clamd
+
+VERSION = 'ClamAV 0.100.2/25037/Mon Oct 15 08:57:49 2018'
+# clamd's reply when it cannot read a file, itself containing ': '.
+DENIED = 'lstat() failed: Permission denied. ERROR'
+
+
+def verdict(data):
+    return 'Eicar-Test-Signature FOUND' if b'EICAR' in data else 'OK'
+
+
+class FakeClamdHandler(socketserver.StreamRequestHandler):
+    """Answer the few clamd commands we use. Files whose names start with
+    'private' cannot be opened by the fake, as if owned by another user.
+
+    """
+
+    def reply(self, text):
+        self.wfile.write(text.encode('utf-8') + b'\0')
+
+    def handle(self):
+        command = b''
+        while not command.endswith(b'\0'):
+            command += self.rfile.read(1)
+        command = command[1:-1].decode('utf-8')
+        if command == 'PING':
+            self.reply('PONG')
+        elif command == 'VERSION':
+            self.reply(VERSION)
+        elif command.startswith('MULTISCAN '):
+            self.multiscan(command[len('MULTISCAN '):])
+        elif command.startswith('SCAN '):
+            self.scan(command[len('SCAN '):])
+        elif command == 'INSTREAM':
+            data = b''
+            while True:
+                size, = struct.unpack('!L', self.rfile.read(4))
+                if not size:
+                    break
+                data += self.rfile.read(size)
+            self.reply('stream: ' + verdict(data))
+
+    def scan(self, filename):
+        if os.path.basename(filename).startswith('private'):
+            self.reply(filename + ': ' + DENIED)
+        else:
+            with open(filename, 'rb') as fd:
+                self.reply(filename + ': ' + verdict(fd.read()))
+
+    def multiscan(self, path):
+        found = False
+        for root, dirs, files in os.walk(path):
+            for name in sorted(files):
+                filename = os.path.join(root, name)
+                if name.startswith('private'):
+                    self.reply(filename + ': ' + DENIED)
+                    continue
+                with open(filename, 'rb') as fd:
+                    result = verdict(fd.read())
+                if result != 'OK':
+                    found = True
+                    self.reply(filename + ': ' + result)
+        if not found:
+            self.reply(path + ': OK')
+
+
+@pytest.fixture
+def fake_clamd(tmp_path):
+    socket_path = str(tmp_path / 'clamd.sock')
+    server = socketserver.ThreadingUnixStreamServer(
+        socket_path, FakeClamdHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield clamd.Clamd(socket_path)
+    server.shutdown()
+    server.server_close()
+
+
+def test_split_reply():
+    assert clamd.split_reply('/mnt/a: b.img: Eicar FOUND', '/mnt/a: b.img') \
+        == ('/mnt/a: b.img', 'Eicar FOUND')
+    assert clamd.split_reply(
+        '/mnt/x: lstat() failed: Permission denied. ERROR', '/mnt') == (
+        '/mnt/x', 'lstat() failed: Permission denied. ERROR')
+    assert clamd.split_reply('stream: OK', 'stream') == ('stream', 'OK')
+    assert clamd.split_reply(clamd.SIZE_LIMIT_REPLY, 'stream') == (
+        '', clamd.SIZE_LIMIT_REPLY)
+
+
+def test_clamd_commands(fake_clamd):
+    assert fake_clamd.ping()
+    assert fake_clamd.version() == VERSION
+
+
+def test_clamd_scan_clean(fake_clamd, tmp_path):
+    (tmp_path / 'files').mkdir()
+    (tmp_path / 'files' / 'clean.txt').write_bytes(b'hello')
+    returncode, output = clamd.scan_directory(
+        str(tmp_path / 'files'), fake_clamd)
+    assert returncode == 0
+    assert 'Infected files: 0' in output
+
+
+def test_clamd_scan_infected(fake_clamd, tmp_path):
+    files = tmp_path / 'files'
+    files.mkdir()
+    (files / 'clean.txt').write_bytes(b'hello')
+    (files / 'virus.com').write_bytes(b'EICAR')
+    # Unreadable by clamd, so streamed to it instead.
+    (files / 'private.com').write_bytes(b'EICAR')
+    returncode, output = clamd.scan_directory(str(files), fake_clamd)
+    assert returncode == 1
+    assert '{}: Eicar-Test-Signature FOUND'.format(files / 'virus.com') in (
+        output)
+    assert '{}: Eicar-Test-Signature FOUND'.format(files / 'private.com') in (
+        output)
+    assert 'Infected files: 2' in output
+
+
+def test_clamd_unavailable(tmp_path):
+    with pytest.raises(clamd.ClamdError):
+        clamd.Clamd(str(tmp_path / 'missing.sock')).ping()
+
+
+def test_clamd_skips_files_too_large_to_stream(fake_clamd, tmp_path,
+                                               monkeypatch):
+    monkeypatch.setattr(clamd.config, 'CLAMD_STREAM_MAX_LENGTH', 4)
+    files = tmp_path / 'files'
+    files.mkdir()
+    (files / 'private.com').write_bytes(b'EICAR')
+    returncode, output = clamd.scan_directory(str(files), fake_clamd)
+    assert returncode == 0
+
+
+def test_clamd_timeout(tmp_path):
+    # A socket that accepts connections but never replies.
+    socket_path = str(tmp_path / 'hung.sock')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(1)
+    try:
+        with pytest.raises(clamd.ClamdError):
+            clamd.Clamd(socket_path, timeout=0.1).version()
+    finally:
+        listener.close()
+
+
+def test_clamd_scan_files(fake_clamd, tmp_path):
+    files = []
+    for name, data in [('clean.txt', b'hello'), ('eicar.com', b'EICAR'),
+                       ('private.txt', b'secret')]:
+        (tmp_path / name).write_bytes(data)
+        files.append(str(tmp_path / name))
+    returncode, output, clean = clamd.scan_files(files, fake_clamd)
+    assert returncode == 1
+    assert 'eicar.com: Eicar-Test-Signature FOUND' in output
+    assert sorted(clean) == [files[0], files[2]]
@@ -0,0 +1,115 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import time
+import fakeredis
+import pytest
+import redis
+from .. import coalesce, config
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(coalesce, 'get_redis', lambda: client)
+    return client
+
+
+def test_source_key_normalizes():
+    key = coalesce.source_key('https://Example.com/images.git', 'a.img')
+    assert coalesce.source_key(
+        ' HTTPS://example.com/images.git#x', '/a.img/') == key
+    assert coalesce.source_key(
+        'https://example.com/Images.git', 'a.img') != key
+    assert coalesce.source_key('https://example.com/images.git', None) \
+        == coalesce.source_key('https://example.com/images.git', '')
+
+
+def test_claim_and_release(client):
+    assert coalesce.claim('k', 'job1', {'job_id': 'job1'}) is None
+    # Claiming again is harmless.
+    assert coalesce.claim('k', 'job1', {'job_id': 'job1'}) is None
+    assert coalesce.claim('k', 'job2', {'job_id': 'job2'}) == 'job1'
+    assert coalesce.claim('k', 'job3', {'job_id': 'job3'}) == 'job1'
+    assert client.ttl(coalesce.ATTACHED_KEY.format('k')) > 0
+    # Only the owner can release the work.
+    assert coalesce.release('k', 'job2') == []
+    assert coalesce.release('k', 'job1') == [
+        {'job_id': 'job2'}, {'job_id': 'job3'}]
+    assert client.keys() == []
+    # Once released, the next job to claim the work owns it afresh.
+    assert coalesce.claim('k', 'job4', {}) is None
+
+
+def test_claims_of_a_job(client):
+    claims = coalesce.Claims('job1', {'job_id': 'job1'})
+    other = coalesce.Claims('job2', {'job_id': 'job2'})
+    assert claims.claim('a') is None
+    assert claims.claim('b') is None
+    assert other.claim('a', filename='a.img') == 'job1'
+    assert other.release('a') == []
+    assert claims.release('a') == [{'job_id': 'job2', 'filename': 'a.img'}]
+    assert claims.release('a') == []
+    assert claims.release_all() == {'b': []}
+    assert claims.owned == set()
+
+
+def test_claims_are_renewed(client, monkeypatch):
+    monkeypatch.setattr(config, 'COALESCE_RENEW', 0.05)
+    claims = coalesce.Claims('job1', {})
+    assert claims.claim('work') is None
+    claim_key = coalesce.CLAIM_KEY.format('work')
+    client.expire(claim_key, 5)
+    deadline = time.monotonic() + 5
+    while client.ttl(claim_key) <= 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.ttl(claim_key) > 5
+
+    claims.release('work')
+    assert claims.stopped is None
+    # Renewing a claim the job no longer owns leaves it be.
+    coalesce.claim('work', 'job2', {})
+    client.expire(claim_key, 5)
+    coalesce.renew(['work'], 'job1')
+    assert client.ttl(claim_key) <= 5
+
+
+def test_without_redis():
+    client = redis.Redis(port=1, socket_connect_timeout=0.1, retry=None)
+    assert coalesce.claim('k', 'job1', {}, client) is None
+    assert coalesce.release('k', 'job1', client) == []
@@ -0,0 +1,198 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import gzip
+import hashlib
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import pytest
+from .. import config, download
+
+DATA = os.urandom(1024 * 1024)
+# A gzipped image of the same size, in two members.
+IMAGE = os.urandom(700 * 1024)
+GZIPPED = gzip.compress(IMAGE[:300 * 1024]) + gzip.compress(IMAGE[300 * 1024:])
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serve DATA, or GZIPPED for paths ending in .gz, honouring Range
+    requests unless the server's ignore_range is set, and dropping the
+    connection partway through the first response to each of the server's
+    drop_at offsets. The start of each response is recorded in the server's
+    requested list.
+
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def data(self):
+        return GZIPPED if self.path.endswith('.gz') else DATA
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.data)))
+        self.send_header('ETag', '"v1"')
+        if not self.server.ignore_range:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+    def do_GET(self):
+        data = self.data
+        start, end = 0, len(data) - 1
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if match and not self.server.ignore_range:
+            start, end = int(match.group(1)), int(match.group(2))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, end, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        body = data[start:end + 1]
+        with self.server.lock:
+            self.server.requested.append(start)
+            drops = [d for d in self.server.drop_at if start <= d < end]
+            for d in drops:
+                self.server.drop_at.remove(d)
+        if drops:
+            self.wfile.write(body[:drops[0] - start])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class ImageServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    httpd = ImageServer(('127.0.0.1', 0), ImageHandler)
+    httpd.ignore_range = False
+    httpd.drop_at = []
+    httpd.requested = []
+    httpd.lock = threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        config, 'DOWNLOAD_PARTIALS_PATH', tmp_path / 'partials')
+    monkeypatch.setattr(config, 'DOWNLOAD_SEGMENT_SIZE', 64 * 1024)
+    monkeypatch.setattr(config, 'DOWNLOAD_RETRIES', 2)
+    monkeypatch.setattr(download.time, 'sleep', lambda seconds: None)
+
+
+def url(server):
+    return 'http://127.0.0.1:{}/image.img'.format(server.server_port)
+
+
+def test_probe(server):
+    assert download.probe(url(server)) == (len(DATA), True, '"v1"')
+
+
+def test_segmented_download(server, tmp_path):
+    dest = str(tmp_path / 'image.img')
+    checksums = download.download(url(server), dest, len(DATA), '"v1"')
+    assert checksums == (hashlib.sha256(DATA).hexdigest(), None)
+    with open(dest, 'rb') as fd:
+        assert fd.read() == DATA
+    partial = download.partial_path(url(server), '"v1"')
+    assert not os.path.exists(partial)
+    assert not os.path.exists(partial + '.download')
+
+
+def test_segmented_download_gunzips(server, tmp_path):
+    server.drop_at = [200000]
+    dest = str(tmp_path / 'image.img')
+    checksums = download.download(url(server) + '.gz', dest, len(GZIPPED),
+                                  '"v1"', gunzip=True)
+    assert checksums == (hashlib.sha256(GZIPPED).hexdigest(),
+                         hashlib.sha256(IMAGE).hexdigest())
+    with open(dest, 'rb') as fd:
+        assert fd.read() == IMAGE
+    assert not os.path.exists(download.partial_path(url(server) + '.gz',
+                                                    '"v1"'))
+
+
+def test_download_resumes_dropped_segments(server, tmp_path):
+    server.drop_at = [100000, 500000, 1000000]
+    dest = str(tmp_path / 'image.img')
+    download.download(url(server), dest, len(DATA), '"v1"')
+    with open(dest, 'rb') as fd:
+        assert fd.read() == DATA
+
+
+def test_download_resumes_saved_state(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'DOWNLOAD_RETRIES', 0)
+    monkeypatch.setattr(config, 'DOWNLOAD_CONNECTIONS', 1)
+    server.drop_at = [300000]
+    with pytest.raises(download.DownloadError):
+        download.download(url(server), str(tmp_path / 'first.img'),
+                          len(DATA), '"v1"')
+    partial = download.partial_path(url(server), '"v1"')
+    assert os.path.exists(partial + '.download')
+
+    # A later job, in another workspace, resumes the same download.
+    server.requested = []
+    dest = str(tmp_path / 'second.img')
+    checksums = download.download(url(server), dest, len(DATA), '"v1"')
+    assert checksums == (hashlib.sha256(DATA).hexdigest(), None)
+    with open(dest, 'rb') as fd:
+        assert fd.read() == DATA
+    # Segments completed before the failure were not fetched again.
+    assert min(server.requested) == 4 * 64 * 1024
+
+
+def test_server_ignoring_range(server, tmp_path):
+    server.ignore_range = True
+    with pytest.raises(download.RangeNotSupported):
+        download.download(url(server), str(tmp_path / 'image.img'),
+                          len(DATA), '"v1"')
@@ -0,0 +1,118 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import hashlib
+from .. import config, fileindex, partitions, resultcache
+
+
+def test_known_files(tmp_path):
+    index = fileindex.FileIndex(tmp_path / 'files.sqlite3', 10)
+    index.add({'a': 1, 'b': 2}, '25037')
+    assert index.known(['a', 'c'], '25037') == {'a'}
+    assert index.known(['a', 'b'], '25038') == set()
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    index = fileindex.FileIndex(tmp_path / 'files.sqlite3', 3)
+    index.add({'a': 1, 'b': 1, 'c': 1}, '25037')
+    index.known(['a'], '25037')
+    index.add({'d': 1}, '25037')
+    assert index.known('abcd', '25037') == {'a', 'c', 'd'}
+
+
+def test_many_checksums(tmp_path):
+    index = fileindex.FileIndex(tmp_path / 'files.sqlite3', 5000)
+    checksums = {str(n): n for n in range(2000)}
+    index.add(checksums, '25037')
+    assert index.known(list(checksums) + ['x'], '25037') == set(checksums)
+
+
+def test_scan_skips_known_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'FILE_INDEX_PATH', tmp_path / 'files.sqlite3')
+    monkeypatch.setattr(resultcache, 'signature_version', lambda: '25037')
+    scanned = []
+
+    def scan_files(filenames):
+        scanned.append(sorted(filenames))
+        clean = [name for name in filenames if 'eicar' not in name]
+        return len(clean) < len(filenames), 'scanned\n', clean
+
+    monkeypatch.setattr(partitions, 'scan_files', scan_files)
+    first, second = tmp_path / 'first', tmp_path / 'second'
+    for root, version in [(first, b'1'), (second, b'2')]:
+        (root / 'etc').mkdir(parents=True)
+        (root / 'etc' / 'passwd').write_bytes(b'root:x:0:0')
+        (root / 'etc' / 'version').write_bytes(version)
+        (root / 'eicar.com').write_bytes(b'EICAR')
+        (root / 'link').symlink_to(root / 'etc' / 'passwd')
+
+    status, output = partitions.scan_directory(str(first))
+    assert status == 1
+    assert 'Skipped files: 0 (0 bytes)' in output
+
+    status, output = partitions.scan_directory(str(second))
+    assert status == 1
+    assert scanned[1] == [str(second / 'eicar.com'),
+                          str(second / 'etc' / 'version')]
+    assert 'Skipped files: 1 (10 bytes)' in output
+    assert fileindex.get_index().known(
+        [hashlib.sha256(b'EICAR').hexdigest()], '25037') == set()
+
+
+def test_scan_without_usable_index(tmp_path, monkeypatch):
+    # The index cannot be opened, and the scanner spells paths its own way.
+    monkeypatch.setattr(config, 'FILE_INDEX_PATH', tmp_path)
+    monkeypatch.setattr(resultcache, 'signature_version', lambda: '25037')
+    monkeypatch.setattr(
+        partitions, 'scan_files',
+        lambda filenames: (0, 'scanned\n', [
+            name.replace('/root/', '/root//') for name in filenames]))
+    root = tmp_path / 'root'
+    (root / 'etc').mkdir(parents=True)
+    (root / 'etc' / 'passwd').write_bytes(b'root:x:0:0')
+
+    status, output = partitions.scan_directory(str(root))
+    assert status == 0
+    assert 'File index unavailable' in output
+    assert 'Cannot record clean files' in output
+
+    monkeypatch.setattr(config, 'FILE_INDEX_PATH', tmp_path / 'files.sqlite3')
+    status, output = partitions.scan_directory(str(root))
+    assert 'Skipped files: 0 (0 bytes)' in output
+    assert fileindex.get_index().known(
+        [hashlib.sha256(b'root:x:0:0').hexdigest()], '25037')
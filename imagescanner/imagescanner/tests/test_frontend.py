@@ -36,10 +36,302 @@
 #
 # ECOMP is a trademark and service mark of AT&T Intellectual Property.
 #
-from .. import frontend
+import json
+import os
+import threading
+import time
+import fakeredis
+import pytest
+from .. import (
+    config, download, frontend, metrics, progress, redisconn, resultstore,
+    routing, scanpool, tasks, workers,
+    )
+
+CHECKSUM = 'a' * 64
 
 
 def test_frontend_invalid():
     app = frontend.app
     resp = app.test_client().get('/imagescanner/result/invalidlocation')
     assert resp.status_code == 404
+
+
+def test_form_shows_workers_and_jobs(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(progress, 'get_redis', lambda: client)
+    monkeypatch.setattr(workers, 'get_redis', lambda: client)
+    client.hset(workers.WORKERS_KEY, 'celery@node1', json.dumps({
+        'hostname': 'celery@node1', 'time': time.time() - 100,
+        'active': [{'id': 'a', 'args': ['images.git', 'a.img']}],
+        'reserved': []}))
+    client.rpush('scans', 'message')
+    with progress.tracking('job1', source='images.git', path='a.img') as job:
+        job.event('scan', "Scanning", image='repo/a.img', bytes=1024)
+    progress.queued({'job2': {'source': 'images.git', 'path': 'b.img'}})
+
+    resp = frontend.app.test_client().get('/imagescanner')
+    assert resp.status_code == 200
+    page = resp.get_data(as_text=True)
+    assert 'celery@node1: 1 executing, 0 reserved' in page
+    assert '(STALE)' in page
+    assert '1 waiting in the queue' in page
+    assert "[&#39;images.git&#39;, &#39;a.img&#39;]" in page
+    assert 'scan: Scanning repo/a.img (1024 bytes)' in page
+    assert 'images.git b.img (queued)' in page
+    assert '0.0s queued: Queued' in page
+
+
+def test_metrics(monkeypatch):
+    monkeypatch.setattr(redisconn, '_client', fakeredis.FakeRedis(
+        decode_responses=True))
+    monkeypatch.setattr(redisconn, '_pid', os.getpid())
+    metrics.observe({'scan': 2.5}, 100)
+    redisconn.get_redis().rpush(routing.queue_name('small') + ':3', 'message')
+
+    resp = frontend.app.test_client().get('/imagescanner/metrics')
+    assert resp.status_code == 200
+    assert resp.headers['Content-Type'].startswith(
+        'text/plain; version=0.0.4')
+    text = resp.get_data(as_text=True)
+    assert 'imagescanner_stage_seconds_sum{stage="scan"} 2.5\n' in text
+    assert 'imagescanner_queue_depth{queue="scans.small"} 1\n' in text
+    assert 'imagescanner_queue_depth{queue="celery"} 0\n' in text
+
+
+def test_profile_downloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'LOGS_PATH', tmp_path)
+    (tmp_path / 'Profile-job1.txt').write_text('report')
+    (tmp_path / 'Profile-job1.pstats').write_bytes(b'stats')
+    client = frontend.app.test_client()
+
+    resp = client.get('/imagescanner/profile/job1')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+    assert resp.get_data() == b'report'
+    resp = client.get('/imagescanner/profile/job1/pstats')
+    assert resp.get_data() == b'stats'
+    assert resp.headers['Content-Disposition'].startswith('attachment')
+    assert client.get(
+        '/imagescanner/profile/job1/tracemalloc').status_code == 404
+    assert client.get('/imagescanner/profile/job2').status_code == 404
+
+
+@pytest.fixture
+def logfile(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'LOGS_PATH', tmp_path)
+    monkeypatch.setattr(config, 'LOG_TAIL_POLL_INTERVAL', 0.01)
+    logfile = tmp_path / 'SecurityValidation-{}.txt'.format(CHECKSUM)
+    logfile.write_text('Launching image scan\n')
+    return logfile
+
+
+def test_result_log_is_cacheable(logfile):
+    client = frontend.app.test_client()
+    url = '/imagescanner/result/' + CHECKSUM
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.get_data() == b'Launching image scan\n'
+    assert resp.cache_control.public
+    assert resp.cache_control.max_age == config.LOG_CACHE_MAX_AGE
+
+    etag = resp.headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    resp = client.get(url, headers={'Range': 'bytes=10-14'})
+    assert resp.status_code == 206
+    assert resp.get_data() == b'image'
+
+
+def test_running_result_log_is_not_cached(logfile):
+    lock = scanpool.FileLock(logfile.with_suffix('.lock'))
+    lock.acquire()
+    try:
+        resp = frontend.app.test_client().get(
+            '/imagescanner/result/' + CHECKSUM)
+        assert resp.cache_control.no_cache
+    finally:
+        lock.release()
+
+
+def tail(offset, wait=0):
+    return frontend.app.test_client().get(
+        '/imagescanner/result/{}/tail?offset={}&wait={}'.format(
+            CHECKSUM, offset, wait))
+
+
+def test_tail_finished_log(logfile):
+    resp = tail(10)
+    assert resp.get_data() == b'image scan\n'
+    assert resp.headers['X-Log-Offset'] == '21'
+    assert resp.headers['X-Log-Complete'] == 'true'
+
+    resp = tail(21, wait=5)
+    assert resp.get_data() == b''
+    assert resp.headers['X-Log-Complete'] == 'true'
+
+    resp = tail(100)
+    assert resp.headers['X-Log-Reset'] == 'true'
+    assert resp.get_data() == b'Launching image scan\n'
+
+
+def test_tail_waits_for_running_scan(logfile):
+    lock = scanpool.FileLock(logfile.with_suffix('.lock'))
+    lock.acquire()
+    try:
+        resp = tail(21, wait=0.1)
+        assert resp.get_data() == b''
+        assert resp.headers['X-Log-Offset'] == '21'
+        assert resp.headers['X-Log-Complete'] == 'false'
+
+        def scan():
+            time.sleep(0.2)
+            with logfile.open('a') as fd:
+                fd.write('clean\n')
+
+        thread = threading.Thread(target=scan)
+        thread.start()
+        resp = tail(21, wait=5)
+        thread.join()
+        assert resp.get_data() == b'clean\n'
+        assert resp.headers['X-Log-Complete'] == 'false'
+    finally:
+        lock.release()
+    assert tail(27).headers['X-Log-Complete'] == 'true'
+
+
+def test_tail_missing_log(logfile):
+    logfile.unlink()
+    assert tail(0).status_code == 404
+
+
+def test_results_api(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        config, 'RESULT_STORE_PATH', tmp_path / 'results.sqlite3')
+    store = resultstore.get_store()
+    for n in range(3):
+        store.record(source='images.git', filename='a.img',
+                     checksum=str(n) * 64, returncode=n % 2)
+    client = frontend.app.test_client()
+
+    resp = client.get('/imagescanner/api/results?limit=2')
+    assert resp.status_code == 200
+    page = resp.get_json()
+    assert [r['checksum'][0] for r in page['results']] == ['2', '1']
+    page = client.get(page['next']).get_json()
+    assert [r['checksum'][0] for r in page['results']] == ['0']
+    assert page['next'] is None
+
+    page = client.get('/imagescanner/api/results?verdict=infected').get_json()
+    assert [r['checksum'][0] for r in page['results']] == ['1']
+
+    for query in ('limit=0', 'limit=x', 'since=yesterday', 'colour=red'):
+        resp = client.get('/imagescanner/api/results?' + query)
+        assert resp.status_code == 400
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    """Queue tasks in Celery's in-memory transport, with a fake Redis, and
+    return a function that takes the messages queued for scans, with the
+    queue of each. Images at example.com are 100 MB.
+
+    """
+    monkeypatch.setitem(tasks.celery_app.conf, 'broker_url', 'memory://')
+    monkeypatch.setattr(redisconn, '_client', fakeredis.FakeRedis(
+        decode_responses=True))
+    monkeypatch.setattr(redisconn, '_pid', os.getpid())
+    monkeypatch.setattr(download, 'probe', lambda url: (100 * 10**6, 0, 0))
+    queues = ['scans'] + [
+        routing.queue_name(name) for name, _ in config.SIZE_CLASSES]
+
+    def queued():
+        messages = []
+        with tasks.celery_app.connection_for_read() as conn:
+            for name in queues:
+                queue = conn.SimpleQueue(name)
+                while queue.qsize():
+                    message = queue.get(timeout=1)
+                    message.ack()
+                    messages.append((name, message))
+                queue.close()
+        return messages
+
+    queued()
+    return queued
+
+
+def test_submit_batch(broker, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        config, 'RESULT_STORE_PATH', tmp_path / 'results.sqlite3')
+    client = frontend.app.test_client()
+    resp = client.post('/imagescanner/api/scans', json=[
+        {'source': 'https://example.com/a.img', 'recipients': ['#a']},
+        {'source': 'https://example.com/images.git', 'path': '/b.img'},
+        {'source': ' https://example.com/a.img', 'recipients': ['#b', '#a'],
+         'profile': True},
+        ])
+    assert resp.status_code == 202
+    jobs = resp.get_json()['jobs']
+    assert [job['duplicate'] for job in jobs] == [False, False, True]
+    assert jobs[0]['job_id'] == jobs[2]['job_id']
+
+    # The repository's images are of unknown size.
+    messages = broker()
+    assert [(q, m.headers['id']) for q, m in messages] == [
+        ('scans.small', jobs[0]['job_id']),
+        ('scans.medium', jobs[1]['job_id'])]
+    kwargs = [m.decode()[1] for _, m in messages]
+    assert kwargs[0]['recipients'] == ['#a', '#b']
+    assert kwargs[0]['profile'] is True
+    assert kwargs[1]['path'] == 'b.img'
+    assert 'profile' not in kwargs[1]
+
+    status = client.get(jobs[1]['status']).get_json()
+    assert status['job']['state'] == 'queued'
+    assert status['job']['path'] == 'b.img'
+    assert status['results'] == []
+    assert client.get('/imagescanner/api/scans/unknown').status_code == 404
+
+
+def test_submit_batch_does_not_wait_for_slow_sizes(broker, monkeypatch):
+    released = threading.Event()
+
+    def probe(url):
+        if 'slow' in url:
+            released.wait(10)
+        return 100 * 10**6, 0, 0
+
+    monkeypatch.setattr(download, 'probe', probe)
+    monkeypatch.setattr(config, 'SIZE_ESTIMATE_TIMEOUT', 0.1)
+    client = frontend.app.test_client()
+    start = time.monotonic()
+    resp = client.post('/imagescanner/api/scans', json=[
+        {'source': 'https://example.com/a.img'},
+        {'source': 'https://slow.example.com/b.img'},
+        ])
+    assert time.monotonic() - start < 5
+    released.set()
+    assert resp.status_code == 202
+    jobs = resp.get_json()['jobs']
+    assert [(q, m.headers['id']) for q, m in broker()] == [
+        ('scans.small', jobs[0]['job_id']),
+        (routing.queue_name(config.SIZE_CLASS_UNKNOWN), jobs[1]['job_id'])]
+
+
+def test_submit_batch_rejects_invalid(broker):
+    client = frontend.app.test_client()
+    resp = client.post('/imagescanner/api/scans', json=[
+        {'source': 'https://example.com/a.img'},
+        {'source': 'ftp://example.com/a.img'},
+        {'path': 'a.img'},
+        {'source': 'https://example.com/a.img', 'recipients': '#a'},
+        {'source': 'https://example.com/a.img', 'checklist_uuid': 'x'},
+        {'source': 'https://example.com/a.img', 'colour': 'red'},
+        {'source': 'https://example.com/a.img', 'profile': 'yes'},
+        ])
+    assert resp.status_code == 400
+    errors = resp.get_json()['errors']
+    assert [error['index'] for error in errors] == [1, 2, 3, 4, 5, 6]
+    assert broker() == []
+    for body in ({'source': 'https://example.com/a.img'}, []):
+        assert client.post(
+            '/imagescanner/api/scans', json=body).status_code == 400
@@ -0,0 +1,155 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import subprocess
+from pathlib import Path
+import pytest
+from .. import config, gitmirror
+
+GIT = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+
+
+def git(*args, **kwargs):
+    return subprocess.run(GIT + list(args), check=True,
+                          stdout=subprocess.PIPE, **kwargs).stdout.decode()
+
+
+class Origin(object):
+    """A bare repository serving partial clones, and a work tree from which
+    commits are pushed to it.
+
+    """
+
+    def __init__(self, tmp_path):
+        self.work = tmp_path / 'work'
+        self.bare = tmp_path / 'origin.git'
+        git('init', '-q', str(self.work))
+        git('init', '-q', '--bare', str(self.bare))
+        git('-C', str(self.bare), 'config', 'uploadpack.allowFilter', 'true')
+        self.url = 'file://{}'.format(self.bare)
+
+    def commit(self, files):
+        for name, data in files.items():
+            path = self.work / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        git('-C', str(self.work), 'add', '.')
+        git('-C', str(self.work), 'commit', '-q', '-m', 'update')
+        git('-C', str(self.work), 'push', '-q', str(self.bare),
+            'HEAD:refs/heads/master')
+
+
+@pytest.fixture
+def origin(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'GIT_MIRRORS_PATH', tmp_path / 'mirrors')
+    monkeypatch.setattr(gitmirror, 'GIT_ENV', {})
+    origin = Origin(tmp_path)
+    origin.commit({
+        'images/base.img': b'base' * 1000,
+        'images/other.qcow2': b'other' * 1000,
+        'docs/README': b'readme',
+        })
+    return origin
+
+
+def is_image(path):
+    return path.endswith(('.img', '.qcow2'))
+
+
+def missing_blobs(url):
+    """Return how many file contents the mirror of url has not fetched."""
+    objects = git('-C', gitmirror.mirror_path(url), 'rev-list', '--objects',
+                  '--missing=print', 'HEAD')
+    return sum(line.startswith('?') for line in objects.split())
+
+
+def test_checkout_selected_files(origin, tmp_path):
+    dest = tmp_path / 'repo'
+    paths = gitmirror.checkout(origin.url, str(dest), is_image)
+    assert sorted(paths) == ['images/base.img', 'images/other.qcow2']
+    assert (dest / 'images' / 'base.img').read_bytes() == b'base' * 1000
+    assert not (dest / 'docs').exists()
+    # The mirror fetched the contents of the images only.
+    assert missing_blobs(origin.url) == 1
+
+
+def test_checkout_single_path(origin, tmp_path):
+    dest = tmp_path / 'repo'
+    paths = gitmirror.checkout(
+        origin.url, str(dest), lambda path: path == 'images/other.qcow2')
+    assert paths == ['images/other.qcow2']
+    assert [p.name for p in (dest / 'images').iterdir()] == ['other.qcow2']
+    assert missing_blobs(origin.url) == 2
+
+
+def test_checkout_paths_are_literal(origin, tmp_path):
+    # Not pathspec magic, nor patterns, but names.
+    origin.commit({':base.img': b'colon', ':!*.img': b'exclude'})
+    dest = tmp_path / 'repo'
+    paths = gitmirror.checkout(origin.url, str(dest),
+                               lambda path: path.startswith(':'))
+    assert sorted(paths) == [':!*.img', ':base.img']
+    assert sorted(p.name for p in dest.iterdir()) == [':!*.img', ':base.img']
+
+
+def test_interrupted_clone_is_cleared(origin, tmp_path):
+    partial = Path(gitmirror.mirror_path(origin.url) + '.tmp')
+    (partial / 'objects').mkdir(parents=True)
+    paths = gitmirror.checkout(origin.url, str(tmp_path / 'repo'), is_image)
+    assert sorted(paths) == ['images/base.img', 'images/other.qcow2']
+    assert not partial.exists()
+
+
+def test_mirror_is_updated(origin, tmp_path):
+    gitmirror.checkout(origin.url, str(tmp_path / 'first'), is_image)
+    origin.commit({'images/base.img': b'changed', 'images/new.img': b'new'})
+
+    dest = tmp_path / 'second'
+    paths = gitmirror.checkout(origin.url, str(dest), is_image)
+    assert sorted(paths) == [
+        'images/base.img', 'images/new.img', 'images/other.qcow2']
+    assert (dest / 'images' / 'base.img').read_bytes() == b'changed'
+    assert (tmp_path / 'first' / 'images' / 'base.img').read_bytes() == (
+        b'base' * 1000)
+
+
+def test_submodules_are_left_to_the_caller(origin, tmp_path):
+    origin.commit({'.gitmodules': b''})
+    dest = tmp_path / 'repo'
+    assert gitmirror.checkout(origin.url, str(dest), is_image) is None
+    assert not (dest / 'images').exists()
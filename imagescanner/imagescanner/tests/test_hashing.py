@@ -0,0 +1,89 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import gzip
+import hashlib
+import io
+import pytest
+from ..hashing import (
+    copy_and_hash, copy_and_hash_gunzip, gunzip_file, sha256_file,
+    )
+
+
+@pytest.mark.parametrize('size', [0, 1, 4095, 4096, 4097, 10000])
+def test_sha256_file(tmp_path, size):
+    data = bytes(range(256)) * (size // 256) + b'x' * (size % 256)
+    path = tmp_path / 'image.img'
+    path.write_bytes(data)
+    assert sha256_file(str(path), bufsize=4096) == (
+        hashlib.sha256(data).hexdigest())
+
+
+def test_copy_and_hash():
+    data = b'disk image' * 1000
+    dst = io.BytesIO()
+    checksum = copy_and_hash(io.BytesIO(data), dst, bufsize=4096)
+    assert dst.getvalue() == data
+    assert checksum == hashlib.sha256(data).hexdigest()
+
+
+def test_copy_and_hash_gunzip():
+    data = b'\0' * 100000 + b'disk image' * 1000
+    compressed = gzip.compress(data[:50000]) + gzip.compress(data[50000:])
+    dst = io.BytesIO()
+    checksums = copy_and_hash_gunzip(io.BytesIO(compressed), dst,
+                                     bufsize=4096)
+    assert dst.getvalue() == data
+    assert checksums == (hashlib.sha256(compressed).hexdigest(),
+                         hashlib.sha256(data).hexdigest())
+
+
+def test_copy_and_hash_gunzip_truncated():
+    compressed = gzip.compress(b'disk image' * 1000)
+    with pytest.raises(ValueError):
+        copy_and_hash_gunzip(io.BytesIO(compressed[:-10]), io.BytesIO())
+
+
+def test_gunzip_file(tmp_path):
+    data = b'disk image' * 1000
+    path = tmp_path / 'image.qcow2.gz'
+    path.write_bytes(gzip.compress(data))
+    compressed, decompressed = gunzip_file(str(path))
+    assert not path.exists()
+    assert (tmp_path / 'image.qcow2').read_bytes() == data
+    assert decompressed == hashlib.sha256(data).hexdigest()
@@ -0,0 +1,133 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+#
+import json
+import os
+import time
+import fakeredis
+import pytest
+from .. import config, metrics, redisconn
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redisconn, '_client', client)
+    monkeypatch.setattr(redisconn, '_pid', os.getpid())
+    monkeypatch.setattr(config, 'METRICS_BUCKETS', [1, 10])
+    monkeypatch.setattr(metrics, '_gauges', None)
+    return client
+
+
+def samples(text):
+    """Return the value of each sample in text, by its name and labels."""
+    return dict(
+        line.rsplit(' ', 1) for line in text.splitlines()
+        if not line.startswith('#'))
+
+
+def test_stage_histograms(client):
+    metrics.observe({'retrieve': 0.5, 'scan': 5}, 1000)
+    metrics.observe({'scan': 50}, 3000)
+    text = metrics.render()
+    assert text.index('# TYPE imagescanner_stage_seconds histogram') < \
+        text.index('imagescanner_stage_seconds_bucket')
+    found = samples(text)
+    assert found['imagescanner_stage_seconds_bucket'
+                 '{le="1.0",stage="retrieve"}'] == '1'
+    assert found['imagescanner_stage_seconds_bucket'
+                 '{le="1.0",stage="scan"}'] == '0'
+    assert found['imagescanner_stage_seconds_bucket'
+                 '{le="10.0",stage="scan"}'] == '1'
+    assert found['imagescanner_stage_seconds_bucket'
+                 '{le="+Inf",stage="scan"}'] == '2'
+    assert float(found['imagescanner_stage_seconds_sum{stage="scan"}']) == 55
+    assert found['imagescanner_stage_seconds_count{stage="scan"}'] == '2'
+    assert found['imagescanner_stage_bytes_total{stage="scan"}'] == '4000'
+
+    # Buckets come in order of their bounds, +Inf last, as Prometheus
+    # requires.
+    scan = [line for line in text.splitlines()
+            if line.startswith('imagescanner_stage_seconds_bucket')
+            and 'stage="scan"' in line]
+    assert ['1.0', '10.0', '+Inf'] == [
+        line.split('le="')[1].split('"')[0] for line in scan]
+
+
+def test_counters(client):
+    metrics.count(metrics.CACHE_LOOKUPS, cache='result', result='hit')
+    metrics.count(metrics.CACHE_LOOKUPS, 3, cache='result', result='hit')
+    found = samples(metrics.render())
+    assert found[
+        'imagescanner_cache_lookups_total{cache="result",result="hit"}'] == '4'
+
+
+def test_gauges_add_up_across_processes(client, monkeypatch):
+    monkeypatch.setattr(config, 'METRICS_INTERVAL', 0.05)
+    metrics.gauge_add(metrics.SCANS_IN_FLIGHT, 1)
+    metrics.gauge_add(metrics.SCANS_IN_FLIGHT, 1)
+    # Another process, and one that died long ago.
+    client.hset(metrics.GAUGES_KEY, mapping={
+        metrics.SCANS_IN_FLIGHT + '|node2:1': json.dumps([3, time.time()]),
+        metrics.SCANS_IN_FLIGHT + '|node3:1': json.dumps([5, 0]),
+        })
+    text = metrics.render(
+        [(metrics.QUEUE_DEPTH, {'queue': 'scans.small'}, 7)])
+    found = samples(text)
+    assert found['imagescanner_scans_in_flight'] == '5'
+    assert found['imagescanner_queue_depth{queue="scans.small"}'] == '7'
+    assert client.hlen(metrics.GAUGES_KEY) == 2
+
+    # The process's part is reported again, though it does not change.
+    metrics.gauge_add(metrics.SCANS_IN_FLIGHT, -2)
+    mine = metrics.SCANS_IN_FLIGHT + '|' + metrics._gauges.ident
+    reported = json.loads(client.hget(metrics.GAUGES_KEY, mine))
+    time.sleep(0.2)
+    value, when = json.loads(client.hget(metrics.GAUGES_KEY, mine))
+    assert value == 0 and when > reported[1]
+
+
+def test_unreachable_redis_is_not_an_error(client, monkeypatch, capsys):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(redisconn, '_client', fakeredis.FakeRedis(
+        server=server))
+    metrics.observe({'scan': 1})
+    metrics.count(metrics.CACHE_LOOKUPS, cache='result', result='miss')
+    assert 'Cannot record metrics' in capsys.readouterr().err
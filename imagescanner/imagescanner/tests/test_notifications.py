@@ -0,0 +1,258 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from types import ModuleType
+import fakeredis
+import pytest
+from .. import config, notifications, redisconn, sessions, tasks
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Accept posted JSON, answering each path with the statuses the server's
+    replies list for it, in turn, and then with 200. A status may be a pair of
+    the status and a Retry-After. Each post is recorded in the server's
+    posted list, as its time, path and JSON.
+
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            self.server.posted.append(
+                (time.monotonic(), self.path, json.loads(body.decode())))
+            replies = self.server.replies.get(self.path) or [200]
+            reply = replies.pop(0)
+        time.sleep(self.server.latency)
+        status, retry_after = reply if isinstance(reply, tuple) else (
+            reply, None)
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+
+class WebhookServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    httpd = WebhookServer(('127.0.0.1', 0), WebhookHandler)
+    httpd.replies = {}
+    httpd.posted = []
+    httpd.latency = 0
+    httpd.lock = threading.Lock()
+    httpd.url = 'http://127.0.0.1:{}'.format(httpd.server_port)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(sessions, '_sessions', {})
+    monkeypatch.setattr(redisconn, '_client', fakeredis.FakeRedis(
+        decode_responses=True))
+    monkeypatch.setattr(redisconn, '_pid', os.getpid())
+    yield httpd
+    httpd.shutdown()
+
+
+def dispatcher(rates=None, retries=3):
+    return notifications.Dispatcher(
+        concurrency=8, retries=retries, backoff=0.01, max_backoff=1,
+        rates=rates or {})
+
+
+def test_delivery(webhook):
+    future = dispatcher().submit(
+        '127.0.0.1', lambda: notifications.post(webhook.url + '/a', {'n': 1}),
+        {'kind': 'test'})
+    assert future.result() is True
+    (_, path, payload), = webhook.posted
+    assert (path, payload) == ('/a', {'n': 1})
+
+
+def test_retries_with_backoff(webhook):
+    webhook.replies['/a'] = [500, 503]
+    webhook.replies['/b'] = [400]
+    d = dispatcher()
+    a = d.submit('127.0.0.1',
+                 lambda: notifications.post(webhook.url + '/a', {}), {})
+    b = d.submit('127.0.0.1',
+                 lambda: notifications.post(webhook.url + '/b', {}), {})
+    assert a.result() is True
+    # A client error is not retried, but recorded.
+    assert b.result() is False
+    assert [path for _, path, _ in webhook.posted].count('/a') == 3
+    assert [path for _, path, _ in webhook.posted].count('/b') == 1
+
+
+def test_retry_after_holds_back_the_host(webhook):
+    webhook.replies['/a'] = [(429, 0.3)]
+    d = dispatcher()
+    start = time.monotonic()
+    a = d.submit('127.0.0.1',
+                 lambda: notifications.post(webhook.url + '/a', {}), {})
+    time.sleep(0.1)
+    b = d.submit('127.0.0.1',
+                 lambda: notifications.post(webhook.url + '/b', {}), {})
+    assert a.result() and b.result()
+    times = {path: when for when, path, _ in webhook.posted}
+    assert times['/b'] - start >= 0.3
+    assert times['/a'] - start >= 0.3
+
+
+def test_rate_limit(webhook):
+    d = dispatcher(rates={'127.0.0.1': 20})
+    started = []
+
+    def send():
+        # When the dispatcher lets the post go, not when it arrives, which
+        # would be subject to the scheduling of the server's threads.
+        started.append(time.monotonic())
+        return notifications.post(webhook.url, {})
+
+    futures = [d.submit('127.0.0.1', send, {}) for _ in range(5)]
+    assert all(future.result() for future in futures)
+    times = sorted(started)
+    assert times[-1] - times[0] >= 4 / 20 - 0.01
+
+
+def test_dead_letters(webhook):
+    webhook.replies['/a'] = [500] * 10
+    d = dispatcher(retries=2)
+    assert d.submit(
+        '127.0.0.1', lambda: notifications.post(webhook.url + '/a', {}),
+        {'kind': 'slack', 'channel': '#scans'}).result() is False
+    letter, = notifications.dead_letters(10)
+    assert letter['channel'] == '#scans'
+    assert letter['error'].startswith('Retry: 500')
+    assert len(webhook.posted) == 3
+
+
+def test_slack_notify_delivers_concurrently(webhook, monkeypatch):
+    webhook.latency = 0.2
+    monkeypatch.setattr(tasks, 'SLACK_TOKEN', 'token')
+    monkeypatch.setattr(tasks, 'SLACK_WEBHOOK', webhook.url + '/hooks/{}')
+    monkeypatch.setattr(notifications, '_dispatcher', dispatcher())
+    monkeypatch.setattr(notifications, '_pid', os.getpid())
+    start = time.monotonic()
+    tasks.slack_notify('Success', 'images.git', 'repo/a.img', 'a' * 64,
+                       ['#a', '#b', '#c', '#d'])
+    assert time.monotonic() - start < 0.6
+    assert sorted(p['channel'] for _, _, p in webhook.posted) == [
+        '#a', '#b', '#c', '#d']
+    assert {path for _, path, _ in webhook.posted} == {'/hooks/token'}
+
+
+@pytest.fixture
+def jenkins(monkeypatch):
+    """Install a stand-in jenkins module, whose server fails each build
+    with the exceptions in its failures list, in turn.
+
+    """
+    module = ModuleType('jenkins')
+
+    class JenkinsException(Exception):
+        pass
+
+    class NotFoundException(JenkinsException):
+        pass
+
+    class Jenkins(object):
+        instances = []
+
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+            self.crumb = None
+            self.builds = []
+            self.failures = []
+            self.instances.append(self)
+
+        def build_job(self, name, parameters):
+            if self.crumb is None:
+                self.crumb = 'crumb{}'.format(len(self.builds))
+            if self.failures:
+                raise self.failures.pop(0)
+            self.builds.append((name, parameters, self.crumb))
+
+    module.Jenkins = Jenkins
+    module.JenkinsException = JenkinsException
+    module.NotFoundException = NotFoundException
+    monkeypatch.setitem(sys.modules, 'jenkins', module)
+    monkeypatch.setattr(notifications, '_jenkins', None)
+    monkeypatch.setattr(notifications, '_dispatcher', dispatcher())
+    monkeypatch.setattr(notifications, '_pid', os.getpid())
+    monkeypatch.setattr(redisconn, '_client', fakeredis.FakeRedis(
+        decode_responses=True))
+    monkeypatch.setattr(redisconn, '_pid', os.getpid())
+    return module
+
+
+def test_jenkins_client_is_kept(jenkins):
+    tasks.jenkins_notify('job', 0, 'a' * 64, 'uuid1')
+    tasks.jenkins_notify('job', 1, 'b' * 64, 'uuid2')
+    server, = jenkins.Jenkins.instances
+    assert server.kwargs['timeout'] == config.NOTIFY_TIMEOUT
+    assert [build[1]['status'] for build in server.builds] == [0, 1]
+    # Both builds used the crumb fetched for the first.
+    assert {build[2] for build in server.builds} == {'crumb0'}
+
+
+def test_jenkins_failures(jenkins):
+    server = notifications.get_jenkins()
+    server.crumb = 'stale'
+    server.failures = [jenkins.JenkinsException("403 No valid crumb")]
+    tasks.jenkins_notify('job', 0, 'a' * 64, 'uuid1')
+    # The crumb was fetched anew for the retry.
+    assert server.builds[0][2] == 'crumb0'
+
+    server.failures = [jenkins.NotFoundException("no such job")]
+    tasks.jenkins_notify('missing', 0, 'a' * 64, 'uuid1')
+    letter, = notifications.dead_letters(10)
+    assert letter['job'] == 'missing'
+    assert letter['error'] == 'NotFoundException: no such job'
@@ -0,0 +1,144 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import io
+import os
+import pytest
+from .. import config, overlay, partitions, resultcache
+from ..hashing import sha256_file
+
+MAP = [
+    {'start': 0, 'length': 65536, 'depth': 0, 'data': True, 'zero': False},
+    {'start': 65536, 'length': 65536, 'depth': 0, 'data': False,
+     'zero': True},
+    {'start': 131072, 'length': 65536, 'depth': 1, 'data': True,
+     'zero': False},
+    {'start': 196608, 'length': 65536, 'depth': 0, 'data': True,
+     'zero': False},
+    ]
+
+
+@pytest.fixture
+def qemu_img(tmp_path, monkeypatch):
+    """Stand in for qemu-img, describing tmp_path/overlay.qcow2 as an overlay
+    on tmp_path/base.qcow2 allocating MAP.
+
+    """
+    (tmp_path / 'base.qcow2').write_bytes(b'base')
+    (tmp_path / 'overlay.qcow2').write_bytes(b'overlay')
+
+    def qemu_img(command, output, image):
+        if command == 'map':
+            return MAP
+        return {'backing-filename': 'base.qcow2'}
+
+    monkeypatch.setattr(overlay, '_qemu_img', qemu_img)
+    monkeypatch.setattr(config, 'RESULT_CACHE_PATH', tmp_path / 'cache')
+    monkeypatch.setattr(resultcache, 'signature_version', lambda: '25037')
+    return str(tmp_path / 'overlay.qcow2')
+
+
+def test_allocated_ranges(qemu_img):
+    assert overlay.allocated_ranges(qemu_img) == [
+        (0, 131072), (196608, 262144)]
+
+
+def test_overlaps():
+    ranges = [(0, 10), (20, 30)]
+    assert overlay._overlaps(ranges, 5, 6)
+    assert overlay._overlaps(ranges, 15, 21)
+    assert overlay._overlaps(ranges, 29, 40)
+    assert not overlay._overlaps(ranges, 10, 20)
+    assert not overlay._overlaps(ranges, 30, 40)
+
+
+def test_base_result(qemu_img, tmp_path):
+    assert overlay.base_result(qemu_img) is None
+    base = str(tmp_path / 'base.qcow2')
+    resultcache.get_cache().put(sha256_file(base), '25037', 0)
+    assert overlay.base_result(qemu_img) == (
+        base, sha256_file(base), '25037')
+
+
+def test_base_checksum_is_recorded(qemu_img, tmp_path):
+    base = str(tmp_path / 'base.qcow2')
+    assert overlay.base_checksum(base) == sha256_file(base)
+    # The checksum under which request_scan cached the image retrieved.
+    overlay.keep_as_base(base, 'b' * 64)
+    assert overlay.base_checksum(base) == 'b' * 64
+    resultcache.get_cache().put('b' * 64, '25037', 0)
+    assert overlay.base_result(qemu_img) == (base, 'b' * 64, '25037')
+
+
+def test_infected_base_is_not_relied_on(qemu_img, tmp_path):
+    base = str(tmp_path / 'base.qcow2')
+    resultcache.get_cache().put(sha256_file(base), '25037', 1)
+    assert partitions.differential_ranges(qemu_img, io.StringIO()) is None
+
+
+def test_differential_ranges_are_logged(qemu_img, tmp_path):
+    base = str(tmp_path / 'base.qcow2')
+    resultcache.get_cache().put(sha256_file(base), '25037', 0)
+    out = io.StringIO()
+    assert partitions.differential_ranges(qemu_img, out) == [
+        (0, 131072), (196608, 262144)]
+    assert 'relying on the clean result for base image {}'.format(
+        base) in out.getvalue()
+    assert sha256_file(base) in out.getvalue()
+
+
+def test_changed_files(tmp_path):
+    root = tmp_path / 'fs'
+    (root / 'dir').mkdir(parents=True)
+    for name in ['old', 'dir/new', 'empty']:
+        (root / name).write_bytes(os.urandom(8192) if name != 'empty' else b'')
+    os.sync()
+    try:
+        new = list(overlay.extents(str(root / 'dir' / 'new')))
+    except OSError:
+        pytest.skip("FIEMAP is not supported here")
+    if not new:
+        pytest.skip("The filesystem stores small files inline")
+    physical, length = new[0]
+
+    # Pretend the partition starts 1 MiB into the disk.
+    offset = 1024 * 1024
+    ranges = [(offset + physical, offset + physical + 1)]
+    assert overlay.changed_files(str(root), ranges, offset) == [
+        str(root / 'dir' / 'new')]
+    assert overlay.changed_files(str(root), [(0, 1)], offset) == []
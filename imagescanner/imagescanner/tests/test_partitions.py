@@ -0,0 +1,84 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import io
+import threading
+from subprocess import CompletedProcess
+from .. import partitions
+
+RESULTS = {'nbd0p1': 0, 'nbd0p2': 1, 'nbd0p3': 0}
+
+
+def test_scan_partitions(tmp_path, monkeypatch):
+    mounted = {}
+    barrier = threading.Barrier(len(RESULTS), timeout=5)
+
+    def mount(partition, mountpoint):
+        mounted[mountpoint] = partition
+        return CompletedProcess([], 0, '')
+
+    def umount(mountpoint):
+        del mounted[mountpoint]
+        return CompletedProcess([], 0, '')
+
+    def scan_directory(path):
+        # Every partition must be mounted at once for this to return.
+        barrier.wait()
+        return RESULTS[mounted[path]], "{}: scanned\n".format(mounted[path])
+
+    monkeypatch.setattr(partitions, 'mount', mount)
+    monkeypatch.setattr(partitions, 'umount', umount)
+    monkeypatch.setattr(partitions, 'scan_directory', scan_directory)
+
+    out = io.StringIO()
+    status = partitions.scan_partitions(sorted(RESULTS), tmp_path, 3, out)
+    assert status == 1
+    assert not mounted
+    lines = [line for line in out.getvalue().splitlines()
+             if line.endswith('scanned')]
+    assert lines == ['nbd0p1: scanned', 'nbd0p2: scanned', 'nbd0p3: scanned']
+    assert out.getvalue().endswith('Scan verdict: infected\n')
+
+
+def test_scan_partitions_mount_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(partitions, 'mount',
+                        lambda *args: CompletedProcess([], 32, 'no fs\n'))
+    out = io.StringIO()
+    assert partitions.scan_partitions(['nbd0p1'], tmp_path, 1, out) == 32
+    assert 'could not mount nbd0p1' in out.getvalue()
+    assert 'Scan verdict' not in out.getvalue()
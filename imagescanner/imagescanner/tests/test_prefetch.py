@@ -0,0 +1,139 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from ..prefetch import Prefetcher
+from ..stagetimes import StageTimes
+from ..tasks import RetrievedImage
+
+
+def make_images(tmp_path, retrieved, count, size=10):
+    for n in range(count):
+        path = tmp_path / ('image%d.img' % n)
+        path.write_bytes(b'x' * size)
+        retrieved.append(n)
+        yield RetrievedImage(str(path), None, None, str(path))
+
+
+def settle(retrieved, expected):
+    deadline = time.monotonic() + 5
+    while len(retrieved) < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    return len(retrieved)
+
+
+def test_prefetch_depth(tmp_path):
+    retrieved = []
+    images = Prefetcher(make_images(tmp_path, retrieved, 5), depth=2,
+                        disk_budget=1000, times=StageTimes())
+    it = iter(images)
+    first = next(it)
+    # The first image, plus two more ahead of the consumer.
+    assert settle(retrieved, 3) == 3
+    images.release(first)
+    assert [image.path for image in it] == [
+        str(tmp_path / ('image%d.img' % n)) for n in range(1, 5)]
+    assert not (tmp_path / 'image0.img').exists()
+
+
+def test_prefetch_disk_budget(tmp_path):
+    retrieved = []
+    images = Prefetcher(make_images(tmp_path, retrieved, 5), depth=5,
+                        disk_budget=15, times=StageTimes())
+    it = iter(images)
+    first = next(it)
+    assert settle(retrieved, 2) == 2
+    images.release(first)
+    assert settle(retrieved, 3) == 3
+    images.close()
+
+
+def test_prefetch_next_returns_when_a_scan_is_done(tmp_path):
+    retrieved = []
+    images = Prefetcher(make_images(tmp_path, retrieved, 2), depth=1,
+                        disk_budget=5, times=StageTimes())
+    with images, ThreadPoolExecutor(1) as executor:
+        first = images.next()
+        # Over budget: the second image waits until the first is released.
+        scan = executor.submit(time.sleep, 0.1)
+        scan.add_done_callback(images.wake)
+        assert images.next([scan]) is None
+        images.release(first)
+        second = images.next([])
+        assert second.path == str(tmp_path / 'image1.img')
+        images.release(second)
+        with pytest.raises(StopIteration):
+            images.next()
+        with pytest.raises(StopIteration):
+            images.next()
+
+
+def test_prefetch_errors(tmp_path):
+    def failing():
+        path = str(tmp_path / 'missing.img')
+        yield RetrievedImage(path, None, None, path)
+
+    images = Prefetcher(failing(), depth=1, disk_budget=1000,
+                        times=StageTimes())
+    with pytest.raises(FileNotFoundError):
+        list(images)
+
+
+def test_prefetch_close_stops_retrieval(tmp_path):
+    closed = []
+
+    def slow_images():
+        try:
+            for n in range(5):
+                time.sleep(0.05)
+                path = tmp_path / ('image%d.img' % n)
+                path.write_bytes(b'x')
+                yield RetrievedImage(str(path), None, None, str(path))
+        finally:
+            closed.append(True)
+
+    with pytest.raises(RuntimeError):
+        with Prefetcher(slow_images(), depth=2, disk_budget=1000,
+                        times=StageTimes()) as images:
+            for image in images:
+                raise RuntimeError("scan failed")
+    assert not images.thread.is_alive()
+    assert closed == [True]
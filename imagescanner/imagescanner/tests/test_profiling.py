@@ -0,0 +1,103 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+#
+import hashlib
+import pstats
+import threading
+import tracemalloc
+from .. import config, profiling
+from ..stagetimes import StageTimes
+
+
+class Job(object):
+    job_id = 'job1'
+
+    def __init__(self):
+        self.events = []
+
+    def event(self, stage, message, **fields):
+        self.events.append(dict(fields, stage=stage))
+
+
+def checksum_in_thread(times):
+    def checksum():
+        with times.timing('checksum', 'a.img'):
+            hashlib.sha256(b'x' * 100000).hexdigest()
+
+    thread = threading.Thread(target=checksum, name='hasher')
+    thread.start()
+    thread.join()
+
+
+def test_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'LOGS_PATH', tmp_path)
+    job = Job()
+    times = StageTimes(spans=True)
+    with profiling.profiled(job, times):
+        held = [bytearray(1024) for _ in range(1000)]
+        checksum_in_thread(times)
+
+    report = (tmp_path / 'Profile-job1.txt').read_text()
+    span, = [line for line in report.splitlines() if 'hasher' in line]
+    assert span.split()[3:] == ['checksum', 'hasher', 'a.img']
+    # The function run in the thread was profiled too.
+    assert 'checksum_in_thread' in report
+    assert 'test_profiling.py:{}'.format(
+        test_profile.__code__.co_firstlineno + 5) in report
+    assert job.events == [{'stage': 'profiled',
+                           'profile': 'Profile-job1.txt'}]
+
+    stats = pstats.Stats(str(tmp_path / 'Profile-job1.pstats'))
+    functions = {name for _, _, name in stats.stats}
+    assert {'checksum_in_thread', 'checksum'} <= functions
+    snapshot = tracemalloc.Snapshot.load(
+        str(tmp_path / 'Profile-job1.tracemalloc'))
+    assert sum(s.size for s in snapshot.statistics('filename')) >= 1024000
+    assert not tracemalloc.is_tracing()
+    del held
+
+
+def test_profile_off(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'LOGS_PATH', tmp_path)
+    job = Job()
+    times = StageTimes()
+    with profiling.profiled(job, times, enabled=False):
+        checksum_in_thread(times)
+    assert list(tmp_path.iterdir()) == []
+    assert times.spans is None and job.events == []
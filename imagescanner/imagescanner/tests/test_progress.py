@@ -0,0 +1,118 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import fakeredis
+import pytest
+import redis
+from .. import config, progress
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(progress, 'get_redis', lambda: client)
+    return client
+
+
+def test_job_events(client):
+    with progress.tracking('job1', source='repo.git', path=None) as job:
+        job.event('scan', "Scanning", image='a.img', bytes=10)
+    assert job.queued is None
+    recent, = progress.recent_jobs(5)
+    assert recent['job_id'] == 'job1'
+    assert recent['source'] == 'repo.git'
+    assert recent['state'] == 'done'
+    assert [e['stage'] for e in recent['events']] == ['start', 'scan', 'done']
+    assert recent['events'][1]['bytes'] == 10
+    assert client.ttl(progress.EVENTS_KEY.format('job1')) > 0
+
+
+def test_queued_job(client):
+    progress.queued({'job1': {'source': 'a.img'}, 'job2': {'source': 'b.img'}})
+    job = progress.get_job('job2')
+    assert job['state'] == 'queued'
+    assert [e['stage'] for e in job['events']] == ['queued']
+    with progress.tracking('job2', source='b.img') as started:
+        assert started.queued == job['queued']
+    job = progress.get_job('job2')
+    assert job['state'] == 'done'
+    assert [e['stage'] for e in job['events']] == ['queued', 'start', 'done']
+    assert progress.get_job('job3') is None
+
+
+def test_failed_job(client):
+    with pytest.raises(ValueError):
+        with progress.tracking('job1', source='repo.git'):
+            raise ValueError("Path not found")
+    recent, = progress.recent_jobs(5)
+    assert recent['state'] == 'failed'
+    assert recent['error'] == 'ValueError: Path not found'
+
+
+def test_history_is_bounded(client, monkeypatch):
+    monkeypatch.setattr(config, 'PROGRESS_HISTORY', 3)
+    monkeypatch.setattr(config, 'PROGRESS_EVENTS', 4)
+    for n in range(5):
+        with progress.tracking('job%d' % n, source='repo.git') as job:
+            for m in range(10):
+                job.event('scan', "Scanning", image='%d.img' % m)
+    jobs = progress.recent_jobs(10)
+    assert [job['job_id'] for job in jobs] == ['job4', 'job3', 'job2']
+    assert [e['stage'] for e in jobs[0]['events']] == [
+        'scan', 'scan', 'scan', 'done']
+    assert not client.exists(progress.JOB_KEY.format('job0'))
+
+
+def test_queued_jobs_outlast_history(client, monkeypatch):
+    monkeypatch.setattr(config, 'PROGRESS_HISTORY', 3)
+    progress.queued({'job%d' % n: {'source': '%d.img' % n}
+                     for n in range(10)})
+    for n in range(10):
+        assert progress.get_job('job%d' % n)['state'] == 'queued'
+        with progress.tracking('job%d' % n, source='%d.img' % n):
+            pass
+    assert [job['job_id'] for job in progress.recent_jobs(10)] == [
+        'job9', 'job8', 'job7']
+    assert not client.exists(progress.QUEUED_KEY)
+
+
+def test_unreachable_redis_does_not_fail_job(monkeypatch):
+    client = redis.Redis(port=1, socket_connect_timeout=0.1)
+    monkeypatch.setattr(progress, 'get_redis', lambda: client)
+    with progress.tracking('job1', source='repo.git') as job:
+        job.event('scan', "Scanning")
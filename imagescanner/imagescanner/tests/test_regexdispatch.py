@@ -36,7 +36,12 @@
 #
 # ECOMP is a trademark and service mark of AT&T Intellectual Property.
 #
-from ..regexdispatch import regexdispatch
+import random
+import re
+
+import pytest
+
+from ..regexdispatch import _Node, regexdispatch
 
 
 @regexdispatch
@@ -59,3 +64,90 @@ def test_basic_dispatch():
     assert dispatch_fixture("abc") == "letters"
     assert dispatch_fixture("123") == "numbers"
     assert dispatch_fixture("---") == "other"
+
+
+def make_dispatcher(*regexes):
+    """Return a regexdispatch with a handler for each of regexes, each
+    returning its index and the keyword arguments it was called with.
+
+    """
+    @regexdispatch
+    def dispatcher(arg, **kwargs):
+        return None, kwargs
+
+    for n, regex in enumerate(regexes):
+        dispatcher.register(regex, lambda arg, n=n, **kwargs: (n, kwargs))
+    return dispatcher
+
+
+def sequential(regexes, arg):
+    """Dispatch as trying each regex in turn does."""
+    for n, regex in enumerate(regexes):
+        mo = re.match(regex, arg)
+        if mo is not None:
+            return n, mo.groupdict()
+    return None, {}
+
+
+def test_first_registered_handler_wins():
+    dispatcher = make_dispatcher(r'a', r'ab', r'.*')
+    assert dispatcher('ab') == (0, {})
+    assert dispatcher('b') == (2, {})
+
+
+def test_named_groups_and_overrides():
+    dispatcher = make_dispatcher(
+        r'(?P<scheme>https?)://(?P<host>[^/]*)/$',
+        r'''(?x) (?P<scheme>https?) ://   # the same names as above
+            (?P<host>[^/]*) / (?P<name>[^/]*) (?P<gz>\.gz)?$''')
+    assert dispatcher('http://h/') == (0, {'scheme': 'http', 'host': 'h'})
+    assert dispatcher('https://h/a.img') == (1, {
+        'scheme': 'https', 'host': 'h', 'name': 'a.img', 'gz': None})
+    assert dispatcher('https://h/a.img', host='other')[1]['host'] == 'other'
+
+
+def test_scoped_flags():
+    dispatcher = make_dispatcher(r'(?i)abc$', r'a.c$', r'(?s)x.y$')
+    assert dispatcher('ABC')[0] == 0
+    # The first handler's flag does not apply to the second.
+    assert dispatcher('AXC')[0] is None
+    assert dispatcher('x\ny')[0] == 2
+    assert dispatcher('a\nc')[0] is None
+
+
+@pytest.mark.parametrize('in_turn', [1, _Node.in_turn])
+def test_uncombinable_regexes_keep_their_place(monkeypatch, in_turn):
+    monkeypatch.setattr(_Node, 'in_turn', in_turn)
+    regexes = [r'(a)\1$', r'a.*', r'(?P<x>b)(?P=x)', r'(b)(?(1)c|d)']
+    dispatcher = make_dispatcher(*regexes)
+    for arg in ['aa', 'ab', 'bb', 'bc', 'bd', 'c']:
+        assert dispatcher(arg) == sequential(regexes, arg)
+
+
+@pytest.mark.parametrize('in_turn', [1, 2, _Node.in_turn])
+def test_matches_sequential_dispatch(monkeypatch, in_turn):
+    monkeypatch.setattr(_Node, 'in_turn', in_turn)
+    regexes = [r'[0-9]+$', r'(?P<word>[a-z]+)', r'(?i)(?P<word>[A-Z]+)-x',
+               r'[(](?P<num>[0-9]+)[)]', r'(x)\1', r'[^]()]-(?:g|i)',
+               r'.*\.git$', r'(?P<any>.)(?P<rest>.*)']
+    dispatcher = make_dispatcher(*regexes)
+    rng = random.Random(0)
+    for _ in range(1000):
+        arg = ''.join(
+            rng.choice('aZ9-x.git()') for _ in range(rng.randrange(6)))
+        assert dispatcher(arg) == sequential(regexes, arg), arg
+
+
+def test_dispatch():
+    assert dispatch_fixture.dispatch('abc') is _letters_handler
+    assert dispatch_fixture.dispatch('---') is dispatch_fixture.prototype
+
+
+def test_memo_is_bounded_and_forgotten_on_register(monkeypatch):
+    dispatcher = make_dispatcher(r'a')
+    monkeypatch.setattr(dispatcher, 'memo_size', 3)
+    for arg in ['a', 'b', 'c', 'd', 'a']:
+        dispatcher(arg)
+    assert list(dispatcher._memo) == ['c', 'd', 'a']
+    dispatcher.register(r'b', lambda arg: 'b')
+    assert dispatcher('b') == 'b'
@@ -0,0 +1,108 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import io
+import os
+import time
+from .. import resultcache
+from ..resultcache import ResultCache
+
+CHECKSUM = 'a' * 64
+
+
+def test_cache_hit_and_miss(tmp_path):
+    cache = ResultCache(tmp_path, ttl=60, max_entries=10)
+    assert cache.get(CHECKSUM, '25000') is None
+    cache.put(CHECKSUM, '25000', 1)
+    assert cache.get(CHECKSUM, '25000')['returncode'] == 1
+    # A new signature database invalidates the result.
+    assert cache.get(CHECKSUM, '25001') is None
+
+
+def test_cache_skips_errors_and_unknown_versions(tmp_path):
+    cache = ResultCache(tmp_path, ttl=60, max_entries=10)
+    cache.put(CHECKSUM, '25000', 2)
+    cache.put('b' * 64, None, 0)
+    assert cache.get(CHECKSUM, '25000') is None
+    assert cache.get('b' * 64, None) is None
+
+
+def test_cache_ttl(tmp_path):
+    cache = ResultCache(tmp_path, ttl=60, max_entries=10)
+    cache.put(CHECKSUM, '25000', 0)
+    cache.ttl = -1
+    assert cache.get(CHECKSUM, '25000') is None
+
+
+def test_cache_lru_eviction(tmp_path):
+    cache = ResultCache(tmp_path, ttl=60, max_entries=2, eviction='lru')
+    for n, checksum in enumerate(['a' * 64, 'b' * 64]):
+        cache.put(checksum, '25000', 0)
+        past = time.time() - 10 + n
+        os.utime(str(cache._entry_path(checksum, '25000')), (past, past))
+    assert cache.get('a' * 64, '25000') is not None
+    cache.put('c' * 64, '25000', 0)
+    assert cache.get('a' * 64, '25000') is not None
+    assert cache.get('b' * 64, '25000') is None
+
+
+def test_cache_fifo_eviction(tmp_path):
+    cache = ResultCache(tmp_path, ttl=60, max_entries=2, eviction='fifo')
+    for n, checksum in enumerate(['a' * 64, 'b' * 64]):
+        cache.put(checksum, '25000', 0)
+        past = time.time() - 10 + n
+        os.utime(str(cache._entry_path(checksum, '25000')), (past, past))
+    assert cache.get('a' * 64, '25000') is not None
+    cache.put('c' * 64, '25000', 0)
+    assert cache.get('a' * 64, '25000') is None
+    assert cache.get('b' * 64, '25000') is not None
+
+
+def test_logged_verdict(tmp_path):
+    out = io.StringIO()
+    resultcache.write_verdict(out, [0, 1, 0])
+    log = tmp_path / 'log.txt'
+    log.write_text("Scanning...\n" + out.getvalue() + "Done scanning.\n")
+    assert resultcache.logged_verdict(log) == 1
+
+    out = io.StringIO()
+    resultcache.write_verdict(out, [1, 2])
+    assert out.getvalue() == ''
+    log.write_text("Traceback (most recent call last):\n")
+    assert resultcache.logged_verdict(log) is None
+    assert resultcache.logged_verdict(tmp_path / 'missing.txt') is None
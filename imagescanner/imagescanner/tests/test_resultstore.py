@@ -0,0 +1,102 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import time
+from ..resultstore import ResultStore, infected_files
+
+CHECKSUM = 'a' * 64
+
+
+def record(store, checksum=CHECKSUM, returncode=0, **fields):
+    fields.setdefault('source', 'images.git')
+    store.record(filename='repo/a.img', checksum=checksum,
+                 returncode=returncode, **fields)
+
+
+def test_record_and_query(tmp_path):
+    store = ResultStore(tmp_path / 'results.sqlite3')
+    record(store, returncode=1, sigversion='26000', cached=True,
+           infected=[['/bin/sh', 'Eicar-Signature']], bytes=5000,
+           seconds={'scan': 1.5})
+    result, = store.query(10)[0]
+    assert result['verdict'] == 'infected'
+    assert result['cached'] is True
+    assert result['infected'] == [['/bin/sh', 'Eicar-Signature']]
+    assert result['seconds'] == {'scan': 1.5}
+    assert result['bytes'] == 5000
+    assert result['finished'] <= time.time()
+
+
+def test_query_filters(tmp_path):
+    store = ResultStore(tmp_path / 'results.sqlite3')
+    record(store, returncode=0)
+    record(store, checksum='b' * 64, returncode=1)
+    record(store, checksum='c' * 64, returncode=2, source='other.git')
+    assert [r['checksum'] for r in store.query(10, verdict='infected')[0]] \
+        == ['b' * 64]
+    assert [r['verdict'] for r in store.query(10, source='other.git')[0]] \
+        == ['error']
+    assert len(store.query(10, since=time.time() - 60)[0]) == 3
+    assert store.query(10, until=time.time() - 60)[0] == []
+
+
+def test_query_pages_newest_first(tmp_path):
+    store = ResultStore(tmp_path / 'results.sqlite3')
+    for n in range(5):
+        record(store, checksum=str(n) * 64)
+    seen = []
+    before = None
+    while True:
+        results, before = store.query(2, before)
+        seen.extend(result['checksum'][0] for result in results)
+        if before is None:
+            break
+    assert seen == ['4', '3', '2', '1', '0']
+
+
+def test_infected_files(tmp_path):
+    logfile = tmp_path / 'log.txt'
+    logfile.write_text(
+        "Scanning /mnt/etc\n"
+        "/mnt/bin/sh: Eicar-Signature FOUND\n"
+        "/mnt/a b: Win.Test.EICAR_HDB-1 FOUND\n"
+        "----------- SCAN SUMMARY -----------\n")
+    assert infected_files(logfile) == [
+        ['/mnt/bin/sh', 'Eicar-Signature'],
+        ['/mnt/a b', 'Win.Test.EICAR_HDB-1']]
+    assert infected_files(tmp_path / 'missing.txt') == []
@@ -0,0 +1,94 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import fakeredis
+import pytest
+from .. import config, routing
+
+GiB = 1024 * 1024 * 1024
+
+
+def test_size_class():
+    assert routing.size_class(200 * 1024 * 1024) == 'small'
+    assert routing.size_class(2 * GiB) == 'small'
+    assert routing.size_class(2 * GiB + 1) == 'medium'
+    assert routing.size_class(40 * GiB) == 'large'
+    assert routing.size_class(None) == config.SIZE_CLASS_UNKNOWN
+    assert routing.queue_name('small') == 'scans.small'
+
+
+def test_submitter():
+    scan = {'source': 'https://example.com/a.img'}
+    assert routing.submitter(scan) == 'host:example.com'
+    assert routing.submitter(dict(scan, recipients=['#b', '#a'])) \
+        == 'recipients:#a,#b'
+    assert routing.submitter(dict(
+        scan, jenkins_job_name='job', checklist_uuid='uuid')) \
+        == 'checklist:uuid'
+
+
+def test_submitters_take_turns():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    # One submitter queues a batch, then another a single request.
+    assert routing.queued([('large', 'a')] * 3, client) == [0, 1, 2]
+    assert routing.queued([('large', 'b'), ('small', 'a')], client) == [0, 0]
+    routing.started('scans.large', 'a', client)
+    assert routing.queued([('large', 'a')], client) == [2]
+    assert routing.queued([('large', 'a')] * 20, client)[-1] == 9
+    for _ in range(3):
+        routing.started('scans.small', 'a', client)
+    assert client.hgetall(routing.QUEUED_KEY.format('small')) == {}
+    # Requests from elsewhere are not counted.
+    routing.started('scans', 'b', client)
+    assert client.hget(routing.QUEUED_KEY.format('large'), 'b') == '1'
+
+
+def test_priority_queues():
+    assert routing.priority_queues('scans')[:2] == ['scans', 'scans:1']
+    assert len(routing.priority_queues('scans')) == 10
+
+
+def test_worker_pools():
+    weights = routing.parse_weights('small=2, medium=0 large=1')
+    assert weights == {'small': 2, 'medium': 0, 'large': 1}
+    assert routing.worker_pools(weights) == [
+        ('small', ['scans.small'], 2),
+        ('large', ['scans.large', 'scans.medium', 'scans.small', 'scans'], 1),
+        ]
+    with pytest.raises(ValueError):
+        routing.parse_weights('tiny=1')
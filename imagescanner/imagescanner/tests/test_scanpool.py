@@ -0,0 +1,98 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import sys
+import threading
+from ..scanpool import FileLock, ScanExecutor, SlotPool
+
+# A stand-in for imagescanner-image: report the leased slot, hold it for a
+# moment, and exit with the status named by the image.
+STUB_SCANNER = [sys.executable, '-c', '''if True:
+    import os, sys, time
+    print(os.environ['IMAGESCANNER_NBD_DEVICE'],
+          os.environ['IMAGESCANNER_MOUNTPOINT'])
+    time.sleep(0.2)
+    sys.exit(int(sys.argv[1]))
+''']
+
+
+def make_pool(tmp_path, count):
+    return SlotPool(
+        ['/dev/nbd%d' % n for n in range(count)],
+        tmp_path / 'mnt',
+        tmp_path / 'leases',
+        )
+
+
+def test_leases_are_exclusive(tmp_path):
+    pool = make_pool(tmp_path, 2)
+    with pool.lease() as first, pool.lease() as second:
+        assert first.nbd_device != second.nbd_device
+        assert first.mountpoint != second.mountpoint
+        assert first.mountpoint.is_dir()
+    with pool.lease() as third:
+        assert third.nbd_device == '/dev/nbd0'
+
+
+def test_executor_scans_concurrently(tmp_path):
+    logs = [tmp_path / ('scan%d.txt' % n) for n in range(4)]
+    with ScanExecutor(STUB_SCANNER, 2, make_pool(tmp_path, 2)) as executor:
+        futures = [executor.submit(str(n % 2), str(log))
+                   for n, log in enumerate(logs)]
+        assert [f.result() for f in futures] == [0, 1, 0, 1]
+    devices = [log.read_text().split()[0] for log in logs]
+    assert set(devices) == {'/dev/nbd0', '/dev/nbd1'}
+
+
+def test_file_lock_waits_for_holder(tmp_path):
+    first = FileLock(tmp_path / 'scan.lock')
+    second = FileLock(tmp_path / 'scan.lock')
+    first.acquire()
+    taken = threading.Event()
+
+    def take():
+        second.acquire()
+        taken.set()
+
+    thread = threading.Thread(target=take)
+    thread.start()
+    assert not taken.wait(0.2)
+    first.release()
+    assert taken.wait(5)
+    second.release()
+    thread.join()
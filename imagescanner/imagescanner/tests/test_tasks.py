@@ -0,0 +1,501 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import gzip
+import hashlib
+import os
+import pstats
+import sqlite3
+import subprocess
+import sys
+import threading
+import fakeredis
+import pytest
+from .. import (
+    coalesce, config, metrics, overlay, progress, redisconn, resultcache,
+    resultstore, scanpool, sessions, tasks,
+    )
+from .test_download import DATA, ImageHandler, ImageServer
+
+# A stand-in for imagescanner-image: record the image it was asked to scan,
+# and report it infected if its name says so, or fail like imagescanner-image
+# does when qemu-nbd does if STUB_SCANNER_BROKEN is set, or if it is an
+# overlay whose base.qcow2 is missing.
+STUB_SCANNER = [sys.executable, '-c', '''if True:
+    import os, sys
+    with open(os.environ['STUB_SCANNER_RECORD'], 'a') as fd:
+        print(os.path.basename(sys.argv[1]), file=fd)
+    print("scanned", sys.argv[1])
+    if 'infected' in sys.argv[1]:
+        print("/bin/sh: Eicar-Signature FOUND")
+        print("Scan verdict: infected")
+        sys.exit(1)
+    backing = os.path.join(os.path.dirname(sys.argv[1]), 'base.qcow2')
+    if 'overlay' in sys.argv[1] and not os.path.exists(backing):
+        print("qemu-nbd: Could not open backing file", backing)
+        sys.exit(1)
+    if os.environ.get('STUB_SCANNER_BROKEN'):
+        print("qemu-nbd: Failed to connect")
+        sys.exit(1)
+    print("Scan verdict: clean")
+''']
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    """Configure request_scan to scan with STUB_SCANNER, record
+    notifications instead of sending them, keep its files in tmp_path, and
+    its progress in a fake Redis.
+
+    """
+    record = tmp_path / 'scanned.txt'
+    record.touch()
+    monkeypatch.setenv('STUB_SCANNER_RECORD', str(record))
+    monkeypatch.setattr(config, 'SCANNER_COMMAND', STUB_SCANNER)
+    monkeypatch.setattr(config, 'SCAN_CONCURRENCY', 2)
+    monkeypatch.setattr(config, 'NBD_DEVICES', ['/dev/nbd0', '/dev/nbd1'])
+    monkeypatch.setattr(config, 'MOUNTPOINT_ROOT', tmp_path / 'mnt')
+    monkeypatch.setattr(config, 'LEASES_PATH', tmp_path / 'leases')
+    monkeypatch.setattr(config, 'LOGS_PATH', tmp_path / 'logs')
+    monkeypatch.setattr(redisconn, '_client', fakeredis.FakeRedis(
+        decode_responses=True))
+    monkeypatch.setattr(redisconn, '_pid', os.getpid())
+    monkeypatch.setattr(metrics, '_gauges', None)
+    monkeypatch.setattr(config, 'RESULT_CACHE_PATH', tmp_path / 'cache')
+    monkeypatch.setattr(
+        config, 'RESULT_STORE_PATH', tmp_path / 'logs' / 'results.sqlite3')
+    monkeypatch.setattr(
+        config, 'DOWNLOAD_PARTIALS_PATH', tmp_path / 'partials')
+    monkeypatch.setattr(config, 'GIT_MIRRORS_PATH', tmp_path / 'mirrors')
+    monkeypatch.setattr(resultcache, 'signature_version', lambda: '26000')
+    monkeypatch.setattr(sessions, '_sessions', {})
+    (tmp_path / 'logs').mkdir()
+
+    notifications = []
+    monkeypatch.setattr(
+        tasks.slack_notify, 'delay',
+        lambda **kwargs: notifications.append(kwargs))
+    monkeypatch.setattr(
+        tasks.jenkins_notify, 'delay',
+        lambda *args, **kwargs: notifications.append(kwargs))
+
+    class Worker(object):
+        def scanned(self):
+            return sorted(record.read_text().split())
+
+        def jobs(self):
+            return progress.recent_jobs(10)
+
+        def results(self, **filters):
+            return resultstore.get_store().query(10, **filters)[0]
+
+    worker = Worker()
+    worker.notifications = notifications
+    worker.logs = tmp_path / 'logs'
+    yield worker
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """Return the URL of a git repository holding three images, one of them
+    gzipped and one of them infected.
+
+    """
+    return make_repo(tmp_path, {
+        'images/clean.img': b'clean' * 1000,
+        'images/infected.qcow2': b'infected' * 1000,
+        'images/packed.img.gz': gzip.compress(b'packed' * 1000),
+        'README': b'not an image',
+        })
+
+
+def make_repo(tmp_path, files):
+    """Return the URL of a git repository holding files, a dict of their
+    contents by path.
+
+    """
+    work = tmp_path / 'work'
+    for name, data in files.items():
+        (work / name).parent.mkdir(parents=True, exist_ok=True)
+        (work / name).write_bytes(data)
+    git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+    subprocess.run(git + ['init', '-q', str(work)], check=True)
+    subprocess.run(git + ['-C', str(work), 'add', '.'], check=True)
+    subprocess.run(git + ['-C', str(work), 'commit', '-q', '-m', 'images'],
+                   check=True)
+    subprocess.run(git + ['clone', '-q', '--bare', str(work),
+                          str(tmp_path / 'images.git')], check=True)
+    return 'file://{}'.format(tmp_path / 'images.git')
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def by_filename(notifications):
+    return {n['filename']: n for n in notifications}
+
+
+def test_scan_repository(worker, repo):
+    tasks.request_scan(repo, None, ['#scans'])
+
+    assert worker.scanned() == ['clean.img', 'infected.qcow2', 'packed.img']
+    notifications = by_filename(worker.notifications)
+    assert sorted(notifications) == [
+        'repo/images/clean.img', 'repo/images/infected.qcow2',
+        'repo/images/packed.img.gz']
+    assert notifications['repo/images/clean.img']['status'] == 'Success'
+    assert notifications['repo/images/infected.qcow2']['status'] == 'Failure'
+
+    # The gzipped image is reported by the name and checksum of the file in
+    # the repository, and its log records both checksums.
+    packed = notifications['repo/images/packed.img.gz']
+    compressed = (
+        worker.logs.parent / 'work' / 'images' / 'packed.img.gz').read_bytes()
+    assert packed['checksum'] == sha256(compressed)
+    log = (worker.logs / 'SecurityValidation-{}.txt'.format(
+        packed['checksum'])).read_text()
+    assert sha256(b'packed' * 1000) in log
+    assert 'Signature version: 26000' in log
+    assert 'scanned' in log
+
+    job, = worker.jobs()
+    assert job['state'] == 'done'
+    assert job['source'] == repo
+    stages = [event['stage'] for event in job['events']]
+    assert stages[0] == 'start' and stages[-1] == 'done'
+    assert stages.count('scan') == 3
+    processed = job['events'][-2]
+    assert processed['stage'] == 'processed'
+    assert processed['seconds']['retrieve'] > 0
+
+    results = {result['filename']: result for result in worker.results()}
+    assert sorted(results) == sorted(notifications)
+    infected = results['repo/images/infected.qcow2']
+    assert infected['verdict'] == 'infected'
+    assert infected['infected'] == [['/bin/sh', 'Eicar-Signature']]
+    assert infected['job_id'] == job['job_id']
+    assert not infected['cached']
+    assert infected['seconds']['scan'] > 0
+    assert results['repo/images/packed.img.gz']['image_checksum'] == sha256(
+        b'packed' * 1000)
+    assert results['repo/images/clean.img']['bytes'] == 5000
+
+    text = metrics.render()
+    assert 'imagescanner_stage_seconds_count{stage="scan"} 3\n' in text
+    assert 'imagescanner_stage_seconds_count{stage="decompress"} 1\n' in text
+    assert ('imagescanner_stage_bytes_total{stage="retrieve"} 19000\n'
+            in text)
+    assert ('imagescanner_cache_lookups_total{cache="result",result="miss"}'
+            ' 3\n' in text)
+    assert 'imagescanner_scans_in_flight 0\n' in text
+
+
+def test_scans_finish_while_waiting_for_disk_budget(worker, repo,
+                                                    monkeypatch):
+    # No two of the images fit the budget together, so the prefetcher waits
+    # for each scan to finish before retrieving the next image, while slots
+    # are free for more.
+    monkeypatch.setattr(config, 'PREFETCH_DISK_BUDGET', 6000)
+    monkeypatch.setattr(config, 'SCAN_CONCURRENCY', 3)
+    monkeypatch.setattr(
+        config, 'NBD_DEVICES', ['/dev/nbd0', '/dev/nbd1', '/dev/nbd2'])
+    thread = threading.Thread(target=tasks.request_scan,
+                              args=(repo, None, ['#scans']), daemon=True)
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive()
+
+    assert worker.scanned() == ['clean.img', 'infected.qcow2', 'packed.img']
+    assert len(worker.notifications) == 3
+
+
+def test_cached_results_skip_the_scanner(worker, repo):
+    tasks.request_scan(repo, None, ['#scans'])
+    first = by_filename(worker.notifications)
+    worker.notifications.clear()
+    scanned = worker.scanned()
+
+    tasks.request_scan(repo, 'images/infected.qcow2', ['#scans'])
+
+    assert worker.scanned() == scanned
+    notification, = worker.notifications
+    assert notification == first['repo/images/infected.qcow2']
+    second, first = worker.jobs()
+    assert second['path'] == 'images/infected.qcow2'
+    cached, = [event for event in second['events']
+               if event['stage'] == 'cached']
+    assert cached['returncode'] == 1
+    result, = worker.results(job_id=second['job_id'])
+    assert result['cached'] and result['verdict'] == 'infected'
+    assert result['infected'] == [['/bin/sh', 'Eicar-Signature']]
+
+
+def test_failed_scans_are_not_cached(worker, repo, monkeypatch):
+    monkeypatch.setenv('STUB_SCANNER_BROKEN', '1')
+    tasks.request_scan(repo, 'images/clean.img', ['#scans'])
+    notification, = worker.notifications
+    assert notification['status'] == 'Failure'
+    assert resultcache.get_cache().get(
+        notification['checksum'], '26000') is None
+
+    monkeypatch.delenv('STUB_SCANNER_BROKEN')
+    worker.notifications.clear()
+    tasks.request_scan(repo, 'images/clean.img', ['#scans'])
+    assert worker.scanned() == ['clean.img', 'clean.img']
+    notification, = worker.notifications
+    assert notification['status'] == 'Success'
+    assert resultcache.get_cache().get(
+        notification['checksum'], '26000')['returncode'] == 0
+
+
+def test_overlay_keeps_its_base(worker, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'SCAN_CONCURRENCY', 1)
+    base = overlay.QCOW2_MAGIC + b'base' * 1000
+    repo = make_repo(tmp_path, {
+        'images/base.qcow2': base,
+        'images/overlay.qcow2': overlay.QCOW2_MAGIC + b'overlay' * 1000,
+        })
+    tasks.request_scan(repo, None, ['#scans'])
+
+    assert worker.scanned() == ['base.qcow2', 'overlay.qcow2']
+    notifications = by_filename(worker.notifications)
+    assert notifications['repo/images/base.qcow2']['status'] == 'Success'
+    assert notifications['repo/images/overlay.qcow2']['status'] == 'Success'
+
+
+def test_job_waits_for_another_scanning_the_same_image(worker, repo):
+    checksum = sha256(b'clean' * 1000)
+    logfile = worker.logs / 'SecurityValidation-{}.txt'.format(checksum)
+    # Another job is scanning the image.
+    other = scanpool.FileLock(logfile.with_suffix('.lock'))
+    other.acquire()
+    thread = threading.Thread(target=tasks.request_scan,
+                              args=(repo, 'images/clean.img', ['#scans']))
+    thread.start()
+    thread.join(0.5)
+    assert thread.is_alive()
+    assert not worker.notifications
+
+    # Which finishes, finding the image infected.
+    logfile.write_text('scanned by another job')
+    resultcache.get_cache().put(checksum, '26000', 1)
+    other.release()
+    thread.join()
+
+    assert worker.scanned() == []
+    notification, = worker.notifications
+    assert notification['status'] == 'Failure'
+    assert logfile.read_text() == 'scanned by another job'
+
+
+def test_profiled_scan(worker, repo):
+    tasks.request_scan(repo, None, ['#scans'], profile=True)
+
+    job, = worker.jobs()
+    profiled, = [e for e in job['events'] if e['stage'] == 'profiled']
+    report = (worker.logs / profiled['profile']).read_text()
+    assert profiled['profile'] == 'Profile-{}.txt'.format(job['job_id'])
+    for stage in ('retrieve', 'checksum', 'scan'):
+        assert ' {} '.format(stage) in report
+    # Functions run in the prefetcher's and the scanner's threads.
+    stats = pstats.Stats(
+        str(worker.logs / 'Profile-{}.pstats'.format(job['job_id'])))
+    assert {'checkout', '_scan'} <= {name for _, _, name in stats.stats}
+    for notification in worker.notifications:
+        log = (worker.logs / 'SecurityValidation-{}.txt'.format(
+            notification['checksum'])).read_text()
+        assert 'Profile of the job: ' + profiled['profile'] in log
+
+    # Other jobs are not profiled.
+    tasks.request_scan(repo, 'images/clean.img', ['#scans'])
+    assert len(list(worker.logs.glob('Profile-*.txt'))) == 1
+
+
+def test_jenkins_notification(worker, repo):
+    tasks.request_scan(repo, 'images/infected.qcow2',
+                       jenkins_job_name='job', checklist_uuid='uuid')
+    notification, = worker.notifications
+    assert notification['status'] == 1
+    assert notification['checklist_uuid'] == 'uuid'
+
+
+def test_duplicate_request_attaches_to_running_job(worker, repo):
+    coalesce.claim(coalesce.source_key(repo + ' ', '/'), 'owner', {})
+
+    tasks.request_scan(repo, None, ['#late'])
+
+    assert worker.scanned() == []
+    assert worker.notifications == []
+    attached, = worker.jobs()
+    assert attached['coalesced_into'] == 'owner'
+    assert attached['state'] == 'running'
+    attachment, = coalesce.release(coalesce.source_key(repo, None), 'owner')
+    assert attachment['recipients'] == ['#late']
+    assert attachment['job_id'] == attached['job_id']
+
+
+def test_running_job_notifies_attached_jobs(worker, repo, monkeypatch):
+    claim = coalesce.claim
+    clean = coalesce.checksum_key(sha256(b'clean' * 1000))
+
+    def claim_and_attach(key, job_id, attachment):
+        owner = claim(key, job_id, attachment)
+        # Other jobs ask for the same source, and the same image, while the
+        # job is retrieving them.
+        if key.startswith('source:'):
+            assert claim(key, 'late', dict(
+                attachment, job_id='late', recipients=['#late'])) == job_id
+        elif key == clean:
+            assert claim(key, 'other', dict(
+                attachment, job_id='other', source='https://x/clean.img',
+                filename='clean.img', recipients=['#other'])) == job_id
+        return owner
+
+    monkeypatch.setattr(coalesce, 'claim', claim_and_attach)
+    tasks.request_scan(repo, None, ['#scans'])
+
+    assert worker.scanned() == ['clean.img', 'infected.qcow2', 'packed.img']
+    recipients = {}
+    for notification in worker.notifications:
+        recipients.setdefault(notification['recipients'][0], []).append(
+            (notification['filename'], notification['status']))
+    assert sorted(recipients['#late']) == sorted(recipients['#scans'])
+    assert len(recipients['#late']) == 3
+    assert recipients['#other'] == [('clean.img', 'Success')]
+    late = progress.get_job('late')
+    assert late['state'] == 'done'
+    assert [e['stage'] for e in late['events']].count('notify') == 3
+    assert coalesce.release(clean, 'owner') == []
+
+
+def test_failed_job_hands_on_attached_jobs(worker, repo, monkeypatch):
+    claim = coalesce.claim
+    clean = coalesce.checksum_key(sha256(b'clean' * 1000))
+
+    def claim_and_attach(key, job_id, attachment):
+        owner = claim(key, job_id, attachment)
+        if key.startswith('source:'):
+            claim(key, 'late', dict(
+                attachment, job_id='late', recipients=['#late']))
+        elif key == clean:
+            claim(key, 'other', dict(
+                attachment, job_id='other', recipients=['#other']))
+        return owner
+
+    def record(**kwargs):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    submitted = []
+    monkeypatch.setattr(coalesce, 'claim', claim_and_attach)
+    monkeypatch.setattr(resultstore, 'record', record)
+    monkeypatch.setattr(
+        tasks, 'submit_scans',
+        lambda scans, job_ids: submitted.extend(zip(job_ids, scans)))
+    with pytest.raises(sqlite3.OperationalError):
+        tasks.request_scan(repo, None, ['#scans'])
+
+    # The job attached to the request does it itself.
+    (job_id, scan), = submitted
+    assert job_id == 'late'
+    assert scan == dict(source=repo, path=None, recipients=['#late'],
+                        jenkins_job_name=None, checklist_uuid=None)
+    # The job attached to the scan of an image hears that it failed.
+    notification, = worker.notifications
+    assert notification['recipients'] == ['#other']
+    assert notification['filename'] == 'repo/images/clean.img'
+    assert notification['status'] == 'Failure'
+    assert progress.get_job('other')['state'] == 'failed'
+
+
+@pytest.fixture
+def server():
+    httpd = ImageServer(('127.0.0.1', 0), ImageHandler)
+    httpd.ignore_range = False
+    httpd.drop_at = []
+    httpd.requested = []
+    httpd.lock = threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize('segmented', [True, False])
+def test_scan_download(worker, server, monkeypatch, segmented):
+    if segmented:
+        monkeypatch.setattr(config, 'DOWNLOAD_SEGMENT_SIZE', 64 * 1024)
+        server.drop_at = [100000]
+    url = 'http://127.0.0.1:{}/infected.img'.format(server.server_port)
+
+    tasks.request_scan(url, None, ['#scans'])
+
+    assert worker.scanned() == ['infected.img']
+    notification, = worker.notifications
+    assert notification['filename'] == 'infected.img'
+    assert notification['checksum'] == sha256(DATA)
+    assert notification['status'] == 'Failure'
+    job, = worker.jobs()
+    retrieved, = [event for event in job['events']
+                  if event['stage'] == 'retrieved']
+    assert retrieved['bytes'] == len(DATA)
+    if segmented:
+        # The segments, and the probe before them, reused pooled
+        # connections, and the finished download left no partial behind.
+        processed = job['events'][-2]
+        assert processed['http_requests'] == len(server.requested) + 1 > 16
+        # One more for the dropped connection.
+        assert (processed['http_connections']
+                <= config.DOWNLOAD_CONNECTIONS + 1)
+        assert all(name.endswith('.lock') for name in
+                   os.listdir(str(config.DOWNLOAD_PARTIALS_PATH)))
+    else:
+        assert server.requested == [0]
+
+
+def test_estimate_size(worker, repo, server):
+    url = 'http://127.0.0.1:{}/infected.img'.format(server.server_port)
+    assert tasks.estimate_size(url, None) == len(DATA)
+    assert tasks.estimate_size('ftp://example.com/a.img', None) is None
+
+    # A repository's images are sized by their last scan.
+    assert tasks.estimate_size(repo, None) is None
+    tasks.request_scan(repo, None, ['#scans'])
+    assert tasks.estimate_size(repo, 'images/clean.img') == 5000
+    assert tasks.estimate_size(repo, None) == 5000 + 8000 + 6000
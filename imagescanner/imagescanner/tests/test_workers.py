@@ -0,0 +1,94 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+import json
+import time
+import fakeredis
+import pytest
+from .. import config, workers
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(workers, 'get_redis', lambda: client)
+    return client
+
+
+class FakeRequest(object):
+    def __init__(self, task_id, args):
+        self.task_id = task_id
+        self.args = args
+
+    def info(self, safe=False):
+        return {'id': self.task_id, 'args': self.args}
+
+
+def test_heartbeat_records_tasks(client, monkeypatch):
+    monkeypatch.setattr(workers.state, 'active_requests',
+                        {FakeRequest('a', ['repo.git', None])})
+    monkeypatch.setattr(workers.state, 'reserved_requests', set())
+    heartbeat = workers.Heartbeat('celery@node1', 0.01)
+    heartbeat.start()
+    deadline = time.monotonic() + 5
+    while not client.hexists(workers.WORKERS_KEY, 'celery@node1'):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    worker, = workers.snapshot()
+    assert worker['hostname'] == 'celery@node1'
+    assert worker['active'] == [{'id': 'a', 'args': ['repo.git', None]}]
+    assert worker['reserved'] == []
+    assert not worker['stale']
+
+    heartbeat.stop()
+    assert workers.snapshot() == []
+
+
+def test_stale_and_forgotten_workers(client):
+    now = time.time()
+    ages = [('fresh', 1), ('stale', config.WORKER_STALE_AFTER + 1),
+            ('gone', config.WORKER_FORGET_AFTER + 1)]
+    for hostname, age in ages:
+        client.hset(workers.WORKERS_KEY, hostname, json.dumps({
+            'hostname': hostname, 'time': now - age,
+            'active': [], 'reserved': []}))
+    snapshot = workers.snapshot()
+    assert [(w['hostname'], w['stale']) for w in snapshot] == [
+        ('fresh', False), ('stale', True)]
+    assert not client.hexists(workers.WORKERS_KEY, 'gone')
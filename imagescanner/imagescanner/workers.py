@@ -0,0 +1,151 @@
+# ============LICENSE_START=======================================================
+# org.onap.vvp/image-scanner
+# ===================================================================
+# Copyright © 2017 AT&T Intellectual Property. All rights reserved.
+# ===================================================================
+#
+# Unless otherwise specified, all software contained herein is licensed
+# under the Apache License, Version 2.0 (the “License”);
+# you may not use this software except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+#
+#
+# Unless otherwise specified, all documentation contained herein is licensed
+# under the Creative Commons License, Attribution 4.0 Intl. (the “License”);
+# you may not use this documentation except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#             https://creativecommons.org/licenses/by/4.0/
+#
+# Unless required by applicable law or agreed to in writing, documentation
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ============LICENSE_END============================================
+#
+# ECOMP is a trademark and service mark of AT&T Intellectual Property.
+#
+"""A registry of worker heartbeats in Redis, so that the frontend can show
+what every worker is doing without broadcasting an inspect request to all of
+them and waiting for their replies.
+
+Each worker's main process writes, every config.WORKER_HEARTBEAT_INTERVAL
+seconds, the tasks it is executing and has reserved into the hash
+imagescanner:workers, keyed by its hostname. snapshot() reads them all in one
+request, flagging as stale any worker not heard from for
+config.WORKER_STALE_AFTER seconds, and forgetting any not heard from for
+config.WORKER_FORGET_AFTER seconds.
+
+"""
+import json
+import sys
+import threading
+import time
+import redis
+from celery.signals import worker_ready, worker_shutdown
+from celery.worker import state
+from . import config, routing
+from .redisconn import get_redis
+
+WORKERS_KEY = 'imagescanner:workers'
+
+
+class Heartbeat(object):
+    """A thread recording this worker's state every interval seconds."""
+
+    def __init__(self, hostname, interval):
+        self.hostname = hostname
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name='heartbeat', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        try:
+            get_redis().hdel(WORKERS_KEY, self.hostname)
+        except redis.RedisError:
+            pass
+
+    def beat(self):
+        get_redis().hset(WORKERS_KEY, self.hostname, json.dumps({
+            'hostname': self.hostname,
+            'time': time.time(),
+            'active': [
+                request.info(safe=True)
+                for request in list(state.active_requests)],
+            'reserved': [
+                request.info(safe=True)
+                for request in list(state.reserved_requests)],
+            }))
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                self.beat()
+            except redis.RedisError as e:
+                print("Cannot record heartbeat: {}".format(e),
+                      file=sys.stderr)
+            self.stopped.wait(self.interval)
+
+
+_heartbeat = None
+
+
+@worker_ready.connect
+def _start_heartbeat(sender, **kwargs):
+    global _heartbeat
+    _heartbeat = Heartbeat(sender.hostname, config.WORKER_HEARTBEAT_INTERVAL)
+    _heartbeat.start()
+
+
+@worker_shutdown.connect
+def _stop_heartbeat(sender, **kwargs):
+    if _heartbeat is not None:
+        _heartbeat.stop()
+
+
+def snapshot(client=None):
+    """Return the last recorded state of each worker, sorted by hostname, with
+    how many seconds ago it was recorded as 'age', and whether that is too
+    long ago to be trusted as 'stale'.
+
+    """
+    client = client or get_redis()
+    now = time.time()
+    workers = []
+    for hostname, value in sorted(client.hgetall(WORKERS_KEY).items()):
+        worker = json.loads(value)
+        worker['age'] = max(0.0, now - worker['time'])
+        if worker['age'] > config.WORKER_FORGET_AFTER:
+            client.hdel(WORKERS_KEY, hostname)
+            continue
+        worker['stale'] = worker['age'] > config.WORKER_STALE_AFTER
+        workers.append(worker)
+    return workers
+
+
+def queue_length(queue, client=None):
+    """Return how many messages wait in the named queue on the broker, at
+    every priority.
+
+    """
+    pipe = (client or get_redis()).pipeline(transaction=False)
+    for name in routing.priority_queues(queue):
+        pipe.llen(name)
+    return sum(pipe.execute())